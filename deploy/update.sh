@@ -3,6 +3,7 @@ set -euo pipefail
 
 APP_DIR="/opt/excel_webdatamerger"
 SERVICE_NAME="excel_webdatamerger.service"
+WORKER_SERVICE_NAME="excel_webdatamerger-worker.service"
 SERVICE_USER="www-data"
 UPLOAD_ROOT="/tmp/excel_webdatamerger"
 LOG_DIR="$APP_DIR/logs"
@@ -31,4 +32,11 @@ chown "$SERVICE_USER:$SERVICE_USER" "$UPLOAD_ROOT" "$LOG_DIR"
 echo ">>> Restarting service: $SERVICE_NAME"
 systemctl restart "$SERVICE_NAME"
 
+# Optional merge worker daemon (MERGER_MERGE_EXECUTOR=queue). Tasks it was
+# running are re-queued once their lease expires.
+if systemctl list-unit-files "$WORKER_SERVICE_NAME" --no-legend | grep -q .; then
+  echo ">>> Restarting service: $WORKER_SERVICE_NAME"
+  systemctl restart "$WORKER_SERVICE_NAME"
+fi
+
 echo ">>> Done"
@@ -2,6 +2,7 @@
 列名映射配置管理模块
 支持用户自定义列名映射规则，并可保存/加载配置
 """
+import hashlib
 import json
 import logging
 import os
@@ -109,6 +110,16 @@ class ConfigManager:
         """获取当前的映射规则"""
         return self.mappings.copy()
 
+    def mapping_version(self) -> str:
+        """
+        当前映射规则的指纹，规则变化时随之改变（用于判断合并结果能否复用）
+
+        Returns:
+            映射规则内容的 SHA-256 十六进制摘要
+        """
+        payload = json.dumps(self.mappings, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
     def reset_to_default(self) -> None:
         """重置为默认映射规则"""
         self.mappings = self.DEFAULT_MAPPINGS.copy()
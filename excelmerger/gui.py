@@ -14,12 +14,11 @@ import tkinter as tk
 from datetime import datetime
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 
-import pandas as pd
-
 from .config_manager import ConfigManager
-from .io_utils import read_file, save_file
+from .io_utils import apply_dtype_backend, read_file, resolve_dtype_backend, save_file
 from .logger import setup_logger
-from .merger import ExcelMergerCore
+from .merger import ExcelMergerCore, concat_aligned
+from .progress import MergeProgress
 
 logger = setup_logger("ExcelMergerGUI")
 
@@ -60,6 +59,7 @@ class ExcelMergerGUI:
         self.smart_dedup = tk.BooleanVar(value=False)  # 新增：智能去重
         self.dedup_keys = tk.StringVar(value="")  # 新增：去重关键字段
         self.output_format = tk.StringVar(value="xlsx")  # 新增：输出格式（xlsx或csv）
+        self.use_arrow_backend = tk.BooleanVar(value=False)  # 新增：Arrow 内存模式
 
         # 列选择相关
         self.all_columns_info = {}  # 存储列信息：{列名: {'mapped': 映射后名称, 'sources': [来源文件]}}
@@ -79,6 +79,10 @@ class ExcelMergerGUI:
     def _set_progress(self, value):
         self._on_ui_thread(self.progress_var.set, value)
 
+    def _on_merge_progress(self, snapshot):
+        """MergeProgress 回调：按实际处理进度更新进度条"""
+        self._set_progress(snapshot["percent"])
+
     def _show_message(self, level, title, message):
         dialog = getattr(messagebox, level)
         self._on_ui_thread(dialog, title, message)
@@ -151,6 +155,10 @@ class ExcelMergerGUI:
                       variable=self.smart_dedup,
                       bg="#1a1a1a", fg="#FFFFFF", selectcolor="#404040",
                       activebackground="#1a1a1a", activeforeground="#FFFFFF").pack(side=tk.LEFT, padx=10)
+        tk.Checkbutton(row2, text="Arrow 内存模式（需 pyarrow）",
+                      variable=self.use_arrow_backend,
+                      bg="#1a1a1a", fg="#FFFFFF", selectcolor="#404040",
+                      activebackground="#1a1a1a", activeforeground="#FFFFFF").pack(side=tk.LEFT, padx=10)
 
         # 第三行：去重关键字段输入
         row3 = tk.Frame(opt_frame, bg="#1a1a1a")
@@ -369,16 +377,24 @@ class ExcelMergerGUI:
     def start_merge(self, output, selected_format):
         # 使用配置管理器创建合并核心
         merger = ExcelMergerCore(self.config_manager)
+        dtype_backend = resolve_dtype_backend(
+            "arrow" if self.use_arrow_backend.get() else "numpy"
+        )
         all_dfs = []
         total_mapping_report = {}  # 收集所有文件的列名映射报告
+        progress = MergeProgress(
+            len(self.file_paths), callback=self._on_merge_progress, min_interval=0.1
+        )
 
         # 第一阶段：读取文件
         for i, f in enumerate(self.file_paths):
             try:
                 self._set_status(f"读取文件: {os.path.basename(f)} ({i+1}/{len(self.file_paths)})")
-                self._set_progress((i+1) / len(self.file_paths) * 40)
+                progress.start_file(os.path.basename(f))
 
-                sheets = read_file(f)
+                sheets = read_file(f, dtype_backend=dtype_backend)
+                progress.set_phase("normalize")
+                file_rows = 0
                 for name, df in sheets.items():
                     if df.empty:
                         self.log(f"⚠️ 跳过空表: {os.path.basename(f)} - {name}")
@@ -405,6 +421,7 @@ class ExcelMergerGUI:
                     filename_without_ext = os.path.splitext(os.path.basename(f))[0]
                     df.insert(0, "来源文件", filename_without_ext)
                     df.insert(1, "工作表", name)
+                    df = apply_dtype_backend(df, dtype_backend)
 
                     # 应用列删除过滤
                     if self.excluded_columns:
@@ -422,13 +439,16 @@ class ExcelMergerGUI:
                             df = df[cols_to_keep]
 
                     all_dfs.append(df)
+                    file_rows += len(df)
 
                     # 记录统计信息
                     stats = merger.get_summary_stats(df)
                     self.log(f"✅ {os.path.basename(f)} - {name} | {stats}")
 
+                progress.file_done(file_rows)
             except Exception as e:
                 self.log(f"⚠️ 文件跳过: {os.path.basename(f)} ({e})")
+                progress.file_done()
                 continue
 
         if not all_dfs:
@@ -451,9 +471,9 @@ class ExcelMergerGUI:
 
         # 第二阶段：合并数据
         self._set_status("正在合并数据...")
-        self._set_progress(50)
+        progress.set_phase("concat")
 
-        merged = pd.concat(all_dfs, join="outer", ignore_index=True, sort=False)
+        merged = concat_aligned(all_dfs)
         self.log(f"📊 合并完成 | 总计 {len(merged)} 行 × {len(merged.columns)} 列")
 
         # 第三阶段：去重处理
@@ -463,7 +483,7 @@ class ExcelMergerGUI:
             # 智能去重（基于关键字段）
             key_cols = [k.strip() for k in self.dedup_keys.get().split(",")]
             self._set_status(f"智能去重中（关键字段: {key_cols}）...")
-            self._set_progress(70)
+            progress.set_phase("dedup")
             merged = merger.deduplicate_smart(merged, key_columns=key_cols)
             removed = original_count - len(merged)
             if removed > 0:
@@ -471,7 +491,7 @@ class ExcelMergerGUI:
         elif self.remove_duplicates.get():
             # 全行去重
             self._set_status("删除重复行...")
-            self._set_progress(70)
+            progress.set_phase("dedup")
             merged = merger.deduplicate_smart(merged)
             removed = original_count - len(merged)
             if removed > 0:
@@ -479,16 +499,17 @@ class ExcelMergerGUI:
 
         # 第四阶段：数据质量报告
         self._set_status("生成数据质量报告...")
-        self._set_progress(85)
+        progress.set_phase("validate")
         quality_report = merger.validate_data(merged)
         self._show_quality_report(quality_report)
 
         # 第五阶段：保存文件
         self._set_status("正在保存结果...")
-        self._set_progress(90)
+        progress.set_phase("write")
         save_file(merged, output, file_format=selected_format)
 
-        self._set_progress(100)
+        progress.set_bytes_written(os.path.getsize(output))
+        progress.finish()
         self._set_status("合并完成 ✅")
         self.log(f"💾 合并完成，文件已保存至: {output}")
 
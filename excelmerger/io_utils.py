@@ -1,18 +1,66 @@
+import codecs
+import csv
 import os
 
 import pandas as pd
 
+# 可选的 dtype 后端：numpy 为 pandas 默认，arrow 使用 pyarrow 列存储（字符串列更省内存）
+DTYPE_BACKENDS = {"numpy": None, "arrow": "pyarrow"}
 
-def read_file(file_path):
+
+def resolve_dtype_backend(name=None):
+    """
+    将配置中的后端名称转换为 pandas 的 dtype_backend 参数
+
+    Args:
+        name: 'numpy'、'arrow' 或 None
+
+    Returns:
+        None（默认后端）或 'pyarrow'
+    """
+    key = (name or "numpy").strip().lower()
+    if key not in DTYPE_BACKENDS:
+        raise ValueError(f"不支持的 dtype 后端: {name}")
+    backend = DTYPE_BACKENDS[key]
+    if backend == "pyarrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("Arrow 模式需要安装 pyarrow（pip install pyarrow）") from e
+    return backend
+
+
+def apply_dtype_backend(df, dtype_backend=None):
+    """
+    把数据框中剩余的 object/str 列转换为指定后端（如插入的来源列）
+
+    Args:
+        df: 数据框
+        dtype_backend: None 或 'pyarrow'
+    """
+    if dtype_backend is None:
+        return df
+    return df.convert_dtypes(dtype_backend=dtype_backend)
+
+
+def read_file(file_path, dtype_backend=None, reader_info=None):
     """
     智能读取 Excel / CSV / TXT 文件。
     自动识别文件类型、编码和读取引擎。
+    dtype_backend 为 'pyarrow' 时返回 Arrow 列存储的数据框。
+    传入字典 reader_info 时，会写入实际使用的读取引擎（及文本编码）。
     """
     ext = os.path.splitext(file_path)[1].lower()
+    backend_kwargs = {"dtype_backend": dtype_backend} if dtype_backend else {}
+    if reader_info is None:
+        reader_info = {}
 
     if ext == ".xlsx":
+        reader_info["engine"] = "openpyxl"
         try:
-            return pd.read_excel(file_path, sheet_name=None, engine="openpyxl")
+            return pd.read_excel(
+                file_path, sheet_name=None, engine="openpyxl", **backend_kwargs
+            )
         except Exception as e:
             raise RuntimeError(f"Excel 文件读取失败: {file_path} ({e})") from e
 
@@ -21,7 +69,11 @@ def read_file(file_path):
         last_error = None
         for engine in engines:
             try:
-                return pd.read_excel(file_path, sheet_name=None, engine=engine)
+                sheets = pd.read_excel(
+                    file_path, sheet_name=None, engine=engine, **backend_kwargs
+                )
+                reader_info["engine"] = engine
+                return sheets
             except Exception as e:
                 last_error = e
         raise RuntimeError(
@@ -33,7 +85,10 @@ def read_file(file_path):
         encodings = ["utf-8-sig", "utf-8", "gbk", "latin1"]
         for enc in encodings:
             try:
-                df = pd.read_csv(file_path, sep=None, engine="python", encoding=enc)
+                df = pd.read_csv(
+                    file_path, sep=None, engine="python", encoding=enc, **backend_kwargs
+                )
+                reader_info.update(engine="python", encoding=enc)
                 return {os.path.basename(file_path): df}
             except Exception:
                 continue
@@ -76,3 +131,309 @@ def save_file(df, output_path, file_format="xlsx"):
     else:
         # 默认保存为Excel格式
         df.to_excel(output_path, index=False, engine="openpyxl")
+
+
+def _detect_text_encoding(file_path, encodings=("utf-8-sig", "utf-8", "gbk", "latin1")):
+    """按块解码整个文件，返回第一个能完整解码的编码（不把文件读入内存）"""
+    for enc in encodings:
+        decoder = codecs.getincrementaldecoder(enc)()
+        try:
+            with open(file_path, "rb") as fh:
+                for block in iter(lambda: fh.read(1024 * 1024), b""):
+                    decoder.decode(block)
+                decoder.decode(b"", final=True)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    raise RuntimeError(f"无法识别 CSV/TXT 文件编码: {file_path}")
+
+
+def _excel_header_names(header):
+    """生成与 pandas.read_excel 一致的列名（空列名 -> Unnamed: i，重复列名 -> name.1）"""
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or value == "" else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _iter_xlsx_chunks(file_path, chunksize):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = _excel_header_names(header)
+            batch = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                batch.append(row[:len(columns)])
+                if len(batch) >= chunksize:
+                    yield worksheet.title, pd.DataFrame(batch, columns=columns).infer_objects()
+                    batch = []
+            if batch:
+                yield worksheet.title, pd.DataFrame(batch, columns=columns).infer_objects()
+    finally:
+        workbook.close()
+
+
+def _sniff_csv_separator(file_path, encoding):
+    """
+    与 pandas python 引擎的 sep=None 相同：按第一个非空行嗅探分隔符。
+    分隔符确定后可改用快得多的 C 引擎，解析结果不变；无法嗅探时返回 None。
+    """
+    with open(file_path, encoding=encoding, newline="") as fh:
+        for line in fh:
+            if line.strip():
+                try:
+                    return csv.Sniffer().sniff(line).delimiter
+                except csv.Error:
+                    return None
+    return None
+
+
+def _csv_column_dtypes(file_path, encoding, chunksize, read_kwargs):
+    """
+    第一遍分块读取 CSV，确定与整表读取（read_file）一致的列类型。
+    每块单独推断类型时，结果取决于块边界（如前导零编码在纯数字块中被读成整数），
+    因此各块推断不一致的列统一指定：整数与浮点混合的列读为浮点，其余按字符串读取。
+    只用于统计各块的类型，分隔符已知时使用 C 引擎，开销远小于正式读取。
+
+    Returns:
+        {列名: dtype}，只包含需要指定类型的列
+    """
+    kinds = {}
+    reader = pd.read_csv(file_path, encoding=encoding, chunksize=chunksize, **read_kwargs)
+    with reader:
+        for chunk in reader:
+            for col, dtype in chunk.dtypes.items():
+                kinds.setdefault(col, set()).add(dtype.kind)
+    dtypes = {}
+    for col, col_kinds in kinds.items():
+        if len(col_kinds) == 1:
+            continue
+        dtypes[col] = "float64" if col_kinds <= {"i", "u", "f"} else str
+    return dtypes
+
+
+def iter_file_chunks(file_path, chunksize=50000, dtype_backend=None, reader_info=None):
+    """
+    分块读取 Excel / CSV / TXT 文件，内存占用与块大小而非文件大小相关。
+
+    Args:
+        file_path: 文件路径
+        chunksize: 每块行数
+        dtype_backend: None 或 'pyarrow'
+        reader_info: 可选字典，写入实际使用的读取引擎（及文本编码）
+
+    Yields:
+        (工作表名, 数据块) 元组；CSV/TXT 的工作表名为文件名
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if reader_info is None:
+        reader_info = {}
+
+    if ext == ".xlsx":
+        reader_info["engine"] = "openpyxl-read-only"
+        try:
+            for sheet_name, chunk in _iter_xlsx_chunks(file_path, chunksize):
+                yield sheet_name, apply_dtype_backend(chunk, dtype_backend)
+        except Exception as e:
+            raise RuntimeError(f"Excel 文件读取失败: {file_path} ({e})") from e
+        return
+
+    if ext in [".csv", ".txt"]:
+        encoding = _detect_text_encoding(file_path)
+        sep = _sniff_csv_separator(file_path, encoding)
+        if sep is None:
+            read_kwargs = {"sep": None, "engine": "python"}
+        else:
+            read_kwargs = {"sep": sep, "engine": "c"}
+        reader_info.update(engine=read_kwargs["engine"], encoding=encoding)
+        backend_kwargs = {"dtype_backend": dtype_backend} if dtype_backend else {}
+        dtypes = _csv_column_dtypes(file_path, encoding, chunksize, read_kwargs)
+        reader = pd.read_csv(
+            file_path,
+            encoding=encoding,
+            chunksize=chunksize,
+            dtype=dtypes or None,
+            **read_kwargs,
+            **backend_kwargs,
+        )
+        with reader:
+            for chunk in reader:
+                yield os.path.basename(file_path), chunk.reset_index(drop=True)
+        return
+
+    # .xls 等格式没有流式读取器，整表读入后按块切分
+    sheets = read_file(file_path, dtype_backend=dtype_backend, reader_info=reader_info)
+    for sheet_name, df in sheets.items():
+        for start in range(0, len(df), chunksize):
+            yield sheet_name, df.iloc[start:start + chunksize].reset_index(drop=True)
+
+
+class StreamingWriter:
+    """逐块写出合并结果：CSV 追加写入，xlsx 使用 openpyxl 的 write_only 模式"""
+
+    def __init__(self, output_path, file_format="xlsx"):
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.output_path = output_path
+        self.file_format = file_format.lower()
+        self._header_written = False
+        self._workbook = None
+        self._worksheet = None
+        if self.file_format != "csv":
+            from openpyxl import Workbook
+
+            self._workbook = Workbook(write_only=True)
+            self._worksheet = self._workbook.create_sheet("Sheet1")
+
+    def write(self, df):
+        """追加写入一个数据块（列顺序需与首块一致）"""
+        if self.file_format == "csv":
+            df.to_csv(
+                self.output_path,
+                mode="a" if self._header_written else "w",
+                header=not self._header_written,
+                index=False,
+                encoding="utf-8" if self._header_written else "utf-8-sig",
+            )
+        else:
+            if not self._header_written:
+                self._worksheet.append([str(col) for col in df.columns])
+            values = df.astype(object).where(df.notna(), None)
+            for row in values.itertuples(index=False, name=None):
+                self._worksheet.append(list(row))
+        self._header_written = True
+
+    @property
+    def bytes_written(self):
+        """已写入磁盘的字节数（xlsx 在 close 时才落盘）"""
+        try:
+            return os.path.getsize(self.output_path)
+        except OSError:
+            return 0
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.save(self.output_path)
+            self._workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ArrowSidecarWriter:
+    """
+    把合并结果另存为未压缩的 Arrow IPC 文件（Feather v2），供分页预览以内存映射方式读取。
+    object 列统一存为字符串，保证各块 schema 一致。
+    每次只转换 batch_rows 行，整表写入时额外内存只相当于一个批次，而不是整个结果的副本。
+
+    预览是附加功能：未安装 pyarrow 或转换失败时不抛出异常，删除半成品文件并把原因
+    记在 error 中，合并照常完成。
+    """
+
+    def __init__(self, path, batch_rows=65536):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.error = None
+        self.rows = 0
+        self.complete = False
+        self._writer = None
+        self._schema = None
+        try:
+            import pyarrow
+        except ImportError:
+            self._pa = None
+            self.error = "未安装 pyarrow"
+        else:
+            self._pa = pyarrow
+
+    @property
+    def active(self):
+        return self._pa is not None and self.error is None
+
+    def _table(self, df):
+        pa = self._pa
+        arrays = []
+        for position in range(df.shape[1]):
+            series = df.iloc[:, position]
+            if series.dtype == object:
+                series = series.astype(str).where(series.notna(), None)
+                arrays.append(pa.array(series, type=pa.large_string(), from_pandas=True))
+            else:
+                arrays.append(pa.array(series, from_pandas=True))
+        table = pa.Table.from_arrays(arrays, names=[str(col) for col in df.columns])
+        if self._schema is not None and table.schema != self._schema:
+            table = table.cast(self._schema)
+        return table
+
+    def write(self, df):
+        """追加写入一个数据块（列顺序需与首块一致），按 batch_rows 行分批转换"""
+        if not self.active:
+            return
+        pa = self._pa
+        try:
+            for start in range(0, max(len(df), 1), self.batch_rows):
+                table = self._table(df.iloc[start:start + self.batch_rows])
+                if self._writer is None:
+                    self._schema = table.schema
+                    self._writer = pa.ipc.new_file(str(self.path), self._schema)
+                self._writer.write_table(table)
+                del table
+            self.rows += len(df)
+        except (pa.ArrowException, ValueError, TypeError, OSError) as exc:
+            self.discard(f"{type(exc).__name__}: {exc}")
+
+    def discard(self, reason):
+        """放弃预览文件"""
+        self.error = reason
+        self.complete = False
+        writer, self._writer = self._writer, None
+        try:
+            if writer is not None:
+                writer.close()
+        except Exception:  # noqa: BLE001
+            pass
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        """结束写入；返回是否生成了完整的预览文件"""
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            try:
+                writer.close()
+                self.complete = True
+            except (self._pa.ArrowException, OSError) as exc:
+                self.discard(f"{type(exc).__name__}: {exc}")
+        return self.complete
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard("合并未完成")
+        return False
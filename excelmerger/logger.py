@@ -1,22 +1,217 @@
+"""
+日志模块
+默认通过 QueueHandler 把日志记录放入队列，由后台 QueueListener 线程写控制台和文件，
+合并线程不会因写日志而阻塞。日志文件按天命名（YYYYMMDD.log），
+超过大小上限时轮转为 YYYYMMDD.log.1、.2 ……，超过保留天数的旧文件自动删除。
+记录中的字典、列表参数和 extra={"fields": {...}} 结构化字段在格式化前按条目数截断，
+整条消息再按字符数截断，宽表的质量报告等大对象不会写出数 MB 的日志行。
+
+环境变量：
+    MERGER_LOG_DIR        日志目录（默认为项目下的 logs/）
+    MERGER_LOG_FORMAT     text（默认）或 json（每行一个 JSON 对象）
+    MERGER_LOG_ASYNC      是否通过队列异步写日志（默认 true）
+    MERGER_LOG_MAX_MB     单个日志文件大小上限（默认 20）
+    MERGER_LOG_BACKUPS    每天按大小轮转保留的旧文件数（默认 5）
+    MERGER_LOG_KEEP_DAYS  日志保留天数，0 表示不删除（默认 30）
+    MERGER_LOG_MAX_CHARS  单条消息及单个字符串字段的最大字符数（默认 4000）
+"""
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
 from datetime import datetime
+from multiprocessing import util as mp_util
 from pathlib import Path
 
+LOG_FORMAT = os.getenv("MERGER_LOG_FORMAT", "text").lower()
+LOG_ASYNC = os.getenv("MERGER_LOG_ASYNC", "true").lower() in {"1", "true", "yes", "on"}
+LOG_MAX_BYTES = int(float(os.getenv("MERGER_LOG_MAX_MB", "20")) * 1024 * 1024)
+LOG_BACKUPS = int(os.getenv("MERGER_LOG_BACKUPS", "5"))
+LOG_KEEP_DAYS = int(os.getenv("MERGER_LOG_KEEP_DAYS", "30"))
+LOG_MAX_CHARS = int(os.getenv("MERGER_LOG_MAX_CHARS", "4000"))
+# 字典、列表参数每层最多保留的条目数和展开的层数
+LOG_MAX_ITEMS = 50
+LOG_MAX_DEPTH = 4
 
-def setup_logger(name="ExcelMerger"):
-    """设置日志记录。日志文件不可写时退回到标准输出。"""
-    logger = logging.getLogger(name)
-    if logger.handlers:
-        return logger
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
 
-    logger.setLevel(logging.INFO)
-    logger.propagate = False
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+_handlers_lock = threading.Lock()
+_handlers = None
+_listener = None
+_queue = None
+
+
+def cap_payload(value, max_items=LOG_MAX_ITEMS, max_chars=LOG_MAX_CHARS, depth=LOG_MAX_DEPTH):
+    """
+    按条目数、层数和字符数截断字典、列表和字符串，用于日志参数和结构化字段。
+    只遍历保留下来的部分，耗时与上限相关而与原对象大小无关。
+    """
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            return f"{value[:max_chars]}…(+{len(value) - max_chars} chars)"
+        return value
+    if isinstance(value, dict):
+        if depth <= 0:
+            return f"<dict of {len(value)} items>"
+        capped = {}
+        for index, (key, item) in enumerate(value.items()):
+            if index >= max_items:
+                capped["…"] = f"+{len(value) - max_items} items"
+                break
+            capped[str(key)] = cap_payload(item, max_items, max_chars, depth - 1)
+        return capped
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if depth <= 0:
+            return f"<{type(value).__name__} of {len(value)} items>"
+        capped = []
+        for index, item in enumerate(value):
+            if index >= max_items:
+                capped.append(f"…+{len(value) - max_items} items")
+                break
+            capped.append(cap_payload(item, max_items, max_chars, depth - 1))
+        return capped
+    return value
+
+
+class PayloadCapFilter(logging.Filter):
+    """在格式化之前截断记录的参数、结构化字段和消息"""
+
+    def filter(self, record):
+        if record.args:
+            if isinstance(record.args, dict):
+                record.args = cap_payload(record.args, depth=LOG_MAX_DEPTH + 1)
+            else:
+                record.args = tuple(cap_payload(arg) for arg in record.args)
+        fields = getattr(record, "fields", None)
+        if fields:
+            record.fields = cap_payload(fields)
+        message = record.getMessage()
+        if len(message) > LOG_MAX_CHARS:
+            record.msg = cap_payload(message)
+            record.args = None
+        return True
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式；结构化字段以紧凑 JSON 附在消息后"""
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text = f"{text} {_dumps(fields)}"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行 JSON：时间、级别、日志器、消息、进程、线程和结构化字段"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = fields
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return _dumps(entry)
+
+
+class DailyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    写入 <目录>/YYYYMMDD.log，日期变化时换新文件，超过 max_bytes 时按大小轮转。
+    多个进程写同一文件时，其他进程轮转后本进程会重新打开新文件。
+    """
+
+    def __init__(self, log_dir, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS, keep_days=LOG_KEEP_DAYS):
+        self.log_dir = Path(log_dir)
+        self.keep_days = keep_days
+        self.day = self._today()
+        super().__init__(
+            self.log_dir / f"{self.day}.log",
+            maxBytes=max_bytes,
+            backupCount=backups,
+            encoding="utf-8",
+        )
+        self._prune()
+
+    @staticmethod
+    def _today():
+        return datetime.now().strftime("%Y%m%d")
+
+    def _reopen(self):
+        if self.stream:
+            self.stream.close()
+        self.stream = self._open()
+
+    def shouldRollover(self, record):
+        today = self._today()
+        if today != self.day:
+            return True
+        if self.stream is None:
+            return False
+        try:
+            on_disk = os.stat(self.baseFilename)
+            if on_disk.st_ino != os.fstat(self.stream.fileno()).st_ino:
+                self._reopen()
+                on_disk = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            self._reopen()
+            return False
+        if self.maxBytes <= 0:
+            return False
+        pending = len(f"{self.format(record)}{self.terminator}".encode(self.encoding))
+        return on_disk.st_size > 0 and on_disk.st_size + pending > self.maxBytes
 
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    def doRollover(self):
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.baseFilename = os.fspath((self.log_dir / f"{today}.log").resolve())
+            self._reopen()
+            self._prune()
+            return
+        super().doRollover()
+
+    def _prune(self):
+        """删除超过保留天数的日志文件（含按大小轮转的旧文件）"""
+        if self.keep_days <= 0:
+            return
+        cutoff = time.time() - self.keep_days * 86400
+        for path in self.log_dir.glob("[0-9]" * 8 + ".log*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                continue
+
+
+def _build_handlers():
+    """所有日志器共用的控制台和文件处理器；文件不可写时只保留控制台"""
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT)
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
+    handlers = [stream_handler]
+    error = None
 
     log_dir = Path(
         os.getenv(
@@ -26,11 +221,98 @@ def setup_logger(name="ExcelMerger"):
     )
     try:
         log_dir.mkdir(parents=True, exist_ok=True)
-        log_path = log_dir / f"{datetime.now().strftime('%Y%m%d')}.log"
-        file_handler = logging.FileHandler(log_path, encoding="utf-8")
+        file_handler = DailyRotatingFileHandler(log_dir)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
     except OSError as exc:
-        logger.warning("日志文件不可写，已退回标准输出: %s", exc)
+        error = exc
+    if not LOG_ASYNC:
+        for handler in handlers:
+            handler.addFilter(PayloadCapFilter())
+    return handlers, error
+
+
+def _shared_handlers():
+    global _handlers
+    with _handlers_lock:
+        if _handlers is None:
+            _handlers = _build_handlers()
+        return _handlers
+
+
+class _ListenerQueueHandler(logging.handlers.QueueHandler):
+    """首次使用时（以及 fork 之后）在本进程启动 QueueListener 线程"""
+
+    def prepare(self, record):
+        # 只在调用线程里生成消息和异常文本，格式化交给监听线程
+        message = record.getMessage()
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        _ensure_listener().put_nowait(record)
+
+
+def _ensure_listener():
+    global _listener, _queue
+    with _handlers_lock:
+        if _listener is None:
+            _queue = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(
+                _queue, *_handlers[0], respect_handler_level=True
+            )
+            _listener.start()
+            # multiprocessing 子进程退出时不运行 atexit，需单独登记
+            mp_util.Finalize(None, _stop_listener, exitpriority=0)
+        return _queue
+
+
+def _stop_listener():
+    """退出前写完队列中剩余的记录"""
+    global _listener
+    with _handlers_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def _after_fork_in_child():
+    # 子进程没有父进程的监听线程，丢弃其状态，下次写日志时重新启动
+    global _listener, _queue, _handlers_lock
+    _handlers_lock = threading.Lock()
+    _listener = None
+    _queue = None
+
+
+atexit.register(_stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def setup_logger(name="ExcelMerger"):
+    """设置日志记录。日志文件不可写时退回到标准输出。"""
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    handlers, error = _shared_handlers()
+    if LOG_ASYNC:
+        queue_handler = _ListenerQueueHandler(None)
+        queue_handler.addFilter(PayloadCapFilter())
+        logger.addHandler(queue_handler)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+    if error is not None:
+        logger.warning("日志文件不可写，已退回标准输出: %s", error)
 
     return logger
@@ -5,6 +5,7 @@
 import re
 from typing import Dict, List, Tuple
 
+import numpy as np
 import pandas as pd
 
 from .config_manager import ConfigManager
@@ -33,6 +34,251 @@ def normalize_text(text: str) -> str:
     return text.lower()  # 统一小写
 
 
+# ================================================
+# 列并集对齐
+# ================================================
+def _is_nullable_dtype(dtype) -> bool:
+    """判断 dtype 是否能直接容纳缺失值（int/bool 等 numpy 类型不能）"""
+    if isinstance(dtype, np.dtype):
+        return dtype.kind not in "iub"
+    return True
+
+
+# numpy 整数类型对应的可空扩展类型名（uint64 -> "UInt64"，不能简单首字母大写）
+_NULLABLE_INTEGER_NAMES = {
+    "int8": "Int8", "int16": "Int16", "int32": "Int32", "int64": "Int64",
+    "uint8": "UInt8", "uint16": "UInt16", "uint32": "UInt32", "uint64": "UInt64",
+}
+
+
+def _nullable_counterpart(dtype):
+    """返回可容纳缺失值的等价 dtype，避免 int -> float/object 的隐式上转"""
+    if isinstance(dtype, np.dtype):
+        if dtype.name in _NULLABLE_INTEGER_NAMES:
+            return pd.api.types.pandas_dtype(_NULLABLE_INTEGER_NAMES[dtype.name])
+        if dtype.kind == "b":
+            return pd.BooleanDtype()
+    return dtype
+
+
+def _is_arrow_null_dtype(dtype) -> bool:
+    return isinstance(dtype, pd.ArrowDtype) and str(dtype.pyarrow_dtype) == "null"
+
+
+def _resolve_arrow_dtype(dtypes: List[pd.ArrowDtype]):
+    """Arrow 列类型不一致时的目标类型：数值统一为 int64/double，其余退回 object"""
+    import pyarrow as pa
+
+    arrow_types = [d.pyarrow_dtype for d in dtypes]
+    if all(pa.types.is_integer(t) for t in arrow_types):
+        return pd.ArrowDtype(pa.int64())
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in arrow_types):
+        return pd.ArrowDtype(pa.float64())
+    if all(pa.types.is_string(t) or pa.types.is_large_string(t) for t in arrow_types):
+        return pd.ArrowDtype(pa.large_string())
+    return np.dtype(object)
+
+
+def _resolve_column_dtype(dtypes: List[object], has_missing: bool):
+    """
+    为单列确定合并后的目标 dtype
+
+    Args:
+        dtypes: 该列在各数据框中的 dtype
+        has_missing: 是否存在不含该列的数据框（需要填充缺失值）
+
+    Returns:
+        目标 dtype
+    """
+    unique = []
+    for dtype in dtypes:
+        if dtype not in unique:
+            unique.append(dtype)
+    # Arrow 的 null 类型（整列为空）可转换为任意类型，不参与决策
+    typed = [d for d in unique if not _is_arrow_null_dtype(d)]
+    if typed:
+        unique = typed
+
+    if len(unique) == 1:
+        target = unique[0]
+    elif all(isinstance(d, pd.ArrowDtype) for d in unique):
+        target = _resolve_arrow_dtype(unique)
+    elif all(pd.api.types.is_integer_dtype(d) for d in unique):
+        if all(isinstance(d, np.dtype) for d in unique):
+            target = np.result_type(*unique)
+        else:
+            target = pd.Int64Dtype()
+    elif all(
+        pd.api.types.is_integer_dtype(d) or pd.api.types.is_float_dtype(d)
+        for d in unique
+    ) and not any(pd.api.types.is_bool_dtype(d) for d in unique):
+        if all(isinstance(d, np.dtype) for d in unique):
+            target = np.dtype("float64")
+        else:
+            target = pd.Float64Dtype()
+    else:
+        target = np.dtype(object)
+
+    if has_missing and not _is_nullable_dtype(target):
+        target = _nullable_counterpart(target)
+    return target
+
+
+class SchemaBuilder:
+    """逐个累积数据框的列与 dtype，最终解析出列并集 schema（可用于分块处理）"""
+
+    def __init__(self):
+        self._dtypes: Dict[object, List[object]] = {}
+        self._covered_rows: Dict[object, int] = {}
+        self.total_rows = 0
+
+    def add(self, frame: pd.DataFrame) -> None:
+        """记录一个数据框（或数据块）的列、dtype 与行数"""
+        for col, dtype in frame.dtypes.items():
+            self._dtypes.setdefault(col, []).append(dtype)
+            self._covered_rows[col] = self._covered_rows.get(col, 0) + len(frame)
+        self.total_rows += len(frame)
+
+    def resolve(self) -> Dict[object, object]:
+        """返回有序字典: {列名: 目标 dtype}"""
+        return {
+            col: _resolve_column_dtype(dtypes, self._covered_rows[col] < self.total_rows)
+            for col, dtypes in self._dtypes.items()
+        }
+
+
+def resolve_union_schema(frames: List[pd.DataFrame]) -> Dict[object, object]:
+    """
+    构建所有数据框的列并集（按首次出现顺序），并为每列确定目标 dtype
+
+    Args:
+        frames: 数据框列表
+
+    Returns:
+        有序字典: {列名: 目标 dtype}
+    """
+    builder = SchemaBuilder()
+    for frame in frames:
+        builder.add(frame)
+    return builder.resolve()
+
+
+_MASKED_DTYPES = (
+    pd.BooleanDtype,
+    pd.Int8Dtype, pd.Int16Dtype, pd.Int32Dtype, pd.Int64Dtype,
+    pd.UInt8Dtype, pd.UInt16Dtype, pd.UInt32Dtype, pd.UInt64Dtype,
+    pd.Float32Dtype, pd.Float64Dtype,
+)
+
+
+def _missing_fill_value(dtype):
+    if dtype.kind in "mM":
+        return np.datetime64("NaT") if dtype.kind == "M" else np.timedelta64("NaT")
+    return np.nan
+
+
+def _assemble_numpy_column(frames, col, dtype: np.dtype, total: int) -> np.ndarray:
+    out = np.empty(total, dtype=dtype)
+    offset = 0
+    for frame in frames:
+        length = len(frame)
+        if col in frame.columns:
+            out[offset:offset + length] = frame[col].to_numpy(dtype=dtype)
+        elif length:
+            # 零行数据框缺列时无需填充（int 列写入 NaN 会失败并退化为 object）
+            out[offset:offset + length] = _missing_fill_value(dtype)
+        offset += length
+    return out
+
+
+def _assemble_masked_column(frames, col, dtype, total: int):
+    values = np.zeros(total, dtype=dtype.numpy_dtype)
+    mask = np.ones(total, dtype=bool)
+    offset = 0
+    for frame in frames:
+        length = len(frame)
+        if col in frame.columns:
+            piece = pd.array(frame[col], dtype=dtype)
+            values[offset:offset + length] = piece.to_numpy(
+                dtype=dtype.numpy_dtype, na_value=values.dtype.type(0)
+            )
+            mask[offset:offset + length] = piece.isna()
+        offset += length
+    if isinstance(dtype, pd.BooleanDtype):
+        return pd.arrays.BooleanArray(values, mask)
+    if pd.api.types.is_float_dtype(dtype):
+        return pd.arrays.FloatingArray(values, mask)
+    return pd.arrays.IntegerArray(values, mask)
+
+
+def _assemble_extension_column(frames, col, dtype, total: int):
+    pieces = []
+    for frame in frames:
+        if col in frame.columns:
+            pieces.append(frame[col].astype(dtype).array)
+        elif len(frame):
+            pieces.append(
+                pd.Series(pd.NA, index=pd.RangeIndex(len(frame)), dtype=dtype).array
+            )
+    if not pieces:
+        return pd.array([], dtype=dtype)
+    return type(pieces[0])._concat_same_type(pieces)
+
+
+def _assemble_frame(frames: List[pd.DataFrame], schema: Dict[object, object]) -> pd.DataFrame:
+    total = sum(len(frame) for frame in frames)
+    data = {}
+    for col, dtype in schema.items():
+        try:
+            if isinstance(dtype, np.dtype):
+                data[col] = _assemble_numpy_column(frames, col, dtype, total)
+            elif isinstance(dtype, _MASKED_DTYPES):
+                data[col] = _assemble_masked_column(frames, col, dtype, total)
+            else:
+                data[col] = _assemble_extension_column(frames, col, dtype, total)
+        except (TypeError, ValueError):
+            data[col] = _assemble_numpy_column(frames, col, np.dtype(object), total)
+
+    return pd.DataFrame(data, index=pd.RangeIndex(total), copy=False)
+
+
+def concat_aligned(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    按统一 schema 纵向合并数据框，等价于 pd.concat(join="outer", ignore_index=True)
+
+    先确定列并集与每列目标 dtype，再把数据写入预分配的列中，
+    避免缺列时 int 被上转为 float/object。
+
+    Args:
+        frames: 数据框列表
+
+    Returns:
+        合并后的数据框
+    """
+    frames = list(frames)
+    if not frames:
+        raise ValueError("没有可合并的数据")
+    if any(not frame.columns.is_unique for frame in frames):
+        # 重复列名无法按列对齐，退回通用实现
+        return pd.concat(frames, join="outer", ignore_index=True, sort=False)
+
+    return _assemble_frame(frames, resolve_union_schema(frames))
+
+
+def align_to_schema(frame: pd.DataFrame, schema: Dict[object, object]) -> pd.DataFrame:
+    """
+    将单个数据框（或数据块）按给定 schema 补齐列并转换 dtype
+
+    Args:
+        frame: 数据框
+        schema: resolve_union_schema / SchemaBuilder 得到的 schema
+
+    Returns:
+        列顺序与 dtype 均与 schema 一致的数据框
+    """
+    return _assemble_frame([frame], schema)
+
+
 # ================================================
 # 主类
 # ================================================
@@ -0,0 +1,228 @@
+"""
+合并进度跟踪模块
+记录当前阶段、已处理文件数、已读行数和已写字节数，
+按实际吞吐估算剩余时间，并通过回调推送给 Web 任务状态或 GUI 进度条。
+每次进度更新同时是一个取消检查点（与进度推送按相同间隔限频）。
+同时累计各阶段与每个文件的墙钟时间和 CPU 时间，以及每个工作表的行列数，
+供监控指标和任务性能记录使用。
+"""
+import time
+from typing import Callable, Dict, List, Optional
+
+# 各阶段在总进度中的区间（百分比）；读取与列名归一化按文件交替进行，共用一个区间
+PHASE_RANGES = {
+    "read": (0.0, 55.0),
+    "normalize": (0.0, 55.0),
+    "concat": (55.0, 65.0),
+    "dedup": (65.0, 75.0),
+    "validate": (75.0, 80.0),
+    "write": (80.0, 100.0),
+}
+
+PHASE_LABELS = {
+    "read": "读取文件",
+    "normalize": "统一列名",
+    "concat": "合并数据",
+    "dedup": "去重",
+    "validate": "数据质量检查",
+    "write": "写出结果",
+}
+
+
+class MergeCancelled(Exception):
+    """合并任务在检查点处被取消"""
+
+
+class MergeProgress:
+    """合并进度跟踪器"""
+
+    def __init__(
+        self,
+        files_total: int,
+        callback: Optional[Callable[[Dict], None]] = None,
+        min_interval: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+        cancel_check: Optional[Callable[[], bool]] = None,
+        cpu_clock: Callable[[], float] = time.thread_time,
+    ):
+        """
+        Args:
+            files_total: 输入文件总数
+            callback: 接收进度快照字典的回调
+            min_interval: 两次回调之间的最小间隔（秒），阶段切换不受限制；
+                取消检查同样按此间隔限频
+            clock: 计时函数（便于测试）
+            cancel_check: 返回 True 表示已请求取消，在检查点调用（可能需要查询数据库，
+                两次调用至少间隔 min_interval，阶段切换时立即调用）
+            cpu_clock: CPU 计时函数，默认为当前线程的 CPU 时间
+        """
+        self.files_total = max(files_total, 0)
+        self.callback = callback
+        self.min_interval = min_interval
+        self._clock = clock
+        self._cpu_clock = cpu_clock
+        self._cancel_check = cancel_check
+        self._started = clock()
+        self._last_emit = None
+        self._last_cancel_check = None
+        self.phase = "read"
+        self.current_file = ""
+        self.files_done = 0
+        self.rows_read = 0
+        self.bytes_written = 0
+        self.phase_fraction = 0.0
+        self.finished = False
+        # 各阶段累计耗时（秒）；读取与归一化按文件交替，分别累计
+        self.phase_seconds: Dict[str, float] = {}
+        self.phase_cpu_seconds: Dict[str, float] = {}
+        self._cpu_started = cpu_clock()
+        self._phase_started = self._started
+        self._phase_cpu_started = self._cpu_started
+        # 每个输入文件的记录：name、seconds、cpu_seconds、rows、sheets，
+        # 以及 annotate_file 补充的 parse_seconds、reader 等
+        self.file_records: List[Dict] = []
+
+    def percent(self) -> float:
+        """当前总体进度（0-100）"""
+        if self.finished:
+            return 100.0
+        start, end = PHASE_RANGES.get(self.phase, (0.0, 100.0))
+        if self.phase in ("read", "normalize") and self.files_total:
+            fraction = self.files_done / self.files_total
+        else:
+            fraction = self.phase_fraction
+        return round(start + (end - start) * min(max(fraction, 0.0), 1.0), 1)
+
+    def snapshot(self) -> Dict:
+        """返回可 JSON 序列化的进度快照"""
+        elapsed = self._clock() - self._started
+        percent = self.percent()
+        eta = None
+        if 0 < percent < 100:
+            eta = round(elapsed * (100 - percent) / percent, 1)
+        return {
+            "phase": self.phase,
+            "phase_label": PHASE_LABELS.get(self.phase, self.phase),
+            "current_file": self.current_file,
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "rows_read": self.rows_read,
+            "bytes_written": self.bytes_written,
+            "percent": percent,
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": eta,
+        }
+
+    def checkpoint(self, force: bool = False) -> None:
+        """取消检查点：已请求取消时抛出 MergeCancelled
+
+        距上次检查不足 min_interval 时直接返回（force 除外），
+        避免每块数据都查询一次取消状态。
+        """
+        if self._cancel_check is None:
+            return
+        now = self._clock()
+        if (
+            not force
+            and self._last_cancel_check is not None
+            and now - self._last_cancel_check < self.min_interval
+        ):
+            return
+        self._last_cancel_check = now
+        if self._cancel_check():
+            raise MergeCancelled("任务已取消")
+
+    def _emit(self, force: bool = False) -> None:
+        self.checkpoint(force=force)
+        if self.callback is None:
+            return
+        now = self._clock()
+        if not force and self._last_emit is not None and now - self._last_emit < self.min_interval:
+            return
+        self._last_emit = now
+        self.callback(self.snapshot())
+
+    def _close_phase(self) -> None:
+        now = self._clock()
+        cpu_now = self._cpu_clock()
+        self.phase_seconds[self.phase] = (
+            self.phase_seconds.get(self.phase, 0.0) + now - self._phase_started
+        )
+        self.phase_cpu_seconds[self.phase] = (
+            self.phase_cpu_seconds.get(self.phase, 0.0) + cpu_now - self._phase_cpu_started
+        )
+        self._phase_started = now
+        self._phase_cpu_started = cpu_now
+
+    def elapsed(self) -> tuple:
+        """自开始以来的 (墙钟时间, CPU 时间)，单位秒"""
+        return self._clock() - self._started, self._cpu_clock() - self._cpu_started
+
+    def set_phase(self, phase: str) -> None:
+        """切换阶段（立即推送）"""
+        if phase != self.phase:
+            self._close_phase()
+            self.phase_fraction = 0.0
+        self.phase = phase
+        self._emit(force=phase not in ("read", "normalize"))
+
+    def start_file(self, name: str) -> None:
+        self.current_file = name
+        self.file_records.append(
+            {
+                "name": name,
+                "sheets": [],
+                "started": self._clock(),
+                "cpu_started": self._cpu_clock(),
+                "rows_before": self.rows_read,
+            }
+        )
+        self.set_phase("read")
+
+    def annotate_file(self, **fields) -> None:
+        """为当前文件补充记录，如 parse_seconds（整文件读取耗时）、reader（读取引擎）"""
+        if self.file_records:
+            self.file_records[-1].update(fields)
+
+    def record_sheet(self, sheet: str, rows: int, columns: int) -> None:
+        """记录当前文件某个工作表（或其中一块）的行列数，同名工作表的块累加行数"""
+        if not self.file_records:
+            return
+        sheets = self.file_records[-1]["sheets"]
+        if sheets and sheets[-1]["name"] == sheet:
+            sheets[-1]["rows"] += rows
+            sheets[-1]["columns"] = max(sheets[-1]["columns"], columns)
+        else:
+            sheets.append({"name": sheet, "rows": rows, "columns": columns})
+
+    def file_done(self, rows: int = 0) -> None:
+        self.files_done += 1
+        self.rows_read += rows
+        if self.file_records and "seconds" not in self.file_records[-1]:
+            record = self.file_records[-1]
+            record["seconds"] = self._clock() - record.pop("started")
+            record["cpu_seconds"] = self._cpu_clock() - record.pop("cpu_started")
+            record["rows"] = self.rows_read - record.pop("rows_before")
+        self._emit()
+
+    def add_rows(self, rows: int) -> None:
+        self.rows_read += rows
+        self._emit()
+
+    def set_fraction(self, fraction: float) -> None:
+        """设置当前阶段内的完成比例（0-1）"""
+        self.phase_fraction = fraction
+        self._emit()
+
+    def set_bytes_written(self, size: int) -> None:
+        self.bytes_written = size
+        self._emit()
+
+    def finish(self) -> None:
+        if not self.finished:
+            self._close_phase()
+        self.finished = True
+        self.phase_fraction = 1.0
+        if self.callback is not None:
+            self._last_emit = self._clock()
+            self.callback(self.snapshot())
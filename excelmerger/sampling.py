@@ -0,0 +1,233 @@
+"""
+抽样读取模块
+大文件分析时不解析全部数据：读取表头、前 N 行，再从随机位置抽取若干行，
+用于报告列的出现情况、推断类型和空值率，耗时与抽样行数相关而与文件大小基本无关。
+总行数按文件元数据估算：xlsx 取工作表的 dimension 标记，CSV 的开头行数准确计数，其余部分按分层抽样段的平均每行字节数推算。
+"""
+import codecs
+import csv
+import io
+import os
+import random
+import time
+
+import pandas as pd
+
+from .io_utils import _excel_header_names, read_file
+
+# 编码探测只读取文件开头的这么多字节
+ENCODING_PROBE_BYTES = 1024 * 1024
+# CSV 随机抽样的起点个数，每个起点连续读取若干行
+CSV_SAMPLE_SPANS = 8
+
+
+def _sniff_encoding(file_path, encodings=("utf-8-sig", "utf-8", "gbk", "latin1")):
+    """按文件开头判断文本编码（与 io_utils 的候选编码一致）"""
+    with open(file_path, "rb") as fh:
+        probe = fh.read(ENCODING_PROBE_BYTES)
+    for enc in encodings:
+        try:
+            # final=False：允许开头片段在多字节字符中间截断
+            codecs.getincrementaldecoder(enc)().decode(probe, final=False)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    return "latin1"
+
+
+def _sniff_delimiter(text):
+    try:
+        return csv.Sniffer().sniff(text, delimiters=",\t;|").delimiter
+    except csv.Error:
+        return ","
+
+
+def _sample_csv(file_path, head_rows, sample_rows, rng):
+    size = os.path.getsize(file_path)
+    encoding = _sniff_encoding(file_path)
+    with open(file_path, "rb") as fh:
+        header_line = fh.readline()
+        head_lines = []
+        while len(head_lines) < head_rows:
+            line = fh.readline()
+            if not line:
+                break
+            head_lines.append(line)
+        head_end = fh.tell()
+        reached_end = not fh.readline()
+
+        text = (header_line + b"".join(head_lines)).decode(encoding, errors="replace")
+        sep = _sniff_delimiter(text[:65536])
+        head = pd.read_csv(io.StringIO(text), sep=sep)
+        columns = list(head.columns)
+        if reached_end:
+            return head, len(head), True
+
+        frames = [head]
+        line_count = 0
+        line_bytes = 0
+        span_rows = max(sample_rows // CSV_SAMPLE_SPANS, 1)
+        # 分层抽样：每个等长区间内随机取一个起点，行长随位置变化时估计更稳定
+        stride = (size - head_end) / CSV_SAMPLE_SPANS
+        starts = [
+            head_end + int(stride * i) + rng.randrange(max(int(stride), 1))
+            for i in range(CSV_SAMPLE_SPANS)
+        ]
+        for start in starts:
+            fh.seek(start)
+            fh.readline()  # 跳到下一行开头（\n 不会出现在 UTF-8/GBK 多字节字符中）
+            lines = [line for line in (fh.readline() for _ in range(span_rows)) if line]
+            if not lines:
+                continue
+            block = b"".join(lines)
+            line_count += len(lines)
+            line_bytes += len(block)
+            try:
+                frame = pd.read_csv(
+                    io.StringIO(block.decode(encoding, errors="replace")),
+                    sep=sep, header=None, names=columns, index_col=False,
+                )
+            except (pd.errors.ParserError, ValueError):
+                # 起点落在带换行的引号字段内等情况，放弃这一段
+                continue
+            frames.append(frame)
+    # 开头的行数是准确的；其余部分按各抽样段的平均每行字节数估算
+    # （开头的行通常偏短，计入平均值会使估计偏高）
+    if line_count:
+        estimated = len(head_lines) + int((size - head_end) / max(line_bytes / line_count, 1))
+    else:
+        estimated = int((size - len(header_line)) / max((head_end - len(header_line)) / max(len(head_lines), 1), 1))
+    sample = pd.concat(frames, ignore_index=True) if len(frames) > 1 else head
+    return sample, estimated, False
+
+
+def _sample_xlsx(file_path, head_rows, sample_rows, rng, max_seconds):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    sheets = {}
+    try:
+        for worksheet in workbook.worksheets:
+            # 只读模式下 max_row 来自 dimension 标记，不需要遍历；缺少该标记时为 None
+            declared = worksheet.max_row
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = _excel_header_names(header)
+            estimated = max(declared - 1, 0) if declared else None
+            picks = set()
+            if estimated and estimated > head_rows:
+                population = range(head_rows, estimated)
+                picks = set(rng.sample(population, min(sample_rows, len(population))))
+            last_index = max(picks, default=head_rows - 1)
+            deadline = time.monotonic() + max_seconds
+            records = []
+            exact = True
+            rows_scanned = None
+            for index, row in enumerate(rows):
+                if index > last_index:
+                    exact = False
+                    break
+                if index >= head_rows and index not in picks:
+                    # 跳过了未抽中的行，结果不是完整表（即使最后一行恰好被抽中）
+                    exact = False
+                    # 行迭代是顺序的：超出时间预算时只保留已抽到的行，
+                    # 样本只覆盖前 index 行，记录下来供调用方说明
+                    if index % 1000 == 0 and time.monotonic() > deadline:
+                        rows_scanned = index
+                        break
+                    continue
+                if all(value is None for value in row):
+                    continue
+                records.append(row[:len(columns)])
+            frame = pd.DataFrame(records, columns=columns).infer_objects()
+            if exact:
+                estimated = len(frame)
+            sheets[worksheet.title] = (frame, estimated, exact, rows_scanned)
+    finally:
+        workbook.close()
+    return sheets
+
+
+def sample_file(file_path, head_rows=200, sample_rows=1000, seed=None, max_seconds=2.0):
+    """
+    抽样读取文件
+
+    Args:
+        file_path: 文件路径
+        head_rows: 读取的前 N 行
+        sample_rows: 在其余部分随机抽取的行数
+        seed: 随机种子（便于测试）
+        max_seconds: xlsx 每个工作表顺序查找抽样行的时间上限
+
+    Returns:
+        {工作表名: {"frame": 抽样数据, "estimated_rows": 估计总行数, "exact": 是否读完整表,
+                   "truncated": 是否因超时只抽样了前面的行}}
+        CSV/TXT 的工作表名为文件名；truncated 为真时另有 "rows_scanned"：已顺序读过的数据行数
+    """
+    rng = random.Random(seed)
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in (".csv", ".txt"):
+        frame, estimated, exact = _sample_csv(file_path, head_rows, sample_rows, rng)
+        return {
+            os.path.basename(file_path): {
+                "frame": frame, "estimated_rows": estimated, "exact": exact, "truncated": False,
+            }
+        }
+    if ext == ".xlsx":
+        try:
+            sheets = _sample_xlsx(file_path, head_rows, sample_rows, rng, max_seconds)
+        except Exception as e:
+            raise RuntimeError(f"Excel 文件读取失败: {file_path} ({e})") from e
+        result = {}
+        for name, (frame, estimated, exact, rows_scanned) in sheets.items():
+            result[name] = {
+                "frame": frame,
+                "estimated_rows": estimated,
+                "exact": exact,
+                "truncated": rows_scanned is not None,
+            }
+            if rows_scanned is not None:
+                result[name]["rows_scanned"] = rows_scanned
+        return result
+    # .xls 没有按行读取的方式：整表读入后抽样
+    result = {}
+    for name, df in read_file(file_path).items():
+        if len(df) > head_rows + sample_rows:
+            rest = df.iloc[head_rows:].sample(n=sample_rows, random_state=rng.randrange(2**32))
+            frame = pd.concat([df.iloc[:head_rows], rest.sort_index()], ignore_index=True)
+        else:
+            frame = df
+        result[name] = {
+            "frame": frame, "estimated_rows": len(df), "exact": frame is df, "truncated": False,
+        }
+    return result
+
+
+def _type_label(series):
+    if pd.api.types.is_bool_dtype(series):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(series):
+        return "integer"
+    if pd.api.types.is_float_dtype(series):
+        return "float"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if series.dropna().empty:
+        return "empty"
+    return "text" if pd.api.types.is_string_dtype(series) else "mixed"
+
+
+def column_profile(df):
+    """每列的推断类型和空值率（基于传入的数据，抽样时即为样本）"""
+    if df.empty:
+        return {str(col): {"type": "empty", "null_rate": None} for col in df.columns}
+    null_rates = df.isna().mean()
+    return {
+        str(col): {
+            "type": _type_label(df.iloc[:, position]),
+            "null_rate": round(float(null_rates.iloc[position]), 4),
+        }
+        for position, col in enumerate(df.columns)
+    }
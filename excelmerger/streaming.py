@@ -0,0 +1,258 @@
+"""
+分块合并模块
+超出内存预算的任务按块读取、落盘暂存，再按统一 schema 逐块写出结果，
+内存占用只与块大小相关。
+"""
+import shutil
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .io_utils import (
+    ArrowSidecarWriter,
+    StreamingWriter,
+    apply_dtype_backend,
+    iter_file_chunks,
+)
+from .merger import ExcelMergerCore, SchemaBuilder, align_to_schema
+from .progress import MergeProgress
+
+META_COLUMNS = ("来源文件", "工作表")
+
+
+# 第二个哈希使用的 siphash 密钥与盐值（与 pandas 默认值不同）
+_SECOND_HASH_KEY = "excelmerger-dup2"
+_SECOND_HASH_SALT = np.uint64(0x9E3779B97F4A7C15)
+_SECOND_HASH_MULT = np.uint64(0x100000001B3)
+
+
+def _row_keys(subset: pd.DataFrame):
+    """
+    每行的 128 位键：pandas 行哈希，加上一个独立计算的第二哈希。
+    第二哈希的每列先用另一密钥哈希，再加盐二次混合，按逆序合并，
+    两个 64 位哈希同时碰撞的概率可忽略。
+    pandas 按字符串哈希 object 列中的非字符串值（1 与 "1" 哈希相同），
+    第二哈希对 object 列额外计入值的类型（不论各块内容如何，保证跨块一致）。
+    """
+    first = pd.util.hash_pandas_object(subset, index=False).to_numpy(dtype=np.uint64)
+    second = np.full(len(subset), _SECOND_HASH_SALT, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for position in range(subset.shape[1] - 1, -1, -1):
+            column = subset.iloc[:, position]
+            hashed = pd.util.hash_pandas_object(
+                column, index=False, hash_key=_SECOND_HASH_KEY, categorize=False
+            ).to_numpy(dtype=np.uint64)
+            if column.dtype == object:
+                codes, types = pd.factorize(column.map(type))
+                type_hashes = pd.util.hash_array(
+                    np.array([value.__name__ for value in types], dtype=object)
+                )
+                hashed = hashed ^ type_hashes[codes]
+            hashed = pd.util.hash_array(hashed ^ _SECOND_HASH_SALT)
+            second = (second ^ hashed) * _SECOND_HASH_MULT
+    return first, pd.util.hash_array(second)
+
+
+def _in_sorted_run(run, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """已按第一哈希排序的键（first, second）是否在同样有序的 run 中"""
+    run_first, run_second = run
+    left = np.minimum(np.searchsorted(run_first, first), len(run_first) - 1)
+    found = (run_first[left] == first) & (run_second[left] == second)
+    # 第一哈希相同的已存键不止一个（此前发生过 64 位碰撞）时逐个比较
+    after = np.minimum(left + 1, len(run_first) - 1)
+    for i in np.flatnonzero(~found & (after > left) & (run_first[after] == first)):
+        right = np.searchsorted(run_first, first[i], side="right")
+        found[i] = bool((run_second[left[i]:right] == second[i]).any())
+    return found
+
+
+class RowHashDeduplicator:
+    """
+    基于行哈希的跨块去重（每行只保留 16 字节的 128 位键，而非整行数据）
+
+    已出现的键保存为若干按第一哈希排序的数组（run），新块的键追加为新 run，
+    相邻 run 大小接近时合并，查找和插入都是向量化的有序数组操作。
+    """
+
+    def __init__(self, key_columns: Optional[List[str]] = None):
+        self.key_columns = key_columns or None
+        self._runs: List[tuple] = []
+
+    def check_columns(self, columns: Iterable) -> None:
+        """与 deduplicate_smart 一致：关键字段缺失时报错"""
+        if not self.key_columns:
+            return
+        available = set(columns)
+        missing_keys = [k for k in self.key_columns if k not in available]
+        if missing_keys:
+            raise ValueError("去重关键字段不存在: " + ", ".join(missing_keys))
+
+    def _add_run(self, first: np.ndarray, second: np.ndarray) -> None:
+        self._runs.append((first, second))
+        while len(self._runs) > 1 and len(self._runs[-2][0]) <= 2 * len(self._runs[-1][0]):
+            newer_first, newer_second = self._runs.pop()
+            older_first, older_second = self._runs.pop()
+            # 两个有序数组线性归并：newer 中每个键落在 older 中相同键之后
+            total = len(older_first) + len(newer_first)
+            slots = np.searchsorted(older_first, newer_first, side="right")
+            from_newer = np.zeros(total, dtype=bool)
+            from_newer[slots + np.arange(len(newer_first))] = True
+            merged_first = np.empty(total, dtype=np.uint64)
+            merged_second = np.empty(total, dtype=np.uint64)
+            merged_first[from_newer], merged_first[~from_newer] = newer_first, older_first
+            merged_second[from_newer], merged_second[~from_newer] = newer_second, older_second
+            self._runs.append((merged_first, merged_second))
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        """返回去掉已出现过的行后的数据块"""
+        if df.empty:
+            return df
+        subset = df[self.key_columns] if self.key_columns else df
+        first, second = _row_keys(subset)
+        # 按 (first, second) 稳定排序：块内重复的键相邻，且保留原顺序中的第一行
+        order = np.lexsort((second, first))
+        first, second = first[order], second[order]
+        keep_sorted = np.ones(len(order), dtype=bool)
+        keep_sorted[1:] = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+        for run in self._runs:
+            keep_sorted &= ~_in_sorted_run(run, first, second)
+        if keep_sorted.any():
+            self._add_run(first[keep_sorted], second[keep_sorted])
+
+        keep = np.empty(len(order), dtype=bool)
+        keep[order] = keep_sorted
+        if keep.all():
+            return df
+        return df[keep]
+
+
+def stream_merge(
+    file_paths: List[Path],
+    output_path: Path,
+    *,
+    merger: ExcelMergerCore,
+    spill_dir: Path,
+    output_format: str = "xlsx",
+    normalize_columns: bool = True,
+    enable_fuzzy: bool = False,
+    exclude_columns: Optional[set] = None,
+    dedup_keys: Optional[List[str]] = None,
+    remove_duplicates: bool = False,
+    chunksize: int = 50000,
+    dtype_backend: Optional[str] = None,
+    log: Optional[Callable[[str], None]] = None,
+    progress: Optional[MergeProgress] = None,
+    sidecar_path: Optional[Path] = None,
+) -> Dict:
+    """
+    分块合并文件并写出结果
+
+    第一遍：分块读取、归一化列名并暂存到 spill_dir，同时累积 schema；
+    第二遍：逐块按 schema 对齐、去重后写出。
+
+    Args:
+        file_paths: 输入文件列表
+        output_path: 输出文件路径
+        merger: 合并核心（用于列名归一化）
+        spill_dir: 暂存目录（结束后删除）
+        dedup_keys: 智能去重关键字段；为空且 remove_duplicates 为真时整行去重
+        progress: 进度跟踪器（可选）
+        sidecar_path: 同时写出 Arrow 预览文件的路径（可选，见 ArrowSidecarWriter）
+
+    Returns:
+        统计信息字典
+    """
+    exclude_columns = exclude_columns or set()
+    spill_dir = Path(spill_dir)
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    builder = SchemaBuilder()
+    spilled: List[Path] = []
+    mapping_report = {}
+    progress = progress or MergeProgress(len(file_paths))
+
+    try:
+        for file_path in file_paths:
+            file_path = Path(file_path)
+            progress.start_file(file_path.name)
+            reader_info = {}
+            for sheet_name, chunk in iter_file_chunks(
+                str(file_path),
+                chunksize=chunksize,
+                dtype_backend=dtype_backend,
+                reader_info=reader_info,
+            ):
+                progress.record_sheet(sheet_name, len(chunk), len(chunk.columns))
+                if chunk.empty:
+                    continue
+                if normalize_columns:
+                    chunk = merger.normalize_columns(chunk, enable_fuzzy=enable_fuzzy)
+                    current_mapping = merger.get_mapping_report()
+                    if current_mapping:
+                        mapping_report[f"{file_path.name}-{sheet_name}"] = current_mapping
+
+                chunk.insert(0, META_COLUMNS[0], file_path.stem)
+                chunk.insert(1, META_COLUMNS[1], sheet_name)
+                chunk = apply_dtype_backend(chunk, dtype_backend)
+                if exclude_columns:
+                    chunk = chunk[
+                        [
+                            c for c in chunk.columns
+                            if str(c) not in exclude_columns or str(c) in META_COLUMNS
+                        ]
+                    ]
+
+                builder.add(chunk)
+                spill_path = spill_dir / f"{len(spilled):06d}.pkl"
+                chunk.to_pickle(spill_path)
+                spilled.append(spill_path)
+                progress.add_rows(len(chunk))
+            progress.annotate_file(reader=reader_info)
+            progress.file_done()
+            if log:
+                log(f"Spilled {file_path.name}, {builder.total_rows} rows so far")
+
+        if not spilled:
+            raise ValueError("没有可合并的数据")
+
+        schema = builder.resolve()
+        deduplicator = None
+        if dedup_keys:
+            deduplicator = RowHashDeduplicator(dedup_keys)
+        elif remove_duplicates:
+            deduplicator = RowHashDeduplicator()
+        if deduplicator:
+            deduplicator.check_columns(schema.keys())
+
+        rows_written = 0
+        progress.set_phase("write")
+        sidecar = ArrowSidecarWriter(sidecar_path) if sidecar_path else None
+        with StreamingWriter(str(output_path), output_format) as writer, (
+            sidecar or nullcontext()
+        ):
+            for index, spill_path in enumerate(spilled, start=1):
+                chunk = align_to_schema(pd.read_pickle(spill_path), schema)
+                spill_path.unlink()
+                if deduplicator:
+                    chunk = deduplicator.filter(chunk)
+                writer.write(chunk)
+                if sidecar is not None:
+                    sidecar.write(chunk)
+                rows_written += len(chunk)
+                progress.phase_fraction = index / len(spilled)
+                progress.set_bytes_written(writer.bytes_written)
+        progress.set_bytes_written(writer.bytes_written)
+
+        return {
+            "rows_read": builder.total_rows,
+            "rows_written": rows_written,
+            "removed_duplicates": builder.total_rows - rows_written,
+            "columns": len(schema),
+            "mapping_report": mapping_report,
+            "sidecar": sidecar is not None and sidecar.complete,
+            "sidecar_error": sidecar.error if sidecar is not None else None,
+        }
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
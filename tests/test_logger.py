@@ -0,0 +1,58 @@
+import json
+import logging
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from excelmerger.logger import (
+    DailyRotatingFileHandler,
+    JsonFormatter,
+    PayloadCapFilter,
+    cap_payload,
+)
+
+
+class LoggerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(prefix="excelmerger-logs-"))
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+
+    def test_wide_payloads_are_capped_before_formatting(self):
+        report = {"空值统计": {f"col{i}": {"数量": i} for i in range(500)}}
+        capped = cap_payload(report, max_items=3)
+        self.assertEqual(list(capped["空值统计"])[:3], ["col0", "col1", "col2"])
+        self.assertEqual(capped["空值统计"]["…"], "+497 items")
+        self.assertEqual(cap_payload("x" * 10, max_chars=4), "xxxx…(+6 chars)")
+
+        record = logging.LogRecord(
+            "ExcelMergerWeb", logging.INFO, __file__, 1, "Quality report: %s rows", (12,),
+            None,
+        )
+        record.fields = {"quality_report": report}
+        PayloadCapFilter().filter(record)
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "Quality report: 12 rows")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(len(entry["fields"]["quality_report"]["空值统计"]), 51)
+
+    def test_file_rotates_by_size_and_by_day(self):
+        with mock.patch.object(DailyRotatingFileHandler, "_today", return_value="20260101"):
+            handler = DailyRotatingFileHandler(self.tmpdir, max_bytes=200, backups=2)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            record = logging.LogRecord("t", logging.INFO, __file__, 1, "x" * 80, None, None)
+            for _ in range(6):
+                handler.handle(record)
+        self.assertTrue((self.tmpdir / "20260101.log.1").exists())
+        self.assertTrue((self.tmpdir / "20260101.log.2").exists())
+        self.assertFalse((self.tmpdir / "20260101.log.3").exists())
+
+        with mock.patch.object(DailyRotatingFileHandler, "_today", return_value="20260102"):
+            handler.handle(record)
+        handler.close()
+        self.assertEqual((self.tmpdir / "20260102.log").read_text(encoding="utf-8"), "x" * 80 + "\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,265 @@
+import importlib.util
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from excelmerger.io_utils import ArrowSidecarWriter, iter_file_chunks, read_file, save_file
+from excelmerger.merger import ExcelMergerCore, concat_aligned, resolve_union_schema
+from excelmerger.progress import MergeCancelled, MergeProgress
+from excelmerger.sampling import sample_file
+from excelmerger import streaming
+from excelmerger.streaming import RowHashDeduplicator, stream_merge
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+class ConcatAlignedTestCase(unittest.TestCase):
+    def test_missing_int_column_stays_integer(self):
+        first = pd.DataFrame({"来源文件": ["a", "a"], "数量": [1, 2]})
+        second = pd.DataFrame({"来源文件": ["b"], "商品名称": ["x"]})
+
+        merged = concat_aligned([first, second])
+
+        self.assertEqual(list(merged.columns), ["来源文件", "数量", "商品名称"])
+        self.assertEqual(str(merged["数量"].dtype), "Int64")
+        self.assertEqual(merged["数量"].tolist()[:2], [1, 2])
+        self.assertTrue(pd.isna(merged["数量"].iloc[2]))
+
+    def test_missing_unsigned_column_stays_unsigned(self):
+        first = pd.DataFrame({"数量": np.array([1, 2], dtype="uint64")})
+        second = pd.DataFrame({"商品名称": ["x"]})
+
+        merged = concat_aligned([first, second])
+
+        self.assertEqual(str(merged["数量"].dtype), "UInt64")
+        self.assertEqual(merged["数量"].tolist()[:2], [1, 2])
+        self.assertTrue(pd.isna(merged["数量"].iloc[2]))
+
+    def test_empty_frame_without_int_column_keeps_int(self):
+        first = pd.DataFrame({"数量": [1, 2]})
+        empty = pd.DataFrame({"商品名称": pd.Series([], dtype=object)})
+
+        merged = concat_aligned([first, empty])
+
+        self.assertEqual(merged["数量"].dtype, np.dtype("int64"))
+        self.assertEqual(merged["数量"].tolist(), [1, 2])
+
+    def test_matches_outer_concat_values(self):
+        first = pd.DataFrame({"a": [1.5, None], "b": ["x", "y"]})
+        second = pd.DataFrame({"b": ["z"], "c": pd.to_datetime(["2024-01-01"])})
+
+        merged = concat_aligned([first, second])
+        expected = pd.concat([first, second], join="outer", ignore_index=True, sort=False)
+
+        pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+
+    def test_schema_resolves_int_and_float_to_float(self):
+        schema = resolve_union_schema(
+            [pd.DataFrame({"数量": [1]}), pd.DataFrame({"数量": [1.5]})]
+        )
+
+        self.assertEqual(str(schema["数量"]), "float64")
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow not installed")
+    def test_arrow_columns_keep_arrow_dtype(self):
+        first = pd.DataFrame({"数量": [1, 2], "备注": [None, None]}).convert_dtypes(
+            dtype_backend="pyarrow"
+        )
+        first["备注"] = first["备注"].astype("null[pyarrow]")
+        second = pd.DataFrame({"数量": [3], "备注": ["x"]}).convert_dtypes(
+            dtype_backend="pyarrow"
+        )
+
+        merged = concat_aligned([first, second])
+
+        self.assertIsInstance(merged["数量"].dtype, pd.ArrowDtype)
+        self.assertIsInstance(merged["备注"].dtype, pd.ArrowDtype)
+        self.assertEqual(merged["备注"].iloc[2], "x")
+
+
+class StreamMergeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(prefix="excelmerger-stream-"))
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+
+    def test_small_chunks_match_in_memory_read(self):
+        source = self.tmpdir / "codes.csv"
+        source.write_text(
+            "code,qty\n000000,1\n000001,2\n000002,3\n000003,\n000004,5\nAB12,6\n",
+            encoding="utf-8",
+        )
+        streamed = self.tmpdir / "streamed.csv"
+        stream_merge(
+            [source],
+            streamed,
+            merger=ExcelMergerCore(),
+            spill_dir=self.tmpdir / "spill",
+            output_format="csv",
+            normalize_columns=False,
+            chunksize=3,
+        )
+
+        expected = read_file(str(source))["codes.csv"]
+        expected.insert(0, "来源文件", "codes")
+        expected.insert(1, "工作表", "codes.csv")
+        in_memory = self.tmpdir / "in_memory.csv"
+        save_file(expected, str(in_memory), "csv")
+
+        self.assertEqual(
+            streamed.read_text(encoding="utf-8-sig"), in_memory.read_text(encoding="utf-8-sig")
+        )
+        self.assertIn("codes,codes.csv,000000,1.0", streamed.read_text(encoding="utf-8-sig"))
+
+    def test_chunked_csv_uses_c_engine_with_sniffed_separator(self):
+        source = self.tmpdir / "semicolon.csv"
+        source.write_text("code;price\n007;1.5\n008;\nX9;2.25\n", encoding="utf-8")
+        reader_info = {}
+        chunks = [
+            chunk for _, chunk in iter_file_chunks(str(source), chunksize=2, reader_info=reader_info)
+        ]
+
+        self.assertEqual(reader_info["engine"], "c")
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks, ignore_index=True), read_file(str(source))["semicolon.csv"]
+        )
+
+
+class SampleFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+
+    def test_xlsx_sample_reaching_last_row_is_not_exact(self):
+        source = self.tmpdir / "rows.xlsx"
+        pd.DataFrame({"id": range(300)}).to_excel(source, index=False)
+
+        # Every row but one is picked, so the last row is almost always read.
+        for seed in range(5):
+            sheet = sample_file(str(source), head_rows=20, sample_rows=279, seed=seed)["Sheet1"]
+            self.assertFalse(sheet["exact"])
+            self.assertEqual(sheet["estimated_rows"], 300)
+            self.assertEqual(len(sheet["frame"]), 299)
+
+    def test_xlsx_sample_stopped_by_time_limit_is_truncated(self):
+        source = self.tmpdir / "rows.xlsx"
+        pd.DataFrame({"id": range(3000)}).to_excel(source, index=False)
+
+        sheet = sample_file(
+            str(source), head_rows=20, sample_rows=100, seed=1, max_seconds=0
+        )["Sheet1"]
+
+        self.assertTrue(sheet["truncated"])
+        self.assertFalse(sheet["exact"])
+        self.assertEqual(sheet["rows_scanned"], 1000)
+        self.assertLess(sheet["frame"]["id"].max(), 1000)
+        self.assertEqual(sheet["estimated_rows"], 3000)
+
+        complete = sample_file(str(source), head_rows=20, sample_rows=100, seed=1)["Sheet1"]
+        self.assertFalse(complete["truncated"])
+        self.assertNotIn("rows_scanned", complete)
+
+
+class MergeProgressTestCase(unittest.TestCase):
+    def test_cancel_check_is_throttled_to_min_interval(self):
+        now = [0.0]
+        checks = []
+        progress = MergeProgress(
+            1,
+            min_interval=0.5,
+            clock=lambda: now[0],
+            cancel_check=lambda: checks.append(now[0]) or False,
+        )
+
+        for _ in range(100):
+            progress.add_rows(10)
+        self.assertEqual(checks, [0.0])
+
+        now[0] = 0.6
+        progress.add_rows(10)
+        progress.checkpoint()
+        self.assertEqual(checks, [0.0, 0.6])
+
+        # Phase changes still check right away.
+        progress.set_phase("concat")
+        self.assertEqual(checks, [0.0, 0.6, 0.6])
+
+    def test_cancel_is_seen_after_the_interval(self):
+        now = [0.0]
+        cancelled = [False]
+        progress = MergeProgress(
+            1, min_interval=0.5, clock=lambda: now[0], cancel_check=lambda: cancelled[0]
+        )
+        progress.add_rows(1)
+        cancelled[0] = True
+        progress.add_rows(1)
+        now[0] = 0.5
+        with self.assertRaises(MergeCancelled):
+            progress.add_rows(1)
+
+
+class RowHashDeduplicatorTestCase(unittest.TestCase):
+    def test_matches_drop_duplicates_across_chunks(self):
+        frame = pd.DataFrame(
+            {
+                "code": pd.Series([1, "1", None, 1, "1", 2, None, 2], dtype=object),
+                "qty": [1, 1, 2, 1, 1, 3, 2, 3],
+            }
+        )
+        deduplicator = RowHashDeduplicator()
+        kept = pd.concat([deduplicator.filter(frame.iloc[i:i + 3]) for i in range(0, 8, 3)])
+
+        # 1 and "1" differ, although pandas hashes both as "1".
+        self.assertEqual(list(kept.index), list(frame.drop_duplicates().index))
+
+    def test_first_hash_collision_keeps_distinct_rows(self):
+        real_row_keys = streaming._row_keys
+
+        def colliding_row_keys(subset):
+            _, second = real_row_keys(subset)
+            return np.zeros(len(subset), dtype=np.uint64), second
+
+        frame = pd.DataFrame({"id": [1, 2, 1, 3, 2, 4], "name": list("abacbd")})
+        deduplicator = RowHashDeduplicator(["id"])
+        with mock.patch.object(streaming, "_row_keys", colliding_row_keys):
+            kept = pd.concat(
+                [deduplicator.filter(frame.iloc[i:i + 2]) for i in range(0, 6, 2)]
+            )
+
+        self.assertEqual(list(kept["id"]), [1, 2, 3, 4])
+
+
+@unittest.skipUnless(HAS_PYARROW, "pyarrow not installed")
+class ArrowSidecarWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+
+    def test_writes_large_frames_in_row_batches(self):
+        import pyarrow as pa
+
+        frame = pd.DataFrame(
+            {
+                "id": range(5),
+                # The first batch holds only nulls; later batches have text.
+                "note": pd.Series([None, None, "x", 1, None], dtype=object),
+            }
+        )
+        path = self.tmpdir / "rows.arrow"
+        with ArrowSidecarWriter(path, batch_rows=2) as sidecar:
+            sidecar.write(frame)
+
+        self.assertTrue(sidecar.complete, sidecar.error)
+        reader = pa.ipc.open_file(str(path))
+        self.assertEqual(reader.num_record_batches, 3)
+        table = reader.read_all()
+        self.assertEqual(table.column("id").to_pylist(), [0, 1, 2, 3, 4])
+        self.assertEqual(table.column("note").to_pylist(), [None, None, "x", "1", None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from web_app.metrics import MetricsStore
+
+
+class MetricsStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(prefix="excelmerger-metrics-"))
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.db_path = self.tmpdir / "tasks.sqlite3"
+
+    def test_processes_share_counters_and_histograms(self):
+        first = MetricsStore(self.db_path)
+        second = MetricsStore(self.db_path)
+        first.inc("excelmerger_merges_total", status="completed", engine="in_memory")
+        second.inc("excelmerger_merges_total", status="completed", engine="in_memory")
+        first.observe("excelmerger_merge_seconds", 0.3, buckets=(0.1, 1), engine="in_memory")
+        second.observe("excelmerger_merge_seconds", 2.0, buckets=(0.1, 1), engine="in_memory")
+        first.flush()
+
+        text = second.render({"excelmerger_queue_depth": [({}, 3)]})
+
+        self.assertIn("# TYPE excelmerger_merges_total counter", text)
+        self.assertIn(
+            'excelmerger_merges_total{engine="in_memory",status="completed"} 2', text
+        )
+        self.assertIn('excelmerger_merge_seconds_bucket{engine="in_memory",le="0.1"} 0', text)
+        self.assertIn('excelmerger_merge_seconds_bucket{engine="in_memory",le="1"} 1', text)
+        self.assertIn('excelmerger_merge_seconds_bucket{engine="in_memory",le="+Inf"} 2', text)
+        self.assertIn('excelmerger_merge_seconds_count{engine="in_memory"} 2', text)
+        self.assertIn("excelmerger_merge_seconds_sum{engine=\"in_memory\"} 2.3", text)
+        self.assertIn("excelmerger_queue_depth 3", text)
+
+    def test_gauges_of_stale_processes_are_dropped(self):
+        store = MetricsStore(self.db_path)
+        store.set_gauge("excelmerger_merge_slots", 2, executor="thread")
+        store.flush()
+        self.assertIn('excelmerger_merge_slots{executor="thread"} 2', store.render())
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE metric_gauges SET updated_at = updated_at - 3600, pid = 0")
+        store.set_gauge("excelmerger_merge_slots", 3, executor="thread")
+        self.assertIn('excelmerger_merge_slots{executor="thread"} 3', store.render())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import logging
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from web_app.memory_budget import MemoryGovernor
+from web_app.scheduler import FairScheduler, QueueFull
+
+
+class FairSchedulerTestCase(unittest.TestCase):
+    def make_scheduler(self, **overrides):
+        options = {
+            "workers": 1,
+            "per_user_limit": 1,
+            "max_queue": 10,
+            "max_user_queue": 10,
+            "logger": logging.getLogger("test-scheduler"),
+        }
+        options.update(overrides)
+        scheduler = FairScheduler(**options)
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def test_users_are_served_round_robin(self):
+        scheduler = self.make_scheduler()
+        scheduler.start()
+        gate = threading.Event()
+        started = threading.Event()
+        order = []
+
+        scheduler.submit("alice", "blocker", lambda: (started.set(), gate.wait()))
+        self.assertTrue(started.wait(5))
+        for i in range(3):
+            scheduler.submit("alice", f"a{i}", order.append, f"a{i}")
+        scheduler.submit("bob", "b0", order.append, "b0")
+        scheduler.submit("carol", "c0", order.append, "c0")
+
+        self.assertEqual(scheduler.position("a0"), 1)
+        self.assertEqual(scheduler.position("c0"), 3)
+        self.assertEqual(scheduler.position("a2"), 5)
+        self.assertIsNone(scheduler.position("missing"))
+
+        gate.set()
+        deadline = time.monotonic() + 5
+        while len(order) < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(order, ["a0", "b0", "c0", "a1", "a2"])
+
+    def test_rejects_when_queue_is_full(self):
+        scheduler = self.make_scheduler(max_queue=3, max_user_queue=2)
+
+        scheduler.submit("alice", "a0", lambda: None)
+        scheduler.submit("alice", "a1", lambda: None)
+        with self.assertRaises(QueueFull) as ctx:
+            scheduler.submit("alice", "a2", lambda: None)
+        self.assertGreaterEqual(ctx.exception.retry_after, 5)
+
+        scheduler.submit("bob", "b0", lambda: None)
+        with self.assertRaises(QueueFull):
+            scheduler.check("carol")
+
+        self.assertTrue(scheduler.discard("a1"))
+        scheduler.check("carol")
+        self.assertEqual(scheduler.queued(), 2)
+
+
+class MemoryGovernorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.db_path = self.tmpdir / "tasks.sqlite3"
+
+    def test_processes_sharing_the_database_share_one_budget(self):
+        # Two governors stand in for two gunicorn workers.
+        first = MemoryGovernor(100, db_path=self.db_path, poll_seconds=0.05)
+        second = MemoryGovernor(100, db_path=self.db_path, poll_seconds=0.05)
+        admitted = threading.Event()
+
+        def run_second():
+            with second.reserve(60):
+                admitted.set()
+
+        with first.reserve(60):
+            self.assertEqual(second.in_use, 60)
+            thread = threading.Thread(target=run_second)
+            thread.start()
+            self.assertFalse(admitted.wait(0.3))
+        self.assertTrue(admitted.wait(2))
+        thread.join()
+        self.assertEqual(first.in_use, 0)
+
+    def test_reservations_of_dead_processes_are_dropped(self):
+        governor = MemoryGovernor(100, db_path=self.db_path, poll_seconds=0.05)
+        child = subprocess.run(
+            [sys.executable, "-c", "import os; print(os.getpid())"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO memory_reservations (host, pid, bytes, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (governor._host, int(child.stdout), 100, time.time()),
+            )
+
+        with governor.reserve(80):
+            self.assertEqual(governor.in_use, 80)
+
+
+if __name__ == "__main__":
+    unittest.main()
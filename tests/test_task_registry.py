@@ -0,0 +1,149 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from web_app.task_registry import TaskRegistry
+
+
+class TaskRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(prefix="excelmerger-registry-"))
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.db_path = self.tmpdir / "tasks.sqlite3"
+
+    def test_updates_are_visible_to_other_instances(self):
+        writer = TaskRegistry(self.db_path)
+        reader = TaskRegistry(self.db_path)
+        writer.save(
+            "task-1",
+            {"status": "queued", "created_at": datetime.now(timezone.utc).isoformat()},
+        )
+
+        writer.update("task-1", status="running")
+
+        self.assertEqual(reader.load("task-1")["status"], "running")
+        self.assertEqual(reader.ids_with_status("running"), ["task-1"])
+        self.assertIsNone(reader.update("missing", status="failed"))
+
+    def test_concurrent_updates_do_not_lose_fields(self):
+        registry = TaskRegistry(self.db_path)
+        registry.save("task-1", {"status": "queued"})
+
+        threads = [
+            threading.Thread(
+                target=lambda i=i: TaskRegistry(self.db_path).update(
+                    "task-1", **{f"field_{i}": i}
+                )
+            )
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        metadata = registry.load("task-1")
+        self.assertEqual(
+            sorted(k for k in metadata if k.startswith("field_")),
+            [f"field_{i}" for i in range(8)],
+        )
+
+    def test_created_before_uses_created_at(self):
+        registry = TaskRegistry(self.db_path)
+        now = datetime.now(timezone.utc)
+        registry.save("old", {"created_at": (now - timedelta(hours=3)).isoformat()})
+        registry.save("new", {"created_at": now.isoformat()})
+
+        self.assertEqual(registry.created_before(now - timedelta(hours=1)), ["old"])
+
+
+    def test_claim_leases_jobs_and_recovers_expired_ones(self):
+        registry = TaskRegistry(self.db_path)
+        now = datetime.now(timezone.utc)
+        registry.save("in-process", {"status": "queued", "created_at": now.isoformat()})
+        registry.save(
+            "job-1",
+            {
+                "status": "queued",
+                "created_at": (now + timedelta(seconds=1)).isoformat(),
+                "job": {"saved_paths": []},
+            },
+        )
+
+        task_id, metadata = registry.claim("worker-a", lease_seconds=60)
+
+        self.assertEqual(task_id, "job-1")
+        self.assertEqual(metadata["attempts"], 1)
+        self.assertIsNone(registry.claim("worker-b", lease_seconds=60))
+        self.assertTrue(registry.renew_lease("job-1", "worker-a", 60))
+        self.assertFalse(registry.renew_lease("job-1", "worker-b", 60))
+
+        registry.update("job-1", lease_expires=0)
+        registry.update("in-process", status="running", lease_expires=0)
+        requeued, failed = registry.recover_expired(max_attempts=3)
+
+        self.assertEqual(requeued, ["job-1"])
+        self.assertEqual(failed, ["in-process"])
+        self.assertEqual(registry.load("job-1")["status"], "queued")
+        self.assertEqual(registry.queue_position("job-1"), 1)
+        self.assertEqual(registry.load("in-process")["status"], "failed")
+
+    def test_queue_position_follows_fair_claim_order(self):
+        registry = TaskRegistry(self.db_path)
+        now = datetime.now(timezone.utc)
+        registry.save("a-running", {"status": "running", "client": "a", "job": {}})
+        for offset, (task_id, client) in enumerate(
+            [("a-1", "a"), ("a-2", "a"), ("b-1", "b"), ("a-3", "a"), ("b-2", "b")]
+        ):
+            registry.save(
+                task_id,
+                {
+                    "status": "queued",
+                    "client": client,
+                    "created_at": (now + timedelta(seconds=offset)).isoformat(),
+                    "job": {"saved_paths": []},
+                },
+            )
+
+        positions = {
+            task_id: registry.queue_position(task_id)
+            for task_id in ("a-1", "a-2", "b-1", "a-3", "b-2")
+        }
+        claimed = [registry.claim("worker-a", lease_seconds=60)[0] for _ in range(5)]
+
+        # b-1 is newer than a-1 but its client has nothing running yet.
+        self.assertEqual(claimed, ["b-1", "a-1", "b-2", "a-2", "a-3"])
+        self.assertEqual(sorted(positions, key=positions.get), claimed)
+        self.assertEqual(positions["b-1"], 1)
+        self.assertIsNone(registry.queue_position("a-running"))
+
+    def test_expired_lease_of_cancelled_task_is_not_requeued(self):
+        registry = TaskRegistry(self.db_path)
+        registry.save(
+            "job-1",
+            {
+                "status": "running",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "job": {"saved_paths": []},
+                "attempts": 1,
+                "lease_owner": "worker-a",
+                "lease_expires": 0,
+                "cancel_requested": True,
+            },
+        )
+
+        requeued, finished = registry.recover_expired(max_attempts=3)
+
+        self.assertEqual(requeued, [])
+        self.assertEqual(finished, ["job-1"])
+        metadata = registry.load("job-1")
+        self.assertEqual(metadata["status"], "cancelled")
+        self.assertNotIn("cancel_requested", metadata)
+        self.assertIn("completed_at", metadata)
+        self.assertIsNone(registry.claim("worker-b", lease_seconds=60))
+
+if __name__ == "__main__":
+    unittest.main()
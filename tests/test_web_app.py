@@ -1,13 +1,26 @@
+import gzip
+import hashlib
+import importlib.util
 import io
 import json
 import os
 import shutil
 import tempfile
+import threading
+import time
 import unittest
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from unittest import mock
 
+import pandas as pd
+
+import web_app.app as web_app_module
 from web_app.app import WebConfig, create_app
+from web_app.memory_budget import MemoryGovernor
+from web_app.merge_worker import run_merge_task
+from web_app.uploads import load_parsed, parsed_cache_path, store_parsed
+from web_app.worker import MergeWorker
 
 
 class WebAppTestCase(unittest.TestCase):
@@ -19,6 +32,13 @@ class WebAppTestCase(unittest.TestCase):
         self.original_password = WebConfig.PASSWORD
         self.original_secret = WebConfig.SECRET_KEY
         self.original_merge_async = getattr(WebConfig, "MERGE_ASYNC", True)
+        self.original_dtype_backend = WebConfig.DTYPE_BACKEND
+        self.original_memory_budget = WebConfig.MEMORY_BUDGET_MB
+        self.original_merge_executor = WebConfig.MERGE_EXECUTOR
+        self.original_merge_workers = WebConfig.MERGE_WORKERS
+        self.original_queue_max = WebConfig.MERGE_QUEUE_MAX
+        self.original_max_file_bytes = WebConfig.MAX_FILE_BYTES
+        self.original_chunk_bytes = WebConfig.UPLOAD_CHUNK_BYTES
 
         WebConfig.UPLOAD_ROOT = self.tmpdir
         WebConfig.USERNAME = "tester"
@@ -32,9 +52,18 @@ class WebAppTestCase(unittest.TestCase):
         WebConfig.PASSWORD = self.original_password
         WebConfig.SECRET_KEY = self.original_secret
         WebConfig.MERGE_ASYNC = self.original_merge_async
+        WebConfig.DTYPE_BACKEND = self.original_dtype_backend
+        WebConfig.MEMORY_BUDGET_MB = self.original_memory_budget
+        WebConfig.MERGE_EXECUTOR = self.original_merge_executor
+        WebConfig.MERGE_WORKERS = self.original_merge_workers
+        WebConfig.MERGE_QUEUE_MAX = self.original_queue_max
+        WebConfig.MAX_FILE_BYTES = self.original_max_file_bytes
+        WebConfig.UPLOAD_CHUNK_BYTES = self.original_chunk_bytes
 
     def make_client(self):
         app = create_app()
+        self.addCleanup(app.extensions["task_janitor"].stop)
+        self.addCleanup(app.extensions["merge_scheduler"].stop)
         app.config.update(TESTING=True)
         client = app.test_client()
         with client.session_transaction() as session:
@@ -117,6 +146,54 @@ class WebAppTestCase(unittest.TestCase):
         self.assertEqual(status_payload["status"], "completed")
         self.assertEqual(status_payload["format"], "csv")
         self.assertIn(f"/download/{task_id}", status_payload["download_url"])
+        progress = status_payload["progress"]
+        self.assertEqual(progress["percent"], 100.0)
+        self.assertEqual(progress["files_done"], 1)
+        self.assertEqual(progress["files_total"], 1)
+        self.assertEqual(progress["rows_read"], 1)
+        self.assertGreater(progress["bytes_written"], 0)
+
+    def test_task_events_are_disabled_by_default(self):
+        _, client = self.make_client()
+
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+        payload = response.get_json()
+        self.assertNotIn("events_url", payload)
+        self.assertEqual(client.get(f"/task/{payload['task_id']}/events").status_code, 404)
+
+    def test_task_events_stream_ends_with_final_status(self):
+        app, client = self.make_client()
+        app.config.update(SSE_ENABLED=True)
+
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+        payload = response.get_json()
+        self.assertIn(f"/task/{payload['task_id']}/events", payload["events_url"])
+
+        stream = client.get(payload["events_url"])
+
+        self.assertEqual(stream.status_code, 200)
+        self.assertEqual(stream.mimetype, "text/event-stream")
+        events = [
+            json.loads(line[len("data: "):])
+            for line in stream.get_data(as_text=True).splitlines()
+            if line.startswith("data: ")
+        ]
+        self.assertEqual(events[-1]["status"], "completed")
+        self.assertIn("download_url", events[-1])
 
     def test_download_uses_custom_filename_with_actual_extension(self):
         _, client = self.make_client()
@@ -183,6 +260,899 @@ class WebAppTestCase(unittest.TestCase):
         )
         download.close()
 
+    @unittest.skipUnless(
+        importlib.util.find_spec("pyarrow"), "pyarrow not installed"
+    )
+    def test_download_supports_range_etag_gzip_and_accel(self):
+        app, client = self.make_client()
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+        url = f"/download/{response.get_json()['task_id']}"
+        self.assertEqual(client.get("/").headers.get("Cache-Control"), "no-store")
+
+        full = client.get(url)
+        body = full.get_data()
+        etag = full.headers["ETag"]
+        self.assertNotIn("no-store", full.headers["Cache-Control"])
+        full.close()
+        partial = client.get(url, headers={"Range": "bytes=5-"})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.get_data(), body[5:])
+        partial.close()
+        self.assertEqual(client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+
+        # The merge wrote the gzip copy; downloads only send it.
+        job_dir = self.tmpdir / url.rsplit("/", 1)[1]
+        self.assertTrue((job_dir / "merged.csv.gz").is_file())
+        compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.get_data()), body)
+        compressed.close()
+
+        # Without a copy, results above the limit are not compressed on request.
+        (job_dir / "merged.csv.gz").unlink()
+        app.config["DOWNLOAD_GZIP_MAX_BYTES"] = 1
+        plain = client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.get_data(), body)
+        plain.close()
+        self.assertFalse((job_dir / "merged.csv.gz").exists())
+
+        app.config["DOWNLOAD_ACCEL_PREFIX"] = "/_results/"
+        accel = client.get(url)
+        self.assertTrue(accel.headers["X-Accel-Redirect"].startswith("/_results/"))
+        self.assertTrue(accel.headers["X-Accel-Redirect"].endswith("/merged.csv"))
+        self.assertEqual(accel.get_data(), b"")
+
+    def test_metrics_report_merge_phases_and_requests(self):
+        app, client = self.make_client()
+        client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+
+        anonymous = app.test_client()
+        self.assertEqual(anonymous.get("/metrics").status_code, 401)
+        app.config["METRICS_TOKEN"] = "scrape-token"
+        response = anonymous.get(
+            "/metrics", headers={"Authorization": "Bearer scrape-token"}
+        )
+        text = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('excelmerger_merges_total{engine="in_memory",status="completed"} 1', text)
+        self.assertIn('excelmerger_merge_phase_seconds_count{phase="write"} 1', text)
+        self.assertIn('excelmerger_parse_seconds_count{format="csv"} 1', text)
+        self.assertIn('excelmerger_tasks{status="completed"} 1', text)
+        self.assertIn("excelmerger_queue_depth 0", text)
+        self.assertIn(
+            'excelmerger_http_requests_total{method="POST",route="/merge",status="202"} 1',
+            text,
+        )
+
+    def test_task_profile_records_phases_files_and_capture(self):
+        app, client = self.make_client()
+        app.config["MERGE_PROFILER"] = "cprofile"
+        response = client.post(
+            "/merge",
+            data={
+                "files": [
+                    (io.BytesIO(b"col1,col2\n1,2\n3,4\n"), "first.csv"),
+                    (io.BytesIO(b"col1,col3\n5,6\n"), "second.csv"),
+                ],
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+        payload = client.get(response.get_json()["status_url"]).get_json()
+        self.assertEqual(payload["status"], "completed")
+
+        profile_response = client.get(payload["profile_url"])
+        self.assertEqual(profile_response.status_code, 200)
+        body = profile_response.get_json()
+        profile = body["profile"]
+        self.assertEqual(profile["engine"], "in_memory")
+        self.assertEqual(profile["rows_read"], 3)
+        self.assertGreater(profile["bytes_written"], 0)
+        self.assertGreater(profile["peak_rss_bytes"], 0)
+        self.assertIn("write", profile["phases"])
+        self.assertIn("cpu_seconds", profile["phases"]["read"])
+        first = profile["files"][0]
+        self.assertEqual(first["name"], "first.csv")
+        self.assertEqual(first["rows"], 2)
+        self.assertEqual(first["sheets"], [{"name": "first.csv", "rows": 2, "columns": 2}])
+        self.assertEqual(first["reader"]["engine"], "python")
+        self.assertEqual(first["size_bytes"], len(b"col1,col2\n1,2\n3,4\n"))
+        self.assertNotIn("started", first)
+
+        capture = client.get(body["capture_url"])
+        self.assertEqual(capture.status_code, 200)
+        self.assertGreater(len(capture.get_data()), 0)
+        capture.close()
+        self.assertEqual(client.get("/task/missing/profile").status_code, 404)
+
+    def test_api_merges_local_files_with_token_and_wait(self):
+        WebConfig.MERGE_ASYNC = True
+        app, _ = self.make_client()
+        shared = self.tmpdir / "shared"
+        shared.mkdir()
+        (shared / "first.csv").write_text("col1,col2\n1,2\n", encoding="utf-8")
+        (shared / "second.csv").write_text("col1,col2\n3,4\n", encoding="utf-8")
+        app.config.update(API_TOKENS="etl:api-token", API_LOCAL_ROOTS=str(shared))
+        client = app.test_client()
+        auth = {"Authorization": "Bearer api-token"}
+
+        self.assertEqual(client.post("/api/v1/merges", json={}).status_code, 401)
+        outside = client.post(
+            "/api/v1/merges",
+            json={"paths": [str(self.tmpdir / "tasks.sqlite3")]},
+            headers=auth,
+        )
+        self.assertEqual(outside.status_code, 400)
+
+        response = client.post(
+            "/api/v1/merges",
+            json={
+                "paths": [str(shared / "first.csv"), str(shared / "second.csv")],
+                "options": {"output_format": "csv", "remove_duplicates": True},
+                "wait": 30,
+            },
+            headers=auth,
+        )
+        payload = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(payload["status"], "completed")
+        self.assertEqual(payload["profile"]["rows_read"], 2)
+        self.assertEqual(response.headers["Location"], payload["status_url"])
+        self.assertNotIn("download_url", payload)
+
+        status = client.get(payload["status_url"], headers=auth).get_json()
+        self.assertEqual(status["task_id"], payload["task_id"])
+        result = client.get(payload["result_url"], headers=auth)
+        lines = result.get_data(as_text=True).strip().splitlines()
+        result.close()
+        self.assertEqual(lines[1:], ["first,first.csv,1,2", "second,second.csv,3,4"])
+        self.assertTrue((shared / "first.csv").exists())
+
+        upload = client.post(
+            "/api/v1/merges",
+            data={
+                "files": (io.BytesIO(b"col1\n5\n"), "third.csv"),
+                "output_format": "csv",
+                "wait": "30",
+            },
+            content_type="multipart/form-data",
+            headers=auth,
+        )
+        self.assertEqual(upload.get_json()["status"], "completed")
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow not installed")
+    def test_result_rows_are_paged_from_sidecar(self):
+        app, client = self.make_client()
+        body = "id,name\n" + "".join(f"{i},n{i}\n" for i in range(250))
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(body.encode("utf-8")), "big.csv"),
+                "output_format": "xlsx",
+            },
+            content_type="multipart/form-data",
+        )
+        status = client.get(response.get_json()["status_url"]).get_json()
+        rows_url = status["rows_url"]
+
+        page = client.get(f"{rows_url}?offset=240&limit=20&columns=id,name").get_json()
+        self.assertEqual(page["total_rows"], 250)
+        self.assertEqual(page["columns"], ["id", "name"])
+        self.assertEqual(page["rows"][0], [240, "n240"])
+        self.assertEqual(len(page["rows"]), 10)
+
+        first = client.get(rows_url).get_json()
+        self.assertEqual(first["columns"], ["来源文件", "工作表", "id", "name"])
+        self.assertEqual(len(first["rows"]), 100)
+        self.assertEqual(client.get(f"{rows_url}?columns=missing").status_code, 400)
+
+    def test_merge_with_arrow_backend(self):
+        WebConfig.DTYPE_BACKEND = "arrow"
+        _, client = self.make_client()
+
+        response = client.post(
+            "/merge",
+            data={
+                "files": [
+                    (io.BytesIO(b"col1,col2\n1,a\n1,a\n"), "first.csv"),
+                    (io.BytesIO(b"col1,col3\n2,b\n"), "second.csv"),
+                ],
+                "remove_duplicates": "on",
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+
+        payload = response.get_json()
+        self.assertEqual(payload["status"], "completed")
+        download = client.get(f"/download/{payload['task_id']}")
+        lines = download.get_data(as_text=True).strip().splitlines()
+        download.close()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0].lstrip("\ufeff"), "来源文件,工作表,col1,col2,col3")
+        self.assertEqual(lines[1], "first,first.csv,1,a,")
+
+    def test_oversized_task_uses_chunked_merge(self):
+        WebConfig.MEMORY_BUDGET_MB = 0.001
+        app, client = self.make_client()
+        workbook = io.BytesIO()
+        pd.DataFrame({"数量": [1, 2], "名称": ["a", "b"]}).to_excel(
+            workbook, index=False
+        )
+        workbook.seek(0)
+
+        response = client.post(
+            "/merge",
+            data={
+                "files": [
+                    (workbook, "first.xlsx"),
+                    (io.BytesIO(b"name,qty\nb,2\nb,2\n"), "second.csv"),
+                ],
+                "remove_duplicates": "on",
+                "output_format": "xlsx",
+            },
+            content_type="multipart/form-data",
+        )
+
+        payload = response.get_json()
+        self.assertEqual(payload["status"], "completed")
+        metadata = app.extensions["task_registry"].load(payload["task_id"])
+        self.assertEqual(metadata["memory_mode"], "chunked")
+        self.assertGreater(metadata["memory_estimate_bytes"], 0)
+        self.assertIn("peak_rss_bytes", metadata)
+
+        download = client.get(f"/download/{payload['task_id']}")
+        merged = pd.read_excel(io.BytesIO(download.get_data()))
+        download.close()
+        self.assertEqual(len(merged), 3)
+        self.assertEqual(merged["数量"].tolist()[:2], [1, 2])
+
+        if importlib.util.find_spec("pyarrow"):
+            rows_url = f"/task/{payload['task_id']}/rows?offset=1&limit=5&columns=数量"
+            page = client.get(rows_url).get_json()
+            self.assertEqual(page["total_rows"], 3)
+            self.assertEqual(page["rows"], [[2], [None]])
+
+    def test_merge_runs_in_process_pool(self):
+        WebConfig.MERGE_EXECUTOR = "process"
+        WebConfig.MERGE_WORKERS = 1
+        app, client = self.make_client()
+        self.addCleanup(app.extensions["merge_pool"].shutdown)
+
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+
+        payload = response.get_json()
+        self.assertEqual(payload["status"], "completed")
+        metadata = app.extensions["task_registry"].load(payload["task_id"])
+        self.assertEqual(metadata["progress"]["percent"], 100.0)
+        download = client.get(f"/download/{payload['task_id']}")
+        lines = download.get_data(as_text=True).strip().splitlines()
+        download.close()
+        self.assertEqual(lines[1], "sample,sample.csv,1,2")
+
+    def test_merge_rejected_with_retry_hint_when_queue_full(self):
+        WebConfig.MERGE_ASYNC = True
+        WebConfig.MERGE_QUEUE_MAX = 0
+        _, client = self.make_client()
+
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(response.get_json()["ok"])
+        self.assertGreater(int(response.headers["Retry-After"]), 0)
+        self.assertEqual(
+            [p for p in self.tmpdir.iterdir() if p.is_dir()], []
+        )
+
+    def test_upload_hash_is_recorded_and_file_limit_enforced(self):
+        app, client = self.make_client()
+        content = b"col1,col2\n1,2\n"
+
+        response = client.post(
+            "/merge",
+            data={"files": (io.BytesIO(content), "sample.csv"), "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        metadata = app.extensions["task_registry"].load(response.get_json()["task_id"])
+        self.assertEqual(
+            metadata["inputs"],
+            [
+                {
+                    "name": "sample.csv",
+                    "size": len(content),
+                    "sha256": hashlib.sha256(content).hexdigest(),
+                }
+            ],
+        )
+
+        WebConfig.MAX_FILE_BYTES = 8
+        app, client = self.make_client()
+        response = client.post(
+            "/merge",
+            data={"files": (io.BytesIO(content), "big.csv"), "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(list(self.tmpdir.glob("*/big.csv*")), [])
+
+    def test_merge_reuses_inspect_upload_session(self):
+        _, client = self.make_client()
+
+        inspect = client.post(
+            "/inspect",
+            data={"files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv")},
+            content_type="multipart/form-data",
+        )
+        upload_id = inspect.get_json()["upload_id"]
+        self.assertTrue((self.tmpdir / upload_id / "sample.csv").exists())
+        session = client.get(f"/upload/{upload_id}").get_json()
+        self.assertEqual(session["files"][0]["name"], "sample.csv")
+
+        response = client.post(
+            "/merge",
+            data={"upload_id": upload_id, "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        payload = response.get_json()
+        self.assertEqual(payload["status"], "completed")
+        job_dir = self.tmpdir / payload["task_id"]
+        self.assertTrue(list(job_dir.glob(".parsed/sample.csv.*.pkl")))
+        download = client.get(f"/download/{payload['task_id']}")
+        self.assertIn("sample,sample.csv,1,2", download.get_data(as_text=True))
+        download.close()
+
+        expired = client.post(
+            "/merge",
+            data={"upload_id": "missing", "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(expired.status_code, 410)
+
+    def test_inspect_samples_large_files(self):
+        app, client = self.make_client()
+        app.config.update(
+            INSPECT_SAMPLE_THRESHOLD_BYTES=1024, INSPECT_HEAD_ROWS=50, INSPECT_SAMPLE_ROWS=200
+        )
+        frame = pd.DataFrame(
+            {
+                "id": range(5000),
+                "amount": [i * 0.5 for i in range(5000)],
+                "note": ["x" if i % 2 else None for i in range(5000)],
+            }
+        )
+        csv_bytes = frame.to_csv(index=False).encode("utf-8")
+        xlsx_bytes = io.BytesIO()
+        frame.to_excel(xlsx_bytes, index=False)
+        xlsx_bytes.seek(0)
+
+        response = client.post(
+            "/inspect",
+            data={
+                "files": [
+                    (io.BytesIO(csv_bytes), "big.csv"),
+                    (xlsx_bytes, "big.xlsx"),
+                    (io.BytesIO(b"col1\n1\n"), "small.csv"),
+                ]
+            },
+            content_type="multipart/form-data",
+        )
+        payload = response.get_json()
+        self.assertTrue(payload["ok"], payload)
+        previews = {p["file"]: p for p in payload["previews"]}
+
+        for name in ("big.csv", "big.xlsx"):
+            preview = previews[name]
+            self.assertTrue(preview["sampled"])
+            self.assertAlmostEqual(preview["row_count"], 5000, delta=500)
+            stats = preview["column_stats"]
+            self.assertEqual(stats["id"]["type"], "integer")
+            self.assertEqual(stats["amount"]["type"], "float")
+            self.assertAlmostEqual(stats["note"]["null_rate"], 0.5, delta=0.15)
+        self.assertEqual(previews["big.xlsx"]["row_count"], 5000)
+        self.assertFalse(previews["small.csv"]["sampled"])
+        self.assertEqual(previews["small.csv"]["row_count"], 1)
+        # Sampled files are not cached as parsed frames for the merge.
+        job_dir = self.tmpdir / payload["upload_id"]
+        self.assertEqual(
+            sorted(p.name.split(".")[0] for p in job_dir.glob(".parsed/*.pkl")), ["small"]
+        )
+
+    def test_inspect_flags_xlsx_sample_cut_short_by_time_limit(self):
+        app, client = self.make_client()
+        app.config.update(
+            INSPECT_SAMPLE_THRESHOLD_BYTES=1024, INSPECT_HEAD_ROWS=50, INSPECT_SAMPLE_ROWS=200
+        )
+        xlsx_bytes = io.BytesIO()
+        pd.DataFrame({"id": range(3000)}).to_excel(xlsx_bytes, index=False)
+        xlsx_bytes.seek(0)
+        original_sample_file = web_app_module.sample_file
+
+        def sample_without_time(*args, **kwargs):
+            return original_sample_file(*args, **kwargs, max_seconds=0)
+
+        with mock.patch.object(web_app_module, "sample_file", sample_without_time):
+            response = client.post(
+                "/inspect",
+                data={"files": [(xlsx_bytes, "big.xlsx")]},
+                content_type="multipart/form-data",
+            )
+
+        preview = response.get_json()["previews"][0]
+        self.assertTrue(preview["sampled"])
+        self.assertTrue(preview["sample_truncated"])
+        self.assertEqual(preview["sample_rows_scanned"], 1000)
+        self.assertEqual(preview["row_count"], 3000)
+
+    def test_inspect_json_nulls_non_finite_values_and_gzips(self):
+        app, client = self.make_client()
+        app.config.update(JSON_GZIP_MIN_BYTES=64)
+        if importlib.util.find_spec("orjson") and app.config["JSON_ENCODER"] != "std":
+            self.assertEqual(type(app.json).__name__, "OrjsonProvider")
+
+        response = client.post(
+            "/inspect",
+            data={"files": (io.BytesIO(b"a,b,when\n1,inf,2026-01-02\n,-inf,\n"), "edge.csv")},
+            content_type="multipart/form-data",
+            headers={"Accept-Encoding": "gzip"},
+        )
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        payload = json.loads(gzip.decompress(response.get_data()))
+        rows = payload["previews"][0]["rows"]
+        self.assertEqual(rows[0]["a"], 1.0)
+        self.assertIsNone(rows[0]["b"])
+        self.assertIsNone(rows[1]["a"])
+        self.assertIsNone(rows[1]["b"])
+        self.assertIsNone(rows[1]["when"])
+
+        plain = client.get(f"/upload/{payload['upload_id']}")
+        self.assertNotIn("Content-Encoding", plain.headers)
+
+    def test_inspect_stores_date_cells_as_iso_strings(self):
+        _, client = self.make_client()
+        workbook = io.BytesIO()
+        pd.DataFrame(
+            {
+                "id": [1, 2],
+                "when": [pd.Timestamp("2026-01-02"), pd.Timestamp("2026-03-04 05:06:07")],
+                pd.Timestamp("2026-12-31"): ["a", "b"],
+            }
+        ).to_excel(workbook, index=False)
+        workbook.seek(0)
+
+        response = client.post(
+            "/inspect",
+            data={"files": (workbook, "dates.xlsx")},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        payload = response.get_json()
+        self.assertEqual(payload["pending"], [])
+        preview = payload["previews"][0]
+        self.assertEqual(preview["rows"][0]["when"], "2026-01-02T00:00:00")
+        self.assertEqual(preview["rows"][1]["when"], "2026-03-04T05:06:07")
+        self.assertIn("2026-12-31 00:00:00", preview["columns"])
+        self.assertEqual(preview["rows"][0]["2026-12-31 00:00:00"], "a")
+
+        session = client.get(f"/upload/{payload['upload_id']}").get_json()
+        self.assertEqual(session["previews"][0]["rows"], preview["rows"])
+
+    def test_inspect_records_error_when_result_cannot_be_stored(self):
+        _, client = self.make_client()
+        workbook = io.BytesIO()
+        pd.DataFrame({"id": [1], "when": [pd.Timestamp("2026-01-02")]}).to_excel(
+            workbook, index=False
+        )
+        workbook.seek(0)
+
+        # Raw records keep pd.Timestamp values, which json.dumps rejects.
+        def raw_records(df):
+            return df.to_dict(orient="records")
+
+        with mock.patch.object(web_app_module, "frame_records", raw_records):
+            response = client.post(
+                "/inspect",
+                data={
+                    "files": [
+                        (workbook, "dates.xlsx"),
+                        (io.BytesIO(b"col1,col2\n1,2\n"), "plain.csv"),
+                    ]
+                },
+                content_type="multipart/form-data",
+            )
+        payload = response.get_json()
+        self.assertEqual(response.status_code, 200, payload)
+        self.assertEqual(payload["pending"], [])
+        self.assertEqual([e["file"] for e in payload["errors"]], ["dates.xlsx"])
+        self.assertEqual([p["file"] for p in payload["previews"]], ["plain.csv"])
+
+        session = client.get(f"/upload/{payload['upload_id']}").get_json()
+        self.assertEqual(session["pending"], [])
+        self.assertEqual([e["file"] for e in session["errors"]], ["dates.xlsx"])
+
+    def test_inspect_returns_pending_files_after_time_budget(self):
+        app, client = self.make_client()
+        app.config.update(INSPECT_TIME_BUDGET_SECONDS=0.3)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        original_read_file = web_app_module.read_file
+
+        def slow_read_file(path, *args, **kwargs):
+            if Path(path).name == "slow.csv":
+                release.wait(10)
+            return original_read_file(path, *args, **kwargs)
+
+        with mock.patch.object(web_app_module, "read_file", slow_read_file):
+            response = client.post(
+                "/inspect",
+                data={
+                    "files": [
+                        (io.BytesIO(b"fast_col,other\n1,2\n"), "fast.csv"),
+                        (io.BytesIO(b"slow_col,other\n3,4\n"), "slow.csv"),
+                        (io.BytesIO(b"\x00\x01"), "broken.xlsx"),
+                    ]
+                },
+                content_type="multipart/form-data",
+            )
+            payload = response.get_json()
+            self.assertTrue(payload["ok"], payload)
+            self.assertEqual(payload["pending"], ["slow.csv"])
+            self.assertEqual([p["file"] for p in payload["previews"]], ["fast.csv"])
+            self.assertEqual([e["file"] for e in payload["errors"]], ["broken.xlsx"])
+
+            release.set()
+            session = payload
+            for _ in range(50):
+                session = client.get(f"/upload/{payload['upload_id']}").get_json()
+                if not session["pending"]:
+                    break
+                time.sleep(0.05)
+        self.assertEqual(session["pending"], [])
+        self.assertEqual(
+            [p["file"] for p in session["previews"]], ["fast.csv", "slow.csv"]
+        )
+        self.assertIn("slow_col", [c["name"] for c in session["columns"]])
+
+    def test_storage_quota_evicts_least_recently_downloaded_results(self):
+        app, client = self.make_client()
+        csv_bytes = b"a,b\n" + b"".join(b"%d,%d\n" % (i, i * 7) for i in range(2000))
+
+        def merge(name):
+            response = client.post(
+                "/merge",
+                data={"files": (io.BytesIO(csv_bytes), name), "output_format": "csv"},
+                content_type="multipart/form-data",
+            )
+            self.assertEqual(response.get_json()["status"], "completed")
+            return response.get_json()["task_id"]
+
+        downloaded = merge("first.csv")
+        idle = merge("second.csv")
+        client.get(f"/download/{downloaded}").close()
+
+        storage = app.extensions["storage"]
+        storage.scan_seconds = 0
+        storage.min_free_bytes = 0
+        storage.quota_bytes = storage.usage()["used_bytes"] + 10
+        response = client.post(
+            "/inspect",
+            data={"files": (io.BytesIO(b"col1,col2\n1,2\n"), "small.csv")},
+            content_type="multipart/form-data",
+        )
+        self.assertTrue(response.get_json()["ok"])
+        self.assertFalse((self.tmpdir / idle).exists())
+        self.assertEqual(client.get(f"/task/{idle}").status_code, 404)
+        self.assertTrue((self.tmpdir / downloaded).exists())
+
+        storage.quota_bytes = 1024
+        rejected = client.post(
+            "/merge",
+            data={"files": (io.BytesIO(csv_bytes), "third.csv"), "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(rejected.status_code, 507)
+        # Nothing is evicted when the request would not fit anyway.
+        self.assertTrue((self.tmpdir / downloaded).exists())
+
+    def test_merge_reserves_room_for_its_result(self):
+        app, client = self.make_client()
+        storage = app.extensions["storage"]
+        # Storage limits are off unless configured.
+        self.assertFalse(storage.enabled)
+
+        csv_bytes = b"a,b\n" + b"".join(b"%d,%d\n" % (i, i * 7) for i in range(2000))
+        storage.scan_seconds = 0
+        # The upload alone fits, the upload plus a result of similar size does not.
+        storage.quota_bytes = int(len(csv_bytes) * 1.5)
+        response = client.post(
+            "/merge",
+            data={"files": (io.BytesIO(csv_bytes), "big.csv"), "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(response.status_code, 507)
+
+        storage.quota_bytes = len(csv_bytes) * 3
+        response = client.post(
+            "/merge",
+            data={"files": (io.BytesIO(csv_bytes), "big.csv"), "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(response.get_json()["status"], "completed")
+
+    def test_parsed_cache_write_is_atomic(self):
+        upload = self.tmpdir / "sample.csv"
+        upload.write_text("col1,col2\n1,2\n", encoding="utf-8")
+        sheets = {"sample.csv": pd.DataFrame({"col1": [1], "col2": [2]})}
+        store_parsed(upload, None, sheets)
+        cache_dir = parsed_cache_path(upload, None).parent
+
+        # A failed rewrite leaves the previous cache and no temporary file.
+        with mock.patch("web_app.uploads.pickle.dump", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                store_parsed(upload, None, {"sample.csv": pd.DataFrame()})
+        self.assertEqual([p.name for p in cache_dir.iterdir()], ["sample.csv.numpy.pkl"])
+        pd.testing.assert_frame_equal(
+            load_parsed(upload, None)["sample.csv"], sheets["sample.csv"]
+        )
+
+    def test_chunked_upload_resumes_and_feeds_merge(self):
+        WebConfig.UPLOAD_CHUNK_BYTES = 8
+        _, client = self.make_client()
+        content = b"col1,col2\n1,2\n3,4\n"
+        chunks = [content[i:i + 8] for i in range(0, len(content), 8)]
+
+        init = client.post(
+            "/upload", json={"files": [{"name": "sample.csv", "size": len(content)}]}
+        )
+        self.assertEqual(init.status_code, 201)
+        upload_id = init.get_json()["upload_id"]
+        chunk_url = f"/upload/{upload_id}/files/0"
+
+        # Out of order, with one corrupted chunk that must be sent again.
+        self.assertTrue(client.put(f"{chunk_url}?offset=16", data=chunks[2]).get_json()["ok"])
+        bad = client.put(
+            f"{chunk_url}?offset=0",
+            data=chunks[0],
+            headers={"X-Chunk-SHA256": hashlib.sha256(b"other").hexdigest()},
+        )
+        self.assertEqual(bad.status_code, 400)
+        early = client.post(f"/upload/{upload_id}/finalize", json={})
+        self.assertEqual(early.get_json()["missing"], {"sample.csv": [0, 1]})
+
+        # Resume: upload only what the server has not recorded yet.
+        state = client.get(f"/upload/{upload_id}").get_json()
+        self.assertEqual(state["files"][0]["received"], [2])
+        for index in (0, 1):
+            client.put(f"{chunk_url}?offset={index * 8}", data=chunks[index])
+
+        digest = hashlib.sha256(content).hexdigest()
+        final = client.post(
+            f"/upload/{upload_id}/finalize", json={"sha256": {"sample.csv": digest}}
+        )
+        self.assertEqual(final.get_json()["files"][0]["sha256"], digest)
+        self.assertEqual((self.tmpdir / upload_id / "sample.csv").read_bytes(), content)
+
+        inspect = client.post("/inspect", data={"upload_id": upload_id})
+        self.assertIn("col1", [c["name"] for c in inspect.get_json()["columns"]])
+        response = client.post(
+            "/merge",
+            data={"upload_id": upload_id, "output_format": "csv"},
+            content_type="multipart/form-data",
+        )
+        self.assertEqual(response.get_json()["status"], "completed")
+
+    def test_identical_merge_reuses_completed_result(self):
+        app, client = self.make_client()
+        registry = app.extensions["task_registry"]
+
+        def merge(output_format="csv"):
+            response = client.post(
+                "/merge",
+                data={
+                    "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                    "output_format": output_format,
+                },
+                content_type="multipart/form-data",
+            )
+            return response.get_json()["task_id"]
+
+        first = merge()
+        second = merge()
+        self.assertEqual(registry.load(second)["cached_from"], first)
+        self.assertTrue(client.get(f"/task/{second}").get_json()["cached"])
+        self.assertEqual(
+            (self.tmpdir / first / "merged.csv").stat().st_ino,
+            (self.tmpdir / second / "merged.csv").stat().st_ino,
+        )
+        self.assertEqual(
+            (self.tmpdir / first / "merged.csv.gz").stat().st_ino,
+            (self.tmpdir / second / "merged.csv.gz").stat().st_ino,
+        )
+        self.assertFalse((self.tmpdir / second / "sample.csv").exists())
+
+        # Different options mean a different result.
+        third = merge("xlsx")
+        self.assertNotIn("cached_from", registry.load(third))
+
+    def test_api_wait_is_capped_below_worker_timeout(self):
+        self.assertLess(WebConfig.API_MAX_WAIT_SECONDS, 30)
+        app, _ = self.make_client()
+        app.config.update(API_TOKENS="etl:api-token", API_MAX_WAIT_SECONDS=0.2)
+        app.extensions["task_registry"].save(
+            "waiting-task",
+            {"status": "queued", "created_at": datetime.now(timezone.utc).isoformat()},
+        )
+        client = app.test_client()
+
+        started = time.monotonic()
+        response = client.get(
+            "/api/v1/merges/waiting-task?wait=300",
+            headers={"Authorization": "Bearer api-token"},
+        )
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.get_json()["status"], "queued")
+
+    def test_cancel_queued_task_clears_job_dir(self):
+        app, client = self.make_client()
+        registry = app.extensions["task_registry"]
+        job_dir = self.tmpdir / "queued-task"
+        job_dir.mkdir()
+        (job_dir / "upload.csv").write_text("a\n1\n", encoding="utf-8")
+        registry.save(
+            "queued-task",
+            {"status": "queued", "created_at": datetime.now(timezone.utc).isoformat()},
+        )
+
+        response = client.post("/task/queued-task/cancel")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["status"], "cancelled")
+        self.assertEqual(list(job_dir.iterdir()), [])
+        self.assertEqual(client.post("/task/queued-task/cancel").status_code, 200)
+
+        registry.save("done-task", {"status": "completed"})
+        self.assertEqual(client.post("/task/done-task/cancel").status_code, 409)
+        self.assertEqual(client.post("/task/missing/cancel").status_code, 404)
+
+    def test_running_task_stops_at_checkpoint_when_cancelled(self):
+        app, _ = self.make_client()
+        registry = app.extensions["task_registry"]
+        job_dir = self.tmpdir / "running-task"
+        job_dir.mkdir()
+        upload = job_dir / "sample.csv"
+        upload.write_text("col1\n1\n", encoding="utf-8")
+        registry.save("running-task", {"status": "running", "cancel_requested": True})
+
+        run_merge_task(
+            "running-task",
+            [upload],
+            task_db_path=str(registry.db_path),
+            job_dir=str(job_dir),
+            dtype_backend="numpy",
+            stream_chunk_rows=1000,
+            normalize_columns=True,
+            enable_fuzzy=False,
+            remove_duplicates=False,
+            smart_dedup=False,
+            dedup_keys=[],
+            exclude_columns=set(),
+            output_format="csv",
+        )
+
+        self.assertEqual(registry.load("running-task")["status"], "cancelled")
+        self.assertEqual(list(job_dir.iterdir()), [])
+
+    def test_queue_mode_hands_tasks_to_worker_daemon(self):
+        WebConfig.MERGE_EXECUTOR = "queue"
+        app, client = self.make_client()
+
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+        payload = response.get_json()
+        self.assertEqual(payload["status"], "queued")
+        self.assertEqual(client.get(payload["status_url"]).get_json()["queue_position"], 1)
+
+        worker = MergeWorker(app.extensions["task_registry"], concurrency=1)
+        self.assertTrue(worker.run_one())
+        self.assertFalse(worker.run_one())
+
+        status = client.get(payload["status_url"]).get_json()
+        self.assertEqual(status["status"], "completed")
+        download = client.get(status["download_url"])
+        self.assertIn("sample,sample.csv,1,2", download.get_data(as_text=True))
+        download.close()
+
+    def test_worker_returns_claimed_task_when_memory_budget_is_full(self):
+        WebConfig.MERGE_EXECUTOR = "queue"
+        app, client = self.make_client()
+        response = client.post(
+            "/merge",
+            data={
+                "files": (io.BytesIO(b"col1,col2\n1,2\n"), "sample.csv"),
+                "output_format": "csv",
+            },
+            content_type="multipart/form-data",
+        )
+        status_url = response.get_json()["status_url"]
+        task_id = response.get_json()["task_id"]
+        registry = app.extensions["task_registry"]
+
+        with mock.patch.object(WebConfig, "WORKER_POLL_SECONDS", 0.05):
+            worker = MergeWorker(registry, concurrency=1)
+            # Another process holds the whole shared budget.
+            with MemoryGovernor(worker.governor.budget_bytes, db_path=registry.db_path).reserve(
+                worker.governor.budget_bytes
+            ):
+                self.assertFalse(worker.run_one())
+
+                metadata = registry.load(task_id)
+                self.assertEqual(metadata["status"], "queued")
+                self.assertEqual(metadata["attempts"], 0)
+                self.assertNotIn("lease_owner", metadata)
+                self.assertEqual(client.get(status_url).get_json()["queue_position"], 1)
+
+            self.assertTrue(worker.run_one())
+        self.assertEqual(client.get(status_url).get_json()["status"], "completed")
+        self.assertEqual(worker.governor.in_use, 0)
+
+    def test_janitor_expires_tasks_in_background(self):
+        app, _ = self.make_client()
+        janitor = app.extensions["task_janitor"]
+        expired_dir = self.tmpdir / "expired-task"
+        active_dir = self.tmpdir / "active-task"
+        expired_dir.mkdir()
+        active_dir.mkdir()
+        old_timestamp = (
+            datetime.now(timezone.utc) - timedelta(minutes=240)
+        ).timestamp()
+        os.utime(expired_dir, (old_timestamp, old_timestamp))
+
+        janitor.reconcile()
+
+        deadline = time.monotonic() + 5
+        while expired_dir.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(expired_dir.exists())
+        self.assertTrue(active_dir.exists())
+        self.assertEqual(janitor.pending(), 1)
+
     def test_cleanup_temp_only_removes_expired_jobs(self):
         _, client = self.make_client()
         active_dir = self.tmpdir / "active-task"
@@ -1,5 +1,13 @@
 """Web app package for excel_webdatamerger."""
 
-from .app import create_app
-
 __all__ = ["create_app"]
+
+
+def __getattr__(name):
+    # Imported lazily so merge worker processes that import
+    # web_app.merge_worker do not build a Flask app.
+    if name == "create_app":
+        from .app import create_app
+
+        return create_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,36 +1,82 @@
 """Flask web entrypoint for excel_webdatamerger."""
 from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+import hmac
 import json
 import re
 import os
 import shutil
-import threading
+import socket
+import sqlite3
+import time
 import traceback
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import quote, urlparse
 from uuid import uuid4
 import math
+import multiprocessing
 
-import pandas as pd
 from flask import (
     Flask,
+    Response,
+    g,
     jsonify,
     redirect,
     render_template,
     request,
     send_file,
     session,
+    stream_with_context,
     url_for,
 )
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from excelmerger.config_manager import ConfigManager
-from excelmerger.io_utils import read_file, save_file
+from excelmerger.io_utils import read_file
 from excelmerger.logger import setup_logger
 from excelmerger.merger import ExcelMergerCore
+from excelmerger.sampling import column_profile, sample_file
 from .config import WebConfig
+from .downloads import fresh_gzip_variant, gzip_variant, set_attachment
+from .janitor import TaskJanitor
+from .json_response import frame_records, gzip_json_response, json_provider_class
+from .storage import StorageManager
+from .scheduler import FairScheduler, QueueFull, estimate_retry_after
+from .merge_worker import (
+    MERGE_EXECUTORS,
+    MergeProcessPool,
+    resolve_merge_workers,
+    run_merge_task,
+)
+from .result_cache import merge_result_key
+from .result_rows import read_result_rows
+from .metrics import MetricsStore
+from .profiling import PROFILER_CAPTURE_FILES
+from .task_events import TaskEventBus
+from .task_registry import LeaseHeartbeat, TaskRegistry
+from .uploads import (
+    PARSED_CACHE_DIR,
+    ChunkRejected,
+    UploadTooLarge,
+    UploadWriter,
+    allocate_partial,
+    chunk_count,
+    file_sha256,
+    link_or_copy,
+    parsed_cache_path,
+    partial_path,
+    store_parsed,
+    write_chunk,
+)
+from .memory_budget import (
+    STREAMING_TASK_BYTES,
+    MemoryGovernor,
+    estimate_task_memory,
+    resolve_memory_budget,
+)
 
 
 def create_app() -> Flask:
@@ -42,6 +88,7 @@ def create_app() -> Flask:
     )
     app.config.from_object(WebConfig)
     app.secret_key = app.config["SECRET_KEY"]
+    app.json = json_provider_class(app.config["JSON_ENCODER"])(app)
     app.config["UPLOAD_ROOT"].mkdir(parents=True, exist_ok=True)
 
     # 关键：让 Flask 正确识别 Nginx 反向代理 + HTTPS
@@ -56,8 +103,48 @@ def create_app() -> Flask:
 
     logger = setup_logger("ExcelMergerWeb")
     upload_root: Path = app.config["UPLOAD_ROOT"]
-    metadata_lock = threading.Lock()
-    merge_executor = ThreadPoolExecutor(max_workers=2)
+    task_registry = TaskRegistry(
+        app.config.get("TASK_DB_PATH") or upload_root / "tasks.sqlite3"
+    )
+    app.extensions["task_registry"] = task_registry
+    event_bus = TaskEventBus()
+    merge_mode = app.config["MERGE_EXECUTOR"]
+    if merge_mode not in MERGE_EXECUTORS:
+        raise ValueError(
+            f"Unknown merge executor {merge_mode!r}; "
+            f"expected one of: {', '.join(sorted(MERGE_EXECUTORS))}"
+        )
+    merge_workers = resolve_merge_workers(app.config["MERGE_WORKERS"])
+    # Slot threads hold the memory reservation; in process mode they only
+    # wait on the pool, so pandas work never competes for this worker's GIL.
+    merge_scheduler = FairScheduler(
+        workers=merge_workers,
+        per_user_limit=app.config["MERGE_USER_CONCURRENCY"],
+        max_queue=app.config["MERGE_QUEUE_MAX"],
+        max_user_queue=app.config["MERGE_USER_QUEUE_MAX"],
+        logger=logger,
+    )
+    app.extensions["merge_scheduler"] = merge_scheduler
+    merge_pool = None
+    if merge_mode == "process":
+        merge_pool = MergeProcessPool(
+            merge_workers, app.config["MERGE_WORKER_MAX_TASKS"]
+        )
+    app.extensions["merge_pool"] = merge_pool
+    # /inspect parses the files of a request concurrently in this bounded pool.
+    inspect_pool = ThreadPoolExecutor(
+        max_workers=max(1, app.config["INSPECT_WORKERS"]), thread_name_prefix="inspect"
+    )
+    app.extensions["inspect_pool"] = inspect_pool
+    metrics = MetricsStore(task_registry.db_path)
+    app.extensions["metrics"] = metrics
+    if merge_mode != "queue":
+        metrics.set_gauge("excelmerger_merge_slots", merge_workers, executor=merge_mode)
+    lease_owner = f"{socket.gethostname()}:{os.getpid()}"
+    # One budget for every process sharing the task database.
+    memory_governor = MemoryGovernor(
+        resolve_memory_budget(app.config["MEMORY_BUDGET_MB"]), db_path=task_registry.db_path
+    )
 
     if app.config["USERNAME"] == "admin" or app.config["PASSWORD"] == "admin123":
         logger.warning("Using default web credentials is unsafe in production")
@@ -70,19 +157,6 @@ def create_app() -> Flask:
         parsed = urlparse(target)
         return not parsed.netloc and target.startswith("/")
 
-    def purge_expired_tasks() -> None:
-        now = datetime.now(timezone.utc)
-        for job_dir in upload_root.iterdir():
-            if not job_dir.is_dir():
-                continue
-            metadata = load_task_metadata(job_dir.name)
-            created_at = get_task_expiry_reference(job_dir, metadata)
-            if created_at is None:
-                continue
-            age_seconds = (now - created_at).total_seconds()
-            if age_seconds > app.config["CLEANUP_MINUTES"] * 60:
-                cleanup_job_dir(job_dir)
-
     def login_required(func):
         """Simple login-required decorator."""
 
@@ -94,18 +168,52 @@ def create_app() -> Flask:
 
         return wrapper
 
+    def merge_client_key() -> str:
+        """Scheduling identity: one queue per login session."""
+        return f"{session.get('user')}:{session.setdefault('client_id', uuid4().hex)}"
+
+    def check_queue_capacity(client_key: str) -> None:
+        """Raise QueueFull when a new merge for ``client_key`` must be rejected."""
+        if merge_mode != "queue":
+            merge_scheduler.check(client_key)
+            return
+        # Worker daemons share one durable queue; count it in the registry.
+        queued = task_registry.count_queued()
+        retry_after = estimate_retry_after(queued, merge_workers)
+        if queued >= app.config["MERGE_QUEUE_MAX"]:
+            raise QueueFull("服务器繁忙，合并队列已满", retry_after)
+        if task_registry.count_queued(client_key) >= app.config["MERGE_USER_QUEUE_MAX"]:
+            raise QueueFull("您排队中的任务过多，请等待完成后再提交", retry_after)
+
+    def queue_full_response(exc: QueueFull):
+        response = jsonify({"ok": False, "error": str(exc), "retry_after": exc.retry_after})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(exc.retry_after)
+        return response
+
+    def new_upload_writer() -> UploadWriter:
+        return UploadWriter(
+            max_file_bytes=app.config["MAX_FILE_BYTES"],
+            max_total_bytes=app.config["MAX_CONTENT_LENGTH"],
+        )
+
     def allowed_file(filename: str) -> bool:
         return Path(filename).suffix.lower() in app.config["ALLOWED_EXTENSIONS"]
 
     def cleanup_job_dir(path: Path) -> None:
-        """Remove temporary job directory safely."""
+        """Remove temporary job directory and its registry entry safely."""
         try:
             if path.exists():
                 shutil.rmtree(path)
         except Exception as cleanup_err:
             logger.warning("Failed to cleanup job dir %s: %s", path, cleanup_err)
+        try:
+            task_registry.delete(path.name)
+        except sqlite3.Error as exc:
+            logger.warning("Failed to delete task record %s: %s", path.name, exc)
+        event_bus.forget(path.name)
 
-    def task_metadata_path(task_id: str) -> Path:
+    def legacy_metadata_path(task_id: str) -> Path:
         return upload_root / task_id / "metadata.json"
 
     def parse_utc_datetime(value: str | None) -> datetime | None:
@@ -119,32 +227,39 @@ def create_app() -> Flask:
         except ValueError:
             return None
 
-    def load_task_metadata(task_id: str) -> dict | None:
-        metadata_path = task_metadata_path(task_id)
-        if not metadata_path.exists():
+    def import_legacy_metadata(task_id: str) -> dict | None:
+        """Move a pre-registry metadata.json into the task registry."""
+        metadata_path = legacy_metadata_path(task_id)
+        if not metadata_path.is_file():
             return None
         try:
-            with metadata_lock:
-                with metadata_path.open("r", encoding="utf-8") as fh:
-                    loaded = json.load(fh)
-                    if isinstance(loaded, dict):
-                        return loaded
+            with metadata_path.open("r", encoding="utf-8") as fh:
+                loaded = json.load(fh)
         except (OSError, json.JSONDecodeError) as exc:
             logger.warning("Failed to load task metadata for %s: %s", task_id, exc)
-        return None
+            return None
+        if not isinstance(loaded, dict):
+            return None
+        task_registry.save(task_id, loaded)
+        metadata_path.unlink(missing_ok=True)
+        return loaded
+
+    def load_task_metadata(task_id: str) -> dict | None:
+        try:
+            metadata = task_registry.load(task_id)
+        except sqlite3.Error as exc:
+            logger.warning("Failed to load task metadata for %s: %s", task_id, exc)
+            return None
+        if metadata is None:
+            return import_legacy_metadata(task_id)
+        return metadata
 
     def save_task_metadata(task_id: str, payload: dict) -> None:
-        metadata_path = task_metadata_path(task_id)
-        with metadata_lock:
-            with metadata_path.open("w", encoding="utf-8") as fh:
-                json.dump(payload, fh, ensure_ascii=False, indent=2)
+        task_registry.save(task_id, payload)
 
     def update_task_metadata(task_id: str, **updates) -> dict | None:
-        metadata = load_task_metadata(task_id)
-        if metadata is None:
-            return None
-        metadata.update(updates)
-        save_task_metadata(task_id, metadata)
+        metadata = task_registry.update(task_id, **updates)
+        event_bus.publish(task_id)
         return metadata
 
     def get_task_expiry_reference(job_dir: Path, metadata: dict | None) -> datetime | None:
@@ -158,6 +273,108 @@ def create_app() -> Flask:
             logger.warning("Failed to stat job dir %s: %s", job_dir, exc)
             return None
 
+    def task_expiry_deadline(job_dir: Path) -> datetime | None:
+        metadata = load_task_metadata(job_dir.name)
+        # Upload sessions carry an explicit deadline that activity extends.
+        expires_at = parse_utc_datetime((metadata or {}).get("expires_at"))
+        if expires_at is not None:
+            return expires_at
+        reference = get_task_expiry_reference(job_dir, metadata)
+        if reference is None:
+            return None
+        ttl = (metadata or {}).get("ttl_minutes", app.config["CLEANUP_MINUTES"])
+        return reference + timedelta(minutes=ttl)
+
+    def expire_task(task_id: str) -> datetime | None:
+        """Janitor callback: remove an expired job dir or return its real deadline."""
+        job_dir = upload_root / task_id
+        if not job_dir.is_dir():
+            task_registry.delete(task_id)
+            return None
+        deadline = task_expiry_deadline(job_dir)
+        if deadline is None:
+            return None
+        if deadline <= datetime.now(timezone.utc):
+            cleanup_job_dir(job_dir)
+            return None
+        return deadline
+
+    def recover_stale_tasks() -> None:
+        """Re-queue, fail or cancel running tasks whose runner stopped renewing its lease."""
+        requeued, finished = task_registry.recover_expired(app.config["TASK_MAX_ATTEMPTS"])
+        for task_id in requeued + finished:
+            event_bus.publish(task_id)
+        if requeued or finished:
+            logger.warning(
+                "Recovered stale tasks: requeued %s, failed or cancelled %s", requeued, finished
+            )
+
+    def scan_task_expiries():
+        """Janitor callback: yield (task_id, deadline) for registry tasks and job dirs."""
+        recover_stale_tasks()
+        # Expiry alone can fall behind a busy period; apply the storage limits too.
+        storage.ensure_space()
+        # Upload sessions may have a shorter TTL; expire_task reschedules
+        # anything found early to its real deadline.
+        ttl = timedelta(
+            minutes=min(app.config["CLEANUP_MINUTES"], app.config["UPLOAD_SESSION_MINUTES"])
+        )
+        created_times = task_registry.created_times()
+        for task_id, created_at in created_times.items():
+            yield task_id, created_at + ttl
+        for job_dir in upload_root.iterdir():
+            if not job_dir.is_dir() or job_dir.name in created_times:
+                continue
+            deadline = task_expiry_deadline(job_dir)
+            if deadline is not None:
+                yield job_dir.name, deadline
+
+    def eviction_candidates():
+        """Storage callback: finished tasks with their last download (or finish) time."""
+        for task_id in task_registry.ids_with_status("completed", "failed", "cancelled"):
+            metadata = load_task_metadata(task_id) or {}
+            last_used = parse_utc_datetime(
+                metadata.get("last_downloaded_at") or metadata.get("completed_at")
+            )
+            yield task_id, last_used.timestamp() if last_used else 0.0
+
+    def evict_task(task_id: str) -> None:
+        cleanup_job_dir(upload_root / task_id)
+        metrics.inc("excelmerger_storage_evictions_total")
+        logger.info("Evicted task %s to free storage", task_id)
+
+    storage = StorageManager(
+        upload_root,
+        quota_bytes=app.config["STORAGE_QUOTA_BYTES"],
+        min_free_bytes=app.config["STORAGE_MIN_FREE_BYTES"],
+        candidates=eviction_candidates,
+        evict=evict_task,
+        logger=logger,
+    )
+    app.extensions["storage"] = storage
+
+    def storage_full_response(incoming: int):
+        """507 when ``incoming`` bytes do not fit even after evicting old results."""
+        if storage.ensure_space(incoming):
+            return None
+        metrics.inc("excelmerger_storage_rejections_total")
+        return jsonify({"ok": False, "error": "服务器存储空间不足，请稍后重试"}), 507
+
+    janitor = TaskJanitor(
+        expire_task,
+        scan_task_expiries,
+        reconcile_seconds=app.config["JANITOR_RECONCILE_SECONDS"],
+        logger=logger,
+    )
+    app.extensions["task_janitor"] = janitor
+    # Spawned pool workers re-import the main module; only the web process
+    # should run the janitor thread.
+    if multiprocessing.parent_process() is None:
+        if merge_mode != "queue":
+            merge_scheduler.start()
+        if app.config["JANITOR_ENABLED"]:
+            janitor.start()
+
     def build_default_download_stem() -> str:
         return f"merged_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
@@ -194,117 +411,125 @@ def create_app() -> Flask:
             "suggested_filename": metadata.get("suggested_filename", ""),
             "format": metadata.get("format", "xlsx"),
         }
+        if metadata.get("progress"):
+            payload["progress"] = metadata["progress"]
+        if status == "queued":
+            if merge_mode == "queue":
+                position = task_registry.queue_position(task_id)
+            else:
+                position = merge_scheduler.position(task_id)
+            if position is not None:
+                payload["queue_position"] = position
+        if status in {"queued", "running"}:
+            if app.config["SSE_ENABLED"]:
+                payload["events_url"] = url_for("task_events", task_id=task_id)
+            payload["cancel_url"] = url_for("cancel_task", task_id=task_id)
+            if metadata.get("cancel_requested"):
+                payload["cancel_requested"] = True
         if status == "completed":
             payload["download_url"] = url_for("download_result", task_id=task_id)
+            if metadata.get("cached_from"):
+                payload["cached"] = True
         if status == "failed":
             payload["error"] = metadata.get("error", "合并失败")
+        if metadata.get("profile"):
+            payload["profile_url"] = url_for("task_profile", task_id=task_id)
+        if status == "completed" and metadata.get("preview_path"):
+            payload["rows_url"] = url_for("task_rows", task_id=task_id)
         return payload, 200
 
     def process_merge_task(
         task_id: str,
         saved_paths: list[Path],
         *,
-        normalize_columns: bool,
-        enable_fuzzy: bool,
-        remove_duplicates: bool,
-        smart_dedup: bool,
-        dedup_keys: list[str],
-        exclude_columns: set[str],
-        output_format: str,
+        memory_estimate: int = 0,
+        streaming: bool = False,
+        **merge_options,
     ) -> None:
-        job_dir = upload_root / task_id
-        update_task_metadata(task_id, status="running", started_at=datetime.now(timezone.utc).isoformat())
-
-        try:
-            config_manager = ConfigManager()
-            merger = ExcelMergerCore(config_manager)
-
-            all_dfs = []
-            mapping_report = {}
-
-            for file_path in saved_paths:
-                sheets = read_file(str(file_path))
-                for sheet_name, df in sheets.items():
-                    if df.empty:
-                        logger.info(
-                            "Skip empty sheet %s - %s", file_path.name, sheet_name
-                        )
-                        continue
-
-                    if normalize_columns:
-                        df = merger.normalize_columns(
-                            df, enable_fuzzy=enable_fuzzy
-                        )
-                        current_mapping = merger.get_mapping_report()
-                        if current_mapping:
-                            mapping_report[
-                                f"{file_path.name}-{sheet_name}"
-                            ] = current_mapping
-
-                    filename_without_ext = file_path.stem
-                    df.insert(0, "来源文件", filename_without_ext)
-                    df.insert(1, "工作表", sheet_name)
-
-                    if exclude_columns:
-                        cols_to_keep = [
-                            c
-                            for c in df.columns
-                            if str(c) not in exclude_columns
-                            or str(c) in {"来源文件", "工作表"}
-                        ]
-                        if len(cols_to_keep) < len(df.columns):
-                            df = df[cols_to_keep]
-
-                    all_dfs.append(df)
-
-            if not all_dfs:
-                raise ValueError("没有可合并的数据")
-
-            merged = pd.concat(all_dfs, join="outer", ignore_index=True, sort=False)
-            logger.info(
-                "Merged %s files into %s rows x %s cols",
-                len(saved_paths),
-                len(merged),
-                len(merged.columns),
+        if (load_task_metadata(task_id) or {}).get("status") != "queued":
+            return  # cancelled while waiting for a slot
+        reservation = STREAMING_TASK_BYTES if streaming else memory_estimate
+        # Admission control: the task stays "queued" until its memory fits.
+        with memory_governor.reserve(reservation):
+            lease_seconds = app.config["TASK_LEASE_SECONDS"]
+            started = task_registry.transition(
+                task_id,
+                {"queued"},
+                status="running",
+                started_at=datetime.now(timezone.utc).isoformat(),
+                lease_owner=lease_owner,
+                lease_expires=time.time() + lease_seconds,
             )
+            if started is None:
+                return
+            event_bus.publish(task_id)
+            with LeaseHeartbeat(task_registry, task_id, lease_owner, lease_seconds):
+                run_task_job(task_id, saved_paths, streaming, merge_options)
 
-            original_count = len(merged)
-            if smart_dedup and dedup_keys:
-                merged = merger.deduplicate_smart(
-                    merged, key_columns=dedup_keys
-                )
-                removed = original_count - len(merged)
-                if removed > 0:
-                    logger.info("Smart dedup removed %s rows", removed)
-            elif remove_duplicates:
-                merged = merger.deduplicate_smart(merged)
-                removed = original_count - len(merged)
-                if removed > 0:
-                    logger.info("Full-row dedup removed %s rows", removed)
-
-            quality_report = merger.validate_data(merged)
-            logger.info("Quality report: %s", quality_report)
-            if mapping_report:
-                logger.info("Column mapping: %s", mapping_report)
-
-            output_path = job_dir / f"merged.{output_format}"
-            save_file(merged, output_path, file_format=output_format)
+    def gzip_results() -> bool:
+        """Whether merges write the gzip copy that CSV downloads use."""
+        return app.config["DOWNLOAD_GZIP"] and not app.config["DOWNLOAD_ACCEL_PREFIX"]
 
-            update_task_metadata(
-                task_id,
-                status="completed",
-                path=output_path.name,
-                completed_at=datetime.now(timezone.utc).isoformat(),
-                error="",
-            )
-        except Exception as exc:  # noqa: BLE001
-            logger.error("Merge failed: %s\n%s", exc, traceback.format_exc())
+    def run_task_job(
+        task_id: str,
+        saved_paths: list[Path],
+        streaming: bool,
+        merge_options: dict,
+    ) -> None:
+        """Run a started task in this process or on the process pool."""
+        job = {
+            "task_db_path": str(task_registry.db_path),
+            "job_dir": str(upload_root / task_id),
+            "dtype_backend": app.config["DTYPE_BACKEND"],
+            "stream_chunk_rows": app.config["STREAM_CHUNK_ROWS"],
+            "profiler": app.config["MERGE_PROFILER"],
+            "preview": app.config["RESULT_PREVIEW_ENABLED"],
+            "gzip_result": gzip_results(),
+            "streaming": streaming,
+            **merge_options,
+        }
+        if merge_pool is None:
+            run_merge_task(task_id, saved_paths, notify=event_bus.publish, **job)
+            return
+        try:
+            merge_pool.run(run_merge_task, task_id, saved_paths, **job)
+        except BrokenProcessPool as exc:
+            logger.error("Merge worker for task %s exited abnormally: %s", task_id, exc)
             update_task_metadata(
                 task_id,
                 status="failed",
-                error=str(exc),
+                error="合并进程异常退出，可能是内存不足",
                 completed_at=datetime.now(timezone.utc).isoformat(),
             )
+        else:
+            event_bus.publish(task_id)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        metrics.observe(
+            "excelmerger_http_request_seconds",
+            time.perf_counter() - started,
+            route=route,
+        )
+        metrics.inc(
+            "excelmerger_http_requests_total",
+            route=route,
+            method=request.method,
+            status=str(response.status_code),
+        )
+        try:
+            metrics.maybe_flush()
+        except sqlite3.Error as exc:
+            logger.warning("Failed to flush metrics: %s", exc)
+        return response
 
     @app.route("/login", methods=["GET", "POST"])
     def login():
@@ -333,9 +558,11 @@ def create_app() -> Flask:
 
     @app.before_request
     def enforce_login():
-        purge_expired_tasks()
         # Allow login page and static files without auth
-        if request.endpoint in {"login", "static"}:
+        if request.endpoint in {"login", "static", "metrics_endpoint"}:
+            return None
+        # The JSON API authenticates with bearer tokens instead of sessions.
+        if (request.endpoint or "").startswith("api_"):
             return None
         if not session.get("user"):
             return redirect(url_for("login", next=request.path))
@@ -346,35 +573,102 @@ def create_app() -> Flask:
     def merge_page():
         return render_template("merge.html", user=session.get("user"))
 
-    @app.route("/merge", methods=["POST"])
-    @login_required
-    def merge_endpoint():
-        # Basic payload size guard
-        if (
-            request.content_length
-            and request.content_length > app.config["MAX_CONTENT_LENGTH"]
-        ):
-            return (
-                jsonify({"ok": False, "error": "上传大小超出限制"}),
-                413,
-            )
+    def reuse_cached_result(task_id: str, result_key: str) -> dict | None:
+        """Hard-link the output of an identical completed merge into ``task_id``.
 
-        files = request.files.getlist("files")
-        if not files:
-            return jsonify({"ok": False, "error": "请至少上传一个文件"}), 400
+        Returns the metadata updates for a completed task, or None when no
+        earlier output is still on disk.
+        """
+        job_dir = upload_root / task_id
+        for source_id, source in task_registry.completed_with_result(result_key):
+            source_path = upload_root / source_id / source.get("path", "")
+            if not source.get("path") or not source_path.is_file():
+                continue
+            try:
+                link_or_copy(source_path, job_dir / source_path.name)
+            except OSError as exc:
+                logger.warning("Failed to reuse result of %s: %s", source_id, exc)
+                continue
+            kept = {source_path.name}
+            source_gzip = fresh_gzip_variant(source_path)
+            if source_gzip is not None:
+                try:
+                    link_or_copy(source_gzip, job_dir / source_gzip.name)
+                    kept.add(source_gzip.name)
+                except OSError as exc:
+                    logger.warning("Failed to reuse gzip result of %s: %s", source_id, exc)
+            # The inputs are not needed once the result is in place.
+            for item in job_dir.iterdir():
+                if item.name not in kept:
+                    if item.is_dir():
+                        shutil.rmtree(item, ignore_errors=True)
+                    else:
+                        item.unlink(missing_ok=True)
+            preview_path = ""
+            source_preview = upload_root / source_id / source.get("preview_path", "")
+            if source.get("preview_path") and source_preview.is_file():
+                try:
+                    link_or_copy(source_preview, job_dir / source_preview.name)
+                    preview_path = source_preview.name
+                except OSError as exc:
+                    logger.warning("Failed to reuse preview of %s: %s", source_id, exc)
+            logger.info("Task %s reuses the result of identical task %s", task_id, source_id)
+            return {
+                "status": "completed",
+                "path": source_path.name,
+                "preview_path": preview_path,
+                "completed_at": datetime.now(timezone.utc).isoformat(),
+                "cached_from": source_id,
+            }
+        return None
 
-        normalize_columns = request.form.get("normalize_columns") == "on"
-        enable_fuzzy = request.form.get("enable_fuzzy") == "on"
-        remove_duplicates = request.form.get("remove_duplicates") == "on"
-        smart_dedup = request.form.get("smart_dedup") == "on"
-        dedup_keys_raw = request.form.get("dedup_keys", "")
-        dedup_keys = [k.strip() for k in dedup_keys_raw.split(",") if k.strip()]
-        exclude_raw = request.form.get("exclude_columns", "")
-        exclude_columns = {c.strip() for c in exclude_raw.split(",") if c.strip()}
-        output_format = request.form.get("output_format", "xlsx").lower()
+    def parse_merge_options(source) -> dict:
+        """Merge options from the web form (checkboxes send "on") or an API request."""
+
+        def flag(name: str) -> bool:
+            value = source.get(name)
+            if isinstance(value, bool):
+                return value
+            return str(value or "").strip().lower() in {"on", "true", "1", "yes"}
+
+        def names(name: str) -> list[str]:
+            value = source.get(name) or ""
+            if isinstance(value, str):
+                value = value.split(",")
+            return [str(item).strip() for item in value if str(item).strip()]
+
+        output_format = str(source.get("output_format") or "xlsx").lower()
         if output_format not in {"xlsx", "csv"}:
             output_format = "xlsx"
+        return {
+            "normalize_columns": flag("normalize_columns"),
+            "enable_fuzzy": flag("enable_fuzzy"),
+            "remove_duplicates": flag("remove_duplicates"),
+            "smart_dedup": flag("smart_dedup"),
+            "dedup_keys": names("dedup_keys"),
+            "exclude_columns": set(names("exclude_columns")),
+            "output_format": output_format,
+        }
 
+    def create_merge_task(
+        client_key: str,
+        merge_options: dict,
+        *,
+        files=(),
+        upload: dict | None = None,
+        upload_id: str = "",
+        local_paths: list[Path] = (),
+        merge_async: bool = True,
+    ):
+        """Save a merge's inputs, register the task and start or queue it.
+
+        Inputs come from multipart ``files``, a finished upload session, or
+        server-local ``local_paths`` (API only, already checked against
+        API_LOCAL_ROOTS). Returns ``(task_id, None)``, or ``(None, response)``
+        when the request is rejected.
+        """
+        exclude_columns = merge_options["exclude_columns"]
+        output_format = merge_options["output_format"]
         task_id = str(uuid4())
         job_dir = upload_root / task_id
         job_dir.mkdir(parents=True, exist_ok=True)
@@ -382,81 +676,386 @@ def create_app() -> Flask:
         suggested_filename = build_default_download_stem()
 
         try:
-            total_size = 0
+            writer = new_upload_writer()
+            inputs = []
+            if upload is not None:
+                # Reuse the files (and parsed sheets) kept by /inspect.
+                upload_dir = upload_root / upload_id
+                (job_dir / PARSED_CACHE_DIR).mkdir()
+                for item in upload["inputs"]:
+                    dest = job_dir / item["name"]
+                    link_or_copy(upload_dir / item["name"], dest)
+                    cached = parsed_cache_path(upload_dir / item["name"], None)
+                    if cached.exists():
+                        link_or_copy(cached, parsed_cache_path(dest, None))
+                    saved_paths.append(dest)
+                    inputs.append(item)
+                files = []
             for f in files:
                 if not f or not f.filename:
                     continue
                 if not allowed_file(f.filename):
                     cleanup_job_dir(job_dir)
-                    return (
+                    return None, (
                         jsonify(
                             {"ok": False, "error": f"不支持的文件类型: {f.filename}"}
                         ),
                         400,
                     )
-                dest = job_dir / Path(f.filename).name
-                f.save(dest)
-                file_size = dest.stat().st_size
-                total_size += file_size
-                if total_size > app.config["MAX_CONTENT_LENGTH"]:
+                try:
+                    saved = writer.save(f.stream, job_dir / Path(f.filename).name)
+                except UploadTooLarge as exc:
                     cleanup_job_dir(job_dir)
-                    return (
-                        jsonify({"ok": False, "error": "上传文件总大小超出限制"}),
-                        413,
-                    )
+                    return None, (jsonify({"ok": False, "error": str(exc)}), 413)
+                saved_paths.append(saved.path)
+                inputs.append(
+                    {"name": saved.path.name, "size": saved.size, "sha256": saved.sha256}
+                )
+            for source in local_paths:
+                dest = job_dir / source.name
+                link_or_copy(source, dest)
                 saved_paths.append(dest)
+                inputs.append(
+                    {"name": dest.name, "size": dest.stat().st_size, "sha256": file_sha256(dest)}
+                )
+            if not saved_paths:
+                cleanup_job_dir(job_dir)
+                return None, (jsonify({"ok": False, "error": "请至少上传一个文件"}), 400)
 
-            save_task_metadata(
+            memory_estimate = estimate_task_memory(saved_paths)
+            streaming = memory_governor.exceeds_budget(memory_estimate)
+            if streaming:
+                logger.info(
+                    "Task %s estimated at %s bytes exceeds memory budget, using chunked merge",
+                    task_id,
+                    memory_estimate,
+                )
+
+            task_metadata = {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "format": output_format,
+                "status": "queued",
+                "suggested_filename": suggested_filename,
+                "error": "",
+                "memory_estimate_bytes": memory_estimate,
+                "memory_mode": "chunked" if streaming else "in_memory",
+                "client": client_key,
+                "inputs": inputs,
+            }
+            cached = None
+            if app.config["RESULT_CACHE_ENABLED"]:
+                task_metadata["result_key"] = merge_result_key(
+                    inputs,
+                    merge_options,
+                    mapping_version=ConfigManager().mapping_version(),
+                    dtype_backend=app.config["DTYPE_BACKEND"],
+                    streaming=streaming,
+                )
+                cached = reuse_cached_result(task_id, task_metadata["result_key"])
+            if cached is not None:
+                task_metadata.update(cached)
+            elif merge_mode == "queue":
+                # Durable job spec for the worker daemons (JSON-serialisable).
+                task_metadata["job"] = {
+                    **merge_options,
+                    "exclude_columns": sorted(exclude_columns),
+                    "saved_paths": [str(path) for path in saved_paths],
+                    "streaming": streaming,
+                }
+            save_task_metadata(task_id, task_metadata)
+
+            janitor.schedule(
                 task_id,
-                {
-                    "created_at": datetime.now(timezone.utc).isoformat(),
-                    "format": output_format,
-                    "status": "queued",
-                    "suggested_filename": suggested_filename,
-                    "error": "",
-                },
+                datetime.now(timezone.utc)
+                + timedelta(minutes=app.config["CLEANUP_MINUTES"]),
             )
 
             task_kwargs = {
-                "normalize_columns": normalize_columns,
-                "enable_fuzzy": enable_fuzzy,
-                "remove_duplicates": remove_duplicates,
-                "smart_dedup": smart_dedup,
-                "dedup_keys": dedup_keys,
-                "exclude_columns": exclude_columns,
-                "output_format": output_format,
+                **merge_options,
+                "memory_estimate": memory_estimate,
+                "streaming": streaming,
             }
 
-            if app.config.get("MERGE_ASYNC", True):
-                merge_executor.submit(
-                    process_merge_task,
-                    task_id,
-                    list(saved_paths),
-                    **task_kwargs,
-                )
+            if cached is not None or merge_mode == "queue":
+                event_bus.publish(task_id)
+            elif merge_async:
+                try:
+                    merge_scheduler.submit(
+                        client_key,
+                        task_id,
+                        process_merge_task,
+                        task_id,
+                        list(saved_paths),
+                        **task_kwargs,
+                    )
+                except QueueFull as exc:
+                    cleanup_job_dir(job_dir)
+                    return None, queue_full_response(exc)
             else:
                 process_merge_task(
                     task_id,
                     list(saved_paths),
                     **task_kwargs,
                 )
-
-            return jsonify(
-                {
-                    "ok": True,
-                    "task_id": task_id,
-                    "status": load_task_metadata(task_id).get("status", "queued"),
-                    "suggested_filename": suggested_filename,
-                    "status_url": url_for(
-                        "task_status", task_id=task_id
-                    ),
-                }
-            ), 202
+            return task_id, None
         except Exception as exc:  # noqa: BLE001
             cleanup_job_dir(job_dir)
             logger.error("Merge failed: %s\n%s", exc, traceback.format_exc())
             status_code = 400 if isinstance(exc, ValueError) else 500
-            return jsonify({"ok": False, "error": str(exc)}), status_code
+            return None, (jsonify({"ok": False, "error": str(exc)}), status_code)
+
+    @app.route("/merge", methods=["POST"])
+    @login_required
+    def merge_endpoint():
+        # Basic payload size guard
+        if (
+            request.content_length
+            and request.content_length > app.config["MAX_CONTENT_LENGTH"]
+        ):
+            return (
+                jsonify({"ok": False, "error": "上传大小超出限制"}),
+                413,
+            )
+
+        files = request.files.getlist("files")
+        upload_id = request.form.get("upload_id", "").strip()
+        upload = None
+        if upload_id:
+            upload = load_upload_session(upload_id)
+            if upload is None:
+                return (
+                    jsonify({"ok": False, "error": "上传会话不存在或已过期，请重新上传"}),
+                    410,
+                )
+            if upload.get("status") != "uploaded":
+                return jsonify({"ok": False, "error": "文件尚未上传完成"}), 409
+        elif not files:
+            return jsonify({"ok": False, "error": "请至少上传一个文件"}), 400
+        # Room for the uploaded bytes plus a result about the size of all
+        # inputs; files of an upload session are already on disk.
+        input_bytes = (request.content_length or 0) + sum(
+            item["size"] for item in (upload or {}).get("inputs", [])
+        )
+        incoming = (request.content_length or 0) + input_bytes
+        rejected = storage_full_response(incoming)
+        if rejected is not None:
+            return rejected
+
+        # Queue mode always hands tasks to the worker daemons.
+        merge_async = merge_mode == "queue" or app.config.get("MERGE_ASYNC", True)
+        client_key = merge_client_key()
+        if merge_async:
+            try:
+                check_queue_capacity(client_key)
+            except QueueFull as exc:
+                return queue_full_response(exc)
+
+        task_id, error = create_merge_task(
+            client_key,
+            parse_merge_options(request.form),
+            files=files,
+            upload=upload,
+            upload_id=upload_id,
+            merge_async=merge_async,
+        )
+        if error is not None:
+            return error
+        metadata = load_task_metadata(task_id) or {}
+        payload = {
+            "ok": True,
+            "task_id": task_id,
+            "status": metadata.get("status", "queued"),
+            "suggested_filename": metadata.get("suggested_filename", ""),
+            "status_url": url_for(
+                "task_status", task_id=task_id
+            ),
+        }
+        if app.config["SSE_ENABLED"]:
+            payload["events_url"] = url_for("task_events", task_id=task_id)
+        return jsonify(payload), 202
+
+    def api_tokens() -> dict[str, str]:
+        """Configured API tokens by client name ("name:token" or a bare token)."""
+        tokens = {}
+        for index, entry in enumerate(app.config["API_TOKENS"].split(",")):
+            entry = entry.strip()
+            if not entry:
+                continue
+            name, sep, token = entry.partition(":")
+            if not sep:
+                name, token = f"token{index + 1}", entry
+            tokens[name.strip()] = token.strip()
+        return tokens
+
+    def api_token_required(func):
+        """Bearer-token auth for /api/v1; sets g.api_client to the token's name."""
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            authorization = request.headers.get("Authorization", "")
+            scheme, _, presented = authorization.partition(" ")
+            client = None
+            if scheme.lower() == "bearer" and presented.strip():
+                for name, token in api_tokens().items():
+                    if hmac.compare_digest(presented.strip(), token):
+                        client = name
+            if client is None:
+                response = jsonify({"ok": False, "error": "缺少或无效的 API 令牌"})
+                response.status_code = 401
+                response.headers["WWW-Authenticate"] = "Bearer"
+                return response
+            g.api_client = client
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def resolve_local_input(raw) -> Path:
+        """Check an API file reference against API_LOCAL_ROOTS; ValueError if refused."""
+        roots = [
+            Path(root).resolve()
+            for root in app.config["API_LOCAL_ROOTS"].split(os.pathsep)
+            if root.strip()
+        ]
+        if not roots:
+            raise ValueError("服务器未开放本地文件引用")
+        path = Path(str(raw)).resolve()
+        if not any(path.is_relative_to(root) for root in roots):
+            raise ValueError(f"不允许访问该路径: {raw}")
+        if not path.is_file():
+            raise ValueError(f"文件不存在: {raw}")
+        if not allowed_file(path.name):
+            raise ValueError(f"不支持的文件类型: {path.name}")
+        return path
+
+    def wait_for_task(task_id: str, seconds: float, started: float) -> None:
+        """Block until the task finishes or ``seconds`` have passed since ``started``.
+
+        The wait is capped at API_MAX_WAIT_SECONDS from ``started`` (the
+        request's arrival), so time spent receiving uploads counts too and
+        the response goes out before the gunicorn worker timeout.
+        """
+        deadline = started + min(seconds, app.config["API_MAX_WAIT_SECONDS"])
+        version = event_bus.version(task_id)
+        while True:
+            metadata = load_task_metadata(task_id)
+            if not metadata or metadata.get("status") not in {"queued", "running"}:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # Re-read the registry at least every SSE_POLL_SECONDS to see
+            # progress made by other workers.
+            version = event_bus.wait(
+                task_id, version, timeout=min(remaining, app.config["SSE_POLL_SECONDS"])
+            )
+
+    def api_task_payload(task_id: str) -> tuple[dict, int]:
+        payload, status_code = build_task_status_payload(task_id)
+        if status_code != 200:
+            return payload, status_code
+        # Session-only links are replaced by their API counterparts.
+        for key in ("events_url", "cancel_url", "download_url", "profile_url", "rows_url"):
+            payload.pop(key, None)
+        payload["status_url"] = url_for("api_merge_status", task_id=task_id)
+        if payload["status"] == "completed":
+            payload["result_url"] = url_for("api_merge_result", task_id=task_id)
+        payload["profile"] = (load_task_metadata(task_id) or {}).get("profile")
+        return payload, 200
+
+    def api_wait_seconds(value) -> float:
+        try:
+            seconds = float(value or 0)
+        except (TypeError, ValueError):
+            raise ValueError("wait 必须是秒数") from None
+        if not math.isfinite(seconds) or seconds < 0:
+            raise ValueError("wait 必须是非负秒数")
+        return seconds
+
+    @app.route("/api/v1/merges", methods=["POST"])
+    @api_token_required
+    def api_create_merge():
+        """Start a merge from multipart uploads and/or server-local file paths.
+
+        JSON bodies carry ``paths``, the merge options and ``wait``; multipart
+        bodies carry ``files``, repeated ``paths`` fields and the same options
+        as form fields. With ``wait`` the response is held until the task
+        finishes or that many seconds pass.
+        """
+        started = time.monotonic()
+        if request.is_json:
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                return jsonify({"ok": False, "error": "请求体必须是 JSON 对象"}), 400
+            options_source = body.get("options") or body
+            paths = body.get("paths") or []
+            if isinstance(paths, str):
+                paths = [paths]
+            files = []
+            wait_value = body.get("wait", request.args.get("wait"))
+        else:
+            options_source = request.form
+            paths = request.form.getlist("paths")
+            files = request.files.getlist("files")
+            wait_value = request.form.get("wait", request.args.get("wait"))
+        try:
+            wait_seconds = api_wait_seconds(wait_value)
+            local_paths = [resolve_local_input(path) for path in paths]
+        except ValueError as exc:
+            return jsonify({"ok": False, "error": str(exc)}), 400
+        if not files and not local_paths:
+            return jsonify({"ok": False, "error": "请至少提供一个文件"}), 400
+        # Uploaded bytes plus a result about the size of all inputs; local
+        # paths are read in place.
+        input_bytes = (request.content_length or 0) + sum(
+            path.stat().st_size for path in local_paths
+        )
+        rejected = storage_full_response((request.content_length or 0) + input_bytes)
+        if rejected is not None:
+            return rejected
+
+        merge_async = merge_mode == "queue" or app.config.get("MERGE_ASYNC", True)
+        client_key = f"api:{g.api_client}"
+        if merge_async:
+            try:
+                check_queue_capacity(client_key)
+            except QueueFull as exc:
+                return queue_full_response(exc)
+        task_id, error = create_merge_task(
+            client_key,
+            parse_merge_options(options_source),
+            files=files,
+            local_paths=local_paths,
+            merge_async=merge_async,
+        )
+        if error is not None:
+            return error
+        logger.info("API client %s started merge %s", g.api_client, task_id)
+        if wait_seconds:
+            wait_for_task(task_id, wait_seconds, started)
+        payload, _ = api_task_payload(task_id)
+        response = jsonify(payload)
+        response.status_code = 202 if payload["status"] in {"queued", "running"} else 200
+        response.headers["Location"] = payload["status_url"]
+        return response
+
+    @app.route("/api/v1/merges/<task_id>")
+    @api_token_required
+    def api_merge_status(task_id: str):
+        """Task status and profile; ``?wait=<seconds>`` waits for it to finish."""
+        started = time.monotonic()
+        try:
+            wait_seconds = api_wait_seconds(request.args.get("wait"))
+        except ValueError as exc:
+            return jsonify({"ok": False, "error": str(exc)}), 400
+        if wait_seconds:
+            wait_for_task(task_id, wait_seconds, started)
+        payload, status_code = api_task_payload(task_id)
+        return jsonify(payload), status_code
+
+    @app.route("/api/v1/merges/<task_id>/result")
+    @api_token_required
+    def api_merge_result(task_id: str):
+        return send_task_result(task_id)
 
     @app.route("/task/<task_id>")
     @login_required
@@ -464,9 +1063,171 @@ def create_app() -> Flask:
         payload, status_code = build_task_status_payload(task_id)
         return jsonify(payload), status_code
 
-    @app.route("/download/<task_id>")
+    @app.route("/task/<task_id>/cancel", methods=["POST"])
     @login_required
-    def download_result(task_id: str):
+    def cancel_task(task_id: str):
+        """Cancel a queued task at once; ask a running one to stop at its next checkpoint."""
+        cancelled = task_registry.transition(
+            task_id,
+            {"queued"},
+            status="cancelled",
+            cancel_requested=True,
+            completed_at=datetime.now(timezone.utc).isoformat(),
+        )
+        if cancelled is not None:
+            merge_scheduler.discard(task_id)
+            remove_path_contents(upload_root / task_id)
+            event_bus.publish(task_id)
+            logger.info("Cancelled queued task %s", task_id)
+        elif task_registry.transition(task_id, {"running"}, cancel_requested=True):
+            event_bus.publish(task_id)
+            logger.info("Cancellation requested for running task %s", task_id)
+
+        payload, status_code = build_task_status_payload(task_id)
+        if status_code != 200:
+            return jsonify(payload), status_code
+        if payload["status"] == "running":
+            return jsonify(payload), 202
+        if payload["status"] != "cancelled":
+            payload.update(ok=False, error="任务已结束，无法取消")
+            return jsonify(payload), 409
+        return jsonify(payload), 200
+
+    @app.route("/task/<task_id>/events")
+    @login_required
+    def task_events(task_id: str):
+        """Server-Sent Events stream of task status until it finishes.
+
+        Each stream ends after SSE_MAX_SECONDS and the browser reconnects, so
+        no request outlives the worker timeout.
+        """
+        if not app.config["SSE_ENABLED"]:
+            return jsonify({"ok": False, "error": "未启用状态推送，请轮询任务状态"}), 404
+        poll_seconds = app.config["SSE_POLL_SECONDS"]
+        max_seconds = app.config["SSE_MAX_SECONDS"]
+
+        def stream():
+            yield "retry: 2000\n\n"
+            deadline = time.monotonic() + max_seconds
+            last_payload = None
+            last_sent = time.monotonic()
+            version = event_bus.version(task_id)
+            while True:
+                payload, status_code = build_task_status_payload(task_id)
+                if payload != last_payload:
+                    data = json.dumps(payload, ensure_ascii=False)
+                    yield f"event: status\ndata: {data}\n\n"
+                    last_payload = payload
+                    last_sent = time.monotonic()
+                if status_code != 200 or payload["status"] not in {"queued", "running"}:
+                    return
+                if time.monotonic() >= deadline:
+                    # Let the browser reconnect instead of pinning a worker forever
+                    return
+                # Wake on in-process updates; the timeout re-reads the registry
+                # to catch updates made by other workers.
+                version = event_bus.wait(task_id, version, timeout=poll_seconds)
+                if time.monotonic() - last_sent >= 15:
+                    yield ": keep-alive\n\n"
+                    last_sent = time.monotonic()
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype="text/event-stream",
+            headers={"X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/task/<task_id>/rows")
+    @login_required
+    def task_rows(task_id: str):
+        """One page of a completed result: ``?offset=&limit=&columns=a,b``."""
+        metadata = load_task_metadata(task_id)
+        if not metadata:
+            return jsonify({"ok": False, "error": "任务不存在或已过期"}), 404
+        if metadata.get("status") != "completed":
+            return jsonify({"ok": False, "error": "任务尚未完成"}), 409
+        preview_path = upload_root / task_id / (metadata.get("preview_path") or "")
+        if not metadata.get("preview_path") or not preview_path.is_file():
+            return jsonify({"ok": False, "error": "该结果没有预览数据，请下载查看"}), 404
+        try:
+            offset = int(request.args.get("offset", 0))
+            limit = int(request.args.get("limit", 100))
+        except ValueError:
+            return jsonify({"ok": False, "error": "offset 和 limit 必须是整数"}), 400
+        columns = [c for c in request.args.get("columns", "").split(",") if c]
+        try:
+            page = read_result_rows(preview_path, offset, limit, columns or None)
+        except KeyError as exc:
+            return jsonify({"ok": False, "error": f"列不存在: {exc.args[0]}"}), 400
+        except (OSError, ValueError) as exc:
+            logger.warning("Failed to read preview of %s: %s", task_id, exc)
+            return jsonify({"ok": False, "error": "预览数据读取失败"}), 500
+        return jsonify({"ok": True, "task_id": task_id, **page}), 200
+
+    @app.route("/task/<task_id>/profile")
+    @login_required
+    def task_profile(task_id: str):
+        """Timings and volumes recorded for a finished merge."""
+        metadata = load_task_metadata(task_id)
+        if not metadata:
+            return jsonify({"ok": False, "error": "任务不存在或已过期"}), 404
+        profile = metadata.get("profile")
+        if not profile:
+            payload = {"ok": False, "error": "该任务没有性能记录"}
+            if metadata.get("cached_from"):
+                # Reused results were never merged; the original task has the profile.
+                payload["cached_from"] = metadata["cached_from"]
+            return jsonify(payload), 404
+        payload = {
+            "ok": True,
+            "task_id": task_id,
+            "status": metadata.get("status"),
+            "profile": profile,
+        }
+        capture = metadata.get("profile_capture")
+        if capture and (upload_root / task_id / capture).exists():
+            payload["capture_url"] = url_for("task_profile_capture", task_id=task_id)
+        return jsonify(payload), 200
+
+    @app.route("/task/<task_id>/profile/capture")
+    @login_required
+    def task_profile_capture(task_id: str):
+        """cProfile (.pstats) or pyinstrument (.html) capture saved by MERGE_PROFILER."""
+        metadata = load_task_metadata(task_id)
+        capture = (metadata or {}).get("profile_capture")
+        if capture not in PROFILER_CAPTURE_FILES.values():
+            return "没有性能采样文件", 404
+        capture_path = upload_root / task_id / capture
+        if not capture_path.exists():
+            return "没有性能采样文件", 404
+        return send_file(
+            capture_path,
+            as_attachment=True,
+            download_name=f"{task_id}-{capture}",
+        )
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        """Prometheus metrics; needs a login session or the METRICS_TOKEN bearer token."""
+        token = app.config["METRICS_TOKEN"]
+        authorization = request.headers.get("Authorization", "")
+        if not session.get("user") and not (
+            token and hmac.compare_digest(authorization, f"Bearer {token}")
+        ):
+            return Response("unauthorized\n", 401, {"WWW-Authenticate": "Bearer"})
+        counts = task_registry.count_by_status()
+        gauges = {
+            "excelmerger_tasks": [({"status": status}, n) for status, n in counts.items()],
+            "excelmerger_queue_depth": [({}, counts.get("queued", 0))],
+            "excelmerger_merge_slots_busy": [({}, counts.get("running", 0))],
+        }
+        return Response(
+            metrics.render(gauges),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+    def send_task_result(task_id: str):
+        """Response with a completed task's output, for /download and the API."""
         metadata = load_task_metadata(task_id)
         if not metadata:
             return "任务不存在或已过期", 404
@@ -478,6 +1239,14 @@ def create_app() -> Flask:
             cleanup_job_dir(upload_root / task_id)
             return "文件不存在", 404
 
+        try:
+            # Storage eviction removes the least recently downloaded results first.
+            task_registry.update(
+                task_id, last_downloaded_at=datetime.now(timezone.utc).isoformat()
+            )
+        except sqlite3.Error as exc:
+            logger.warning("Failed to record download of %s: %s", task_id, exc)
+
         fmt = metadata.get("format", "xlsx")
         requested_name = request.args.get("filename", "")
         filename = sanitize_download_name(requested_name, fmt)
@@ -488,21 +1257,82 @@ def create_app() -> Flask:
                 "application/vnd.openxmlformats-officedocument."
                 "spreadsheetml.sheet"
             )
-        return send_file(
+
+        accel_prefix = app.config["DOWNLOAD_ACCEL_PREFIX"]
+        if accel_prefix:
+            # nginx serves the file itself, with Range and conditional requests.
+            response = Response(mimetype=mimetype)
+            response.headers["X-Accel-Redirect"] = (
+                f"{accel_prefix.rstrip('/')}/{quote(task_id)}/{quote(output_path.name)}"
+            )
+            set_attachment(response.headers, filename)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+
+        encoding = None
+        if (
+            fmt == "csv"
+            and app.config["DOWNLOAD_GZIP"]
+            and request.accept_encodings["gzip"]
+        ):
+            # Merges write the gzip copy with the result; compressing during
+            # the request is limited to small results written without one.
+            compressed = fresh_gzip_variant(output_path)
+            if (
+                compressed is None
+                and output_path.stat().st_size <= app.config["DOWNLOAD_GZIP_MAX_BYTES"]
+            ):
+                try:
+                    compressed = gzip_variant(output_path)
+                except OSError as exc:
+                    logger.warning("Failed to gzip %s: %s", output_path, exc)
+            if compressed is not None:
+                output_path = compressed
+                encoding = "gzip"
+
+        # conditional=True answers Range and If-None-Match / If-Range from the
+        # file's ETag, so interrupted downloads resume and repeats are 304s.
+        response = send_file(
             output_path,
             as_attachment=True,
             download_name=filename,
             mimetype=mimetype,
+            conditional=True,
+            etag=True,
         )
+        if fmt == "csv" and app.config["DOWNLOAD_GZIP"]:
+            response.vary.add("Accept-Encoding")
+        if encoding:
+            response.content_encoding = encoding
+        response.cache_control.private = True
+        return response
+
+    @app.route("/download/<task_id>")
+    @login_required
+    def download_result(task_id: str):
+        return send_task_result(task_id)
 
     @app.after_request
     def disable_cache(response):
-        """Disable caching to avoid stale HTML/JS during rapid iterations."""
-        response.headers["Cache-Control"] = "no-store"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+        """Disable caching of HTML pages to avoid stale pages during rapid iterations.
+
+        Result downloads and static files keep their ETag and Last-Modified
+        validators so browsers can resume and revalidate them.
+        """
+        if response.mimetype == "text/html":
+            response.headers["Cache-Control"] = "no-store"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
         return response
 
+    @app.after_request
+    def compress_json(response):
+        """Gzip large JSON bodies such as /inspect previews and task status."""
+        return gzip_json_response(
+            response, request.accept_encodings, app.config["JSON_GZIP_MIN_BYTES"]
+        )
+
     def sanitize_json(obj):
         """Recursively replace NaN/inf with None for strict JSON."""
         if isinstance(obj, float):
@@ -540,11 +1370,14 @@ def create_app() -> Flask:
         skipped = 0
         errors = []
         now = datetime.now(timezone.utc)
+        created_times = task_registry.created_times()
         for item in upload_root.iterdir():
             if not item.is_dir():
                 continue
-            metadata = load_task_metadata(item.name)
-            created_at = get_task_expiry_reference(item, metadata)
+            created_at = created_times.get(item.name)
+            if created_at is None:
+                metadata = load_task_metadata(item.name)
+                created_at = get_task_expiry_reference(item, metadata)
             if created_at is None:
                 skipped += 1
                 continue
@@ -554,6 +1387,7 @@ def create_app() -> Flask:
                 continue
             try:
                 shutil.rmtree(item)
+                task_registry.delete(item.name)
                 removed += 1
             except Exception as exc:  # noqa: BLE001
                 errors.append(f"{item}: {exc}")
@@ -614,95 +1448,526 @@ def create_app() -> Flask:
             return jsonify({"ok": False, "error": "上传大小超出限制"}), 413
 
         files = request.files.getlist("files")
-        if not files:
+        upload_id = request.form.get("upload_id", "").strip()
+        upload = None
+        if upload_id:
+            # Files sent earlier through the chunked upload API.
+            upload = load_upload_session(upload_id)
+            if upload is None:
+                return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+            if upload.get("status") != "uploaded":
+                return jsonify({"ok": False, "error": "文件尚未上传完成"}), 409
+            files = []
+        elif not files:
             return jsonify({"ok": False, "error": "请上传文件"}), 400
+        rejected = storage_full_response(request.content_length or 0)
+        if rejected is not None:
+            return rejected
 
         normalize_columns = request.form.get("normalize_columns") == "on"
         enable_fuzzy = request.form.get("enable_fuzzy") == "on"
 
-        job_dir = app.config["UPLOAD_ROOT"] / Path(str(uuid4()))
+        # The uploads stay on disk as an upload session that /merge can reuse.
+        if upload is None:
+            upload_id = str(uuid4())
+        job_dir = upload_root / upload_id
         job_dir.mkdir(parents=True, exist_ok=True)
 
-        previews = []
-        column_info = {}
-        mapping_report = {}
+        keep_session = upload is not None
 
         try:
+            writer = new_upload_writer()
+            inputs = list(upload["inputs"]) if upload is not None else []
             for f in files:
                 if not f or not f.filename:
                     continue
                 if not allowed_file(f.filename):
-                    cleanup_job_dir(job_dir)
                     return (
                         jsonify({"ok": False, "error": f"不支持的文件类型: {f.filename}"}),
                         400,
                     )
-                dest = job_dir / Path(f.filename).name
-                f.save(dest)
-
-            merger = ExcelMergerCore(ConfigManager())
-
-            for file_path in job_dir.iterdir():
-                sheets = read_file(str(file_path))
-                for sheet_name, df in sheets.items():
-                    if normalize_columns:
-                        df = merger.normalize_columns(df, enable_fuzzy=enable_fuzzy)
-                        current_mapping = merger.get_mapping_report()
-                        if current_mapping:
-                            mapping_report[
-                                f"{file_path.name}-{sheet_name}"
-                            ] = current_mapping
-
-                    filename_without_ext = file_path.stem
-                    df.insert(0, "来源文件", filename_without_ext)
-                    df.insert(1, "工作表", sheet_name)
-
-                    # 记录列信息（以映射后列名为准）
-                    for col in df.columns:
-                        col_key = str(col)
-                        if col_key not in column_info:
-                            column_info[col_key] = {
-                                "sources": set(),
-                                "is_meta": col_key in {"来源文件", "工作表"},
-                            }
-                        column_info[col_key]["sources"].add(
-                            f"{file_path.name}-{sheet_name}"
-                        )
-
-                    preview_df = df.head(5).copy()
-                    preview_df = preview_df.where(pd.notnull(preview_df), None)
-                    previews.append(
-                        {
-                            "file": file_path.name,
-                            "sheet": sheet_name,
-                            "columns": list(df.columns),
-                            "rows": preview_df.to_dict(orient="records"),
-                        }
-                    )
+                try:
+                    saved = writer.save(f.stream, job_dir / Path(f.filename).name)
+                except UploadTooLarge as exc:
+                    return jsonify({"ok": False, "error": str(exc)}), 413
+                inputs.append(
+                    {"name": saved.path.name, "size": saved.size, "sha256": saved.sha256}
+                )
 
-            # 转换 set -> list
-            columns_payload = [
-                {
-                    "name": name,
-                    "sources": sorted(info["sources"]),
-                    "is_meta": info["is_meta"],
-                }
-                for name, info in sorted(column_info.items())
+            names = [item["name"] for item in inputs]
+            run_id = uuid4().hex
+            created_at = datetime.now(timezone.utc)
+            expires_at = created_at + timedelta(
+                minutes=app.config["UPLOAD_SESSION_MINUTES"]
+            )
+            # Saved before parsing starts: files that miss the time budget
+            # record their result on this session when they finish.
+            session_fields = {
+                "inspection_run": run_id,
+                "inspection_names": names,
+                "inspection_files": {},
+                "expires_at": expires_at.isoformat(),
+            }
+            if upload is not None:
+                task_registry.update(upload_id, **session_fields)
+            else:
+                save_task_metadata(
+                    upload_id,
+                    {
+                        "kind": "upload",
+                        "status": "uploaded",
+                        "created_at": created_at.isoformat(),
+                        "client": merge_client_key(),
+                        "inputs": inputs,
+                        **session_fields,
+                    },
+                )
+            janitor.schedule(upload_id, expires_at)
+            keep_session = True
+
+            futures = [
+                inspect_pool.submit(
+                    inspect_and_record,
+                    upload_id,
+                    run_id,
+                    job_dir / name,
+                    normalize_columns,
+                    enable_fuzzy,
+                )
+                for name in names
             ]
-
+            budget = app.config["INSPECT_TIME_BUDGET_SECONDS"]
+            _, not_done = wait_futures(futures, timeout=budget if budget > 0 else None)
+            if not_done:
+                logger.info(
+                    "Inspect of %s: %d of %d files still parsing after %ss",
+                    upload_id, len(not_done), len(futures), budget,
+                )
+            metadata = load_task_metadata(upload_id) or {}
+            inspection = build_inspection(names, metadata.get("inspection_files", {}))
+            if inspection["errors"] and not inspection["previews"] and not inspection["pending"]:
+                error = "; ".join(f"{e['file']}: {e['error']}" for e in inspection["errors"])
+                return jsonify({"ok": False, "error": error, "upload_id": upload_id}), 500
             return jsonify(
                 {
-                    "ok": True,
-                    "columns": sanitize_json(columns_payload),
-                    "previews": sanitize_json(previews),
-                    "mapping": sanitize_json(mapping_report),
+                    **inspection,
+                    "upload_id": upload_id,
+                    "upload_expires_at": expires_at.isoformat(),
                 }
             )
         except Exception as exc:  # noqa: BLE001
             logger.error("Inspect failed: %s\n%s", exc, traceback.format_exc())
             return jsonify({"ok": False, "error": str(exc)}), 500
         finally:
+            if not keep_session:
+                cleanup_job_dir(job_dir)
+
+    def inspect_file(file_path: Path, normalize_columns: bool, enable_fuzzy: bool) -> dict:
+        """Columns, previews and column mapping of one uploaded file."""
+        merger = ExcelMergerCore(ConfigManager())
+        sample_threshold = app.config["INSPECT_SAMPLE_THRESHOLD_BYTES"]
+        sampled = 0 < sample_threshold < file_path.stat().st_size
+        if sampled:
+            # Large files: header, head rows and a random sample only.
+            samples = sample_file(
+                str(file_path),
+                head_rows=app.config["INSPECT_HEAD_ROWS"],
+                sample_rows=app.config["INSPECT_SAMPLE_ROWS"],
+            )
+            sheets = {name: info["frame"] for name, info in samples.items()}
+        else:
+            samples = {}
+            sheets = read_file(str(file_path))
+            # Cache the raw parse so an in-memory merge can skip re-reading.
+            store_parsed(file_path, None, sheets)
+
+        previews = []
+        columns = {}
+        mapping_report = {}
+        for sheet_name, df in sheets.items():
+            sample = samples.get(sheet_name)
+            source = f"{file_path.name}-{sheet_name}"
+            if normalize_columns:
+                df = merger.normalize_columns(df, enable_fuzzy=enable_fuzzy)
+                current_mapping = merger.get_mapping_report()
+                if current_mapping:
+                    mapping_report[source] = current_mapping
+
+            # Types and null rates of the sample when the file was sampled.
+            column_stats = column_profile(df)
+            df.insert(0, "来源文件", file_path.stem)
+            df.insert(1, "工作表", sheet_name)
+
+            # 记录列信息（以映射后列名为准）
+            for col in df.columns:
+                columns.setdefault(str(col), []).append(source)
+
+            previews.append(
+                {
+                    "file": file_path.name,
+                    "sheet": sheet_name,
+                    "columns": [str(col) for col in df.columns],
+                    "rows": frame_records(df.head(5)),
+                    "sampled": sample is not None and not sample["exact"],
+                    "row_count": (
+                        sample["estimated_rows"] if sample is not None else len(df)
+                    ),
+                    "column_stats": column_stats,
+                }
+            )
+            if sample is not None and sample["truncated"]:
+                # The time limit stopped the scan: the sample only covers the
+                # first rows_scanned rows, not the whole sheet.
+                previews[-1]["sample_truncated"] = True
+                previews[-1]["sample_rows_scanned"] = sample["rows_scanned"]
+        return {
+            "previews": previews,
+            "columns": columns,
+            "mapping": sanitize_json(mapping_report),
+        }
+
+    def inspect_and_record(
+        upload_id: str,
+        run_id: str,
+        file_path: Path,
+        normalize_columns: bool,
+        enable_fuzzy: bool,
+    ) -> None:
+        """Inspect one file in the pool and store the result on its upload session.
+
+        Results of an /inspect run that a newer run of the same upload has
+        replaced are dropped.
+        """
+        try:
+            result = inspect_file(file_path, normalize_columns, enable_fuzzy)
+        except Exception as exc:  # noqa: BLE001
+            logger.error(
+                "Inspect of %s failed: %s\n%s", file_path.name, exc, traceback.format_exc()
+            )
+            result = {"error": str(exc)}
+
+        def record(metadata: dict) -> bool:
+            if metadata.get("inspection_run") != run_id:
+                return False
+            metadata.setdefault("inspection_files", {})[file_path.name] = result
+            return True
+
+        try:
+            task_registry.modify(upload_id, record)
+        except (TypeError, ValueError, sqlite3.Error) as exc:
+            # Otherwise the file would stay pending: record the failure instead.
+            logger.error(
+                "Failed to store inspect result of %s: %s\n%s",
+                file_path.name, exc, traceback.format_exc(),
+            )
+            result = {"error": f"分析结果保存失败: {exc}"}
+            try:
+                task_registry.modify(upload_id, record)
+            except sqlite3.Error as retry_exc:
+                logger.error(
+                    "Failed to record inspect error of %s: %s", file_path.name, retry_exc
+                )
+
+    def build_inspection(names: list[str], results: dict) -> dict:
+        """Combine per-file inspect results in upload order.
+
+        Files still being parsed are listed under ``pending``; files that
+        failed to parse under ``errors``.
+        """
+        previews, pending, errors = [], [], []
+        mapping_report = {}
+        column_info = {}
+        for name in names:
+            result = results.get(name)
+            if result is None:
+                pending.append(name)
+                continue
+            if "error" in result:
+                errors.append({"file": name, "error": result["error"]})
+                continue
+            previews.extend(result["previews"])
+            mapping_report.update(result["mapping"])
+            for col, sources in result["columns"].items():
+                column_info.setdefault(col, set()).update(sources)
+        return {
+            "ok": True,
+            "columns": [
+                {
+                    "name": name,
+                    "sources": sorted(sources),
+                    "is_meta": name in {"来源文件", "工作表"},
+                }
+                for name, sources in sorted(column_info.items())
+            ],
+            "previews": previews,
+            "mapping": mapping_report,
+            "pending": pending,
+            "errors": errors,
+        }
+
+    def load_upload_session(upload_id: str) -> dict | None:
+        """An upload session owned by the current login session, if still alive."""
+        if not upload_id or Path(upload_id).name != upload_id:
+            return None
+        metadata = load_task_metadata(upload_id)
+        if not metadata or metadata.get("kind") != "upload":
+            return None
+        if metadata.get("client") != merge_client_key():
+            return None
+        if not (upload_root / upload_id).is_dir():
+            return None
+        return metadata
+
+    @app.route("/upload/<upload_id>")
+    @login_required
+    def upload_session(upload_id: str):
+        """Return an upload session: chunk progress while uploading, else its files
+        and the stored /inspect result."""
+        metadata = load_upload_session(upload_id)
+        if metadata is None:
+            return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+        return jsonify(upload_session_payload(upload_id, metadata))
+
+    def upload_session_payload(upload_id: str, metadata: dict) -> dict:
+        payload = {
+            **(
+                build_inspection(
+                    metadata["inspection_names"], metadata.get("inspection_files", {})
+                )
+                if "inspection_names" in metadata
+                else {"ok": True}
+            ),
+            "upload_id": upload_id,
+            "status": metadata.get("status"),
+            "upload_expires_at": metadata.get("expires_at"),
+        }
+        if metadata.get("status") == "uploaded":
+            payload["files"] = metadata["inputs"]
+        else:
+            chunk_size = metadata["chunk_size"]
+            payload["chunk_size"] = chunk_size
+            payload["files"] = [
+                {
+                    "name": item["name"],
+                    "size": item["size"],
+                    "chunks": chunk_count(item["size"], chunk_size),
+                    "received": sorted(item["received"]),
+                }
+                for item in metadata["files"]
+            ]
+        return payload
+
+    def extend_upload_session(metadata: dict) -> datetime:
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            minutes=app.config["UPLOAD_SESSION_MINUTES"]
+        )
+        metadata["expires_at"] = expires_at.isoformat()
+        return expires_at
+
+    @app.route("/upload", methods=["POST"])
+    @login_required
+    def create_upload_session():
+        """Start a chunked upload.
+
+        Body: ``{"files": [{"name": ..., "size": ...}, ...]}``. Each file is
+        then sent with ``PUT /upload/<id>/files/<index>?offset=<n>`` in
+        ``chunk_size`` pieces (any order, in parallel) and completed with
+        ``POST /upload/<id>/finalize``. The session works like one kept by
+        /inspect: /inspect and /merge accept its ``upload_id``.
+        """
+        body = request.get_json(silent=True) or {}
+        declared = body.get("files")
+        if not isinstance(declared, list) or not declared:
+            return jsonify({"ok": False, "error": "请上传文件"}), 400
+
+        files = []
+        for item in declared:
+            name = Path(str((item or {}).get("name", ""))).name
+            size = (item or {}).get("size")
+            if not name or not isinstance(size, int) or size < 0:
+                return jsonify({"ok": False, "error": "文件信息无效"}), 400
+            if not allowed_file(name):
+                return jsonify({"ok": False, "error": f"不支持的文件类型: {name}"}), 400
+            if any(existing["name"] == name for existing in files):
+                return jsonify({"ok": False, "error": f"文件名重复: {name}"}), 400
+            files.append({"name": name, "size": size, "received": []})
+        total_size = sum(item["size"] for item in files)
+        if total_size > app.config["CHUNKED_UPLOAD_MAX_BYTES"]:
+            return jsonify({"ok": False, "error": "上传文件总大小超出限制"}), 413
+        rejected = storage_full_response(total_size)
+        if rejected is not None:
+            return rejected
+
+        upload_id = str(uuid4())
+        job_dir = upload_root / upload_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            for item in files:
+                allocate_partial(job_dir / item["name"], item["size"])
+            metadata = {
+                "kind": "upload",
+                "status": "uploading",
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "client": merge_client_key(),
+                "chunk_size": app.config["UPLOAD_CHUNK_BYTES"],
+                "files": files,
+                "inputs": [],
+            }
+            expires_at = extend_upload_session(metadata)
+            save_task_metadata(upload_id, metadata)
+        except Exception as exc:  # noqa: BLE001
             cleanup_job_dir(job_dir)
+            logger.error("Upload init failed: %s\n%s", exc, traceback.format_exc())
+            return jsonify({"ok": False, "error": str(exc)}), 500
+        janitor.schedule(upload_id, expires_at)
+        return jsonify(upload_session_payload(upload_id, metadata)), 201
+
+    @app.route("/upload/<upload_id>/files/<int:index>", methods=["PUT"])
+    @login_required
+    def upload_chunk(upload_id: str, index: int):
+        """Write one chunk at ``?offset=`` straight into the session's ``.part`` file.
+
+        Re-sending a chunk is harmless, so clients simply retry failed PUTs
+        and, after a disconnect, send the chunks GET /upload/<id> does not
+        list as received. An optional ``X-Chunk-SHA256`` header is verified.
+        """
+        metadata = load_upload_session(upload_id)
+        if metadata is None:
+            return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+        if metadata.get("status") != "uploading":
+            return jsonify({"ok": False, "error": "上传已完成，不再接收分块"}), 409
+        if not 0 <= index < len(metadata["files"]):
+            return jsonify({"ok": False, "error": "文件不存在"}), 404
+        item = metadata["files"][index]
+        chunk_size = metadata["chunk_size"]
+        offset = request.args.get("offset", type=int)
+        if offset is None or offset < 0 or offset % chunk_size or (
+            offset and offset >= item["size"]
+        ):
+            return jsonify({"ok": False, "error": "分块偏移无效"}), 400
+        chunk = offset // chunk_size
+        length = min(chunk_size, item["size"] - offset)
+
+        try:
+            write_chunk(
+                request.stream,
+                partial_path(upload_root / upload_id / item["name"]),
+                offset,
+                length,
+                request.headers.get("X-Chunk-SHA256"),
+            )
+        except ChunkRejected as exc:
+            return jsonify({"ok": False, "error": str(exc)}), 400
+        except FileNotFoundError:
+            return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+
+        def record(current: dict) -> bool:
+            if current.get("status") != "uploading":
+                return False
+            received = current["files"][index]["received"]
+            if chunk not in received:
+                received.append(chunk)
+            extend_upload_session(current)
+            return True
+
+        updated = task_registry.modify(upload_id, record)
+        if updated is None:
+            return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+        return jsonify(
+            {
+                "ok": True,
+                "chunk": chunk,
+                "received": len(updated["files"][index]["received"]),
+                "chunks": chunk_count(item["size"], chunk_size),
+            }
+        )
+
+    @app.route("/upload/<upload_id>/finalize", methods=["POST"])
+    @login_required
+    def finalize_upload(upload_id: str):
+        """Check every chunk arrived, verify checksums and publish the files.
+
+        Body (optional): ``{"sha256": {"<name>": "<hex digest>"}}``. A file
+        whose digest does not match has its chunks reset so the client can
+        send it again.
+        """
+        body = request.get_json(silent=True) or {}
+        expected = body.get("sha256")
+        if not isinstance(expected, dict):
+            expected = {}
+        current = load_upload_session(upload_id)
+        if current is None:
+            return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+        if current.get("status") == "uploaded":
+            return jsonify(upload_session_payload(upload_id, current))
+        # Only one request verifies the files; parallel finalize calls wait.
+        metadata = task_registry.transition(upload_id, {"uploading"}, status="finalizing")
+        if metadata is None:
+            return jsonify({"ok": False, "error": "上传正在校验，请稍候"}), 409
+
+        chunk_size = metadata["chunk_size"]
+        job_dir = upload_root / upload_id
+        missing = {
+            item["name"]: sorted(
+                set(range(chunk_count(item["size"], chunk_size))) - set(item["received"])
+            )
+            for item in metadata["files"]
+        }
+        missing = {name: chunks for name, chunks in missing.items() if chunks}
+        if missing:
+            task_registry.transition(upload_id, {"finalizing"}, status="uploading")
+            return jsonify({"ok": False, "error": "仍有分块未上传", "missing": missing}), 409
+
+        inputs = []
+        corrupted = []
+        try:
+            for item in metadata["files"]:
+                digest = file_sha256(partial_path(job_dir / item["name"]))
+                if str(expected.get(item["name"], digest)).lower() != digest:
+                    corrupted.append(item["name"])
+                inputs.append({"name": item["name"], "size": item["size"], "sha256": digest})
+        except OSError:
+            cleanup_job_dir(job_dir)
+            return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+        if corrupted:
+
+            def reset(current: dict) -> None:
+                current["status"] = "uploading"
+                for item in current["files"]:
+                    if item["name"] in corrupted:
+                        item["received"] = []
+
+            task_registry.modify(upload_id, reset)
+            return (
+                jsonify(
+                    {
+                        "ok": False,
+                        "error": f"文件校验失败，请重新上传: {', '.join(corrupted)}",
+                        "corrupted": corrupted,
+                    }
+                ),
+                422,
+            )
+
+        for item in inputs:
+            partial_path(job_dir / item["name"]).replace(job_dir / item["name"])
+
+        def publish(current: dict) -> None:
+            current.update(status="uploaded", inputs=inputs)
+            current.pop("files", None)
+            extend_upload_session(current)
+
+        metadata = task_registry.modify(upload_id, publish)
+        if metadata is None:
+            return jsonify({"ok": False, "error": "上传会话不存在或已过期"}), 410
+        janitor.schedule(upload_id, parse_utc_datetime(metadata["expires_at"]))
+        logger.info(
+            "Chunked upload %s finalized: %s files, %s bytes",
+            upload_id,
+            len(inputs),
+            sum(item["size"] for item in inputs),
+        )
+        return jsonify(upload_session_payload(upload_id, metadata))
 
     return app
 
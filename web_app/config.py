@@ -25,10 +25,153 @@ class WebConfig:
     UPLOAD_ROOT: Path = Path(
         os.getenv("MERGER_UPLOAD_ROOT", "/tmp/excel_webdatamerger")
     )
+    # SQLite task registry; defaults to <UPLOAD_ROOT>/tasks.sqlite3
+    TASK_DB_PATH: Path | None = (
+        Path(os.environ["MERGER_TASK_DB"]) if os.getenv("MERGER_TASK_DB") else None
+    )
     ALLOWED_EXTENSIONS = {".xlsx", ".xls", ".csv", ".txt"}
     MAX_CONTENT_LENGTH: int = int(
         float(os.getenv("MERGER_MAX_CONTENT_MB", "50")) * 1024 * 1024
     )
+    # Per-file cap, enforced while the upload is copied to disk
+    MAX_FILE_BYTES: int = int(
+        float(os.getenv("MERGER_MAX_FILE_MB", os.getenv("MERGER_MAX_CONTENT_MB", "50")))
+        * 1024
+        * 1024
+    )
+
+    # Result downloads: with MERGER_X_ACCEL_PREFIX set (e.g. "/_results/"),
+    # nginx serves files from an internal location aliased to UPLOAD_ROOT.
+    # Otherwise CSV results go out gzip-encoded to clients that accept it;
+    # the merge worker writes the compressed copy with the result. Results
+    # without one (e.g. written before it was enabled) are only compressed
+    # during a download up to DOWNLOAD_GZIP_MAX_BYTES and sent as is above.
+    DOWNLOAD_ACCEL_PREFIX: str = os.getenv("MERGER_X_ACCEL_PREFIX", "")
+    DOWNLOAD_GZIP: bool = (
+        os.getenv("MERGER_DOWNLOAD_GZIP", "true").lower() in {"1", "true", "yes", "on"}
+    )
+    DOWNLOAD_GZIP_MAX_BYTES: int = int(
+        float(os.getenv("MERGER_DOWNLOAD_GZIP_MAX_MB", "32")) * 1024 * 1024
+    )
+
+    # Pandas dtype backend for merges: "numpy" (default) or "arrow" (needs pyarrow)
+    DTYPE_BACKEND: str = os.getenv("MERGER_DTYPE_BACKEND", "numpy")
+
+    # Memory budget shared by concurrent merges (MB); 0 = 60% of physical RAM.
+    # Tasks wait in the queue until their estimate fits; tasks larger than the
+    # whole budget run on the chunked path with STREAM_CHUNK_ROWS rows per chunk.
+    MEMORY_BUDGET_MB: float = float(os.getenv("MERGER_MEMORY_BUDGET_MB", "0"))
+    STREAM_CHUNK_ROWS: int = int(os.getenv("MERGER_STREAM_CHUNK_ROWS", "50000"))
+
+    # Merge execution: "thread" runs merges in this web worker, "process" in a
+    # pool of warm worker processes, "queue" leaves them to standalone
+    # `python -m web_app.worker` daemons. MERGE_WORKERS caps concurrent merges
+    # (0 = one per CPU); process workers exit after MERGE_WORKER_MAX_TASKS
+    # tasks to hand fragmented memory back to the OS (0 = never recycle).
+    MERGE_EXECUTOR: str = os.getenv("MERGER_MERGE_EXECUTOR", "thread").lower()
+    MERGE_WORKERS: int = int(os.getenv("MERGER_MERGE_WORKERS", "2"))
+    MERGE_WORKER_MAX_TASKS: int = int(os.getenv("MERGER_MERGE_WORKER_MAX_TASKS", "1"))
+
+    # Fair scheduling: queued merges are taken round-robin per login session.
+    # A session runs at most MERGE_USER_CONCURRENCY merges at once; new
+    # merges get HTTP 429 once MERGE_QUEUE_MAX tasks are waiting overall or
+    # MERGE_USER_QUEUE_MAX for that session. Limits apply per web worker.
+    MERGE_USER_CONCURRENCY: int = int(os.getenv("MERGER_MERGE_USER_CONCURRENCY", "1"))
+    MERGE_QUEUE_MAX: int = int(os.getenv("MERGER_MERGE_QUEUE_MAX", "50"))
+    MERGE_USER_QUEUE_MAX: int = int(os.getenv("MERGER_MERGE_USER_QUEUE_MAX", "10"))
+
+    # Running tasks hold a lease renewed every third of TASK_LEASE_SECONDS.
+    # When a runner dies its lease expires: worker daemon jobs are re-queued
+    # up to TASK_MAX_ATTEMPTS times, other tasks are marked failed.
+    TASK_LEASE_SECONDS: float = float(os.getenv("MERGER_TASK_LEASE_SECONDS", "60"))
+    TASK_MAX_ATTEMPTS: int = int(os.getenv("MERGER_TASK_MAX_ATTEMPTS", "3"))
+    WORKER_POLL_SECONDS: float = float(os.getenv("MERGER_WORKER_POLL_SECONDS", "1"))
+
+    # Server-Sent Events for task progress. Off by default: each open stream
+    # holds a worker thread, so enable it only with threaded gunicorn workers
+    # (--worker-class gthread). How often a stream re-reads the registry for
+    # updates from other workers, and how long before the browser is asked
+    # to reconnect (keep it below the gunicorn --timeout).
+    SSE_ENABLED: bool = (
+        os.getenv("MERGER_SSE_ENABLED", "false").lower() in {"1", "true", "yes", "on"}
+    )
+    SSE_POLL_SECONDS: float = float(os.getenv("MERGER_SSE_POLL_SECONDS", "1"))
+    SSE_MAX_SECONDS: float = float(os.getenv("MERGER_SSE_MAX_SECONDS", "25"))
 
-    # Cleanup policy (in minutes) for temporary results; currently informational
+    # JSON API (/api/v1/merges) for scripts: comma-separated bearer tokens,
+    # each optionally "name:token" so logs and fair scheduling can tell
+    # clients apart (empty: API disabled). API requests may reference files
+    # on this server by path only under API_LOCAL_ROOTS (os.pathsep-separated
+    # directories). A request waits at most API_MAX_WAIT_SECONDS for its merge,
+    # counted from its arrival; keep it below the gunicorn --timeout (30 s by
+    # default), since a waiting request holds its worker.
+    API_TOKENS: str = os.getenv("MERGER_API_TOKENS", "")
+    API_LOCAL_ROOTS: str = os.getenv("MERGER_API_LOCAL_ROOTS", "")
+    API_MAX_WAIT_SECONDS: float = float(os.getenv("MERGER_API_MAX_WAIT_SECONDS", "25"))
+
+    # Bearer token that lets a Prometheus scraper read /metrics without a
+    # login session (empty: /metrics needs a login)
+    METRICS_TOKEN: str = os.getenv("MERGER_METRICS_TOKEN", "")
+
+    # Every merge stores a timing profile (GET /task/<id>/profile). Set to
+    # "cprofile" or "pyinstrument" (must be installed) to also save a
+    # code-level capture per merge for debugging; it slows merges down.
+    MERGE_PROFILER: str = os.getenv("MERGER_MERGE_PROFILER", "").lower()
+
+    # Cleanup policy (in minutes) for temporary results. A background janitor
+    # expires job dirs on schedule and rescans UPLOAD_ROOT every
+    # JANITOR_RECONCILE_SECONDS to catch tasks created by other workers.
     CLEANUP_MINUTES: int = int(os.getenv("MERGER_CLEANUP_MINUTES", "120"))
+    # Storage limits for UPLOAD_ROOT: when job dirs exceed STORAGE_QUOTA_BYTES
+    # or free space drops below STORAGE_MIN_FREE_BYTES, finished results are
+    # evicted least recently downloaded first, and uploads that still do not
+    # fit get HTTP 507. Both are off by default (0 disables a limit).
+    STORAGE_QUOTA_BYTES: int = int(float(os.getenv("MERGER_STORAGE_QUOTA_MB", "0")) * 1024 * 1024)
+    STORAGE_MIN_FREE_BYTES: int = int(
+        float(os.getenv("MERGER_STORAGE_MIN_FREE_MB", "0")) * 1024 * 1024
+    )
+    # Uploads kept by /inspect for reuse by /merge expire after this long
+    UPLOAD_SESSION_MINUTES: int = int(os.getenv("MERGER_UPLOAD_SESSION_MINUTES", "30"))
+    # Chunked uploads: chunk size, and total size per upload session (they
+    # bypass MAX_CONTENT_LENGTH, which then only bounds each chunk request)
+    UPLOAD_CHUNK_BYTES: int = int(
+        float(os.getenv("MERGER_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+    )
+    CHUNKED_UPLOAD_MAX_BYTES: int = int(
+        float(os.getenv("MERGER_CHUNKED_UPLOAD_MAX_MB", "1024")) * 1024 * 1024
+    )
+    # Serve identical merges (same files, options and mapping rules) from an
+    # earlier task's output while that task is still within CLEANUP_MINUTES
+    RESULT_CACHE_ENABLED: bool = (
+        os.getenv("MERGER_RESULT_CACHE", "true").lower() in {"1", "true", "yes", "on"}
+    )
+    # Save merged rows as an Arrow sidecar (needs pyarrow) so results can be
+    # paged through /task/<task_id>/rows without downloading them
+    RESULT_PREVIEW_ENABLED: bool = (
+        os.getenv("MERGER_RESULT_PREVIEW", "true").lower() in {"1", "true", "yes", "on"}
+    )
+    # /inspect samples files larger than this instead of parsing every row:
+    # header, the first INSPECT_HEAD_ROWS rows and INSPECT_SAMPLE_ROWS rows
+    # from random offsets; row counts are estimated from file metadata
+    INSPECT_SAMPLE_THRESHOLD_BYTES: int = int(
+        float(os.getenv("MERGER_INSPECT_SAMPLE_MB", "20")) * 1024 * 1024
+    )
+    INSPECT_HEAD_ROWS: int = int(os.getenv("MERGER_INSPECT_HEAD_ROWS", "200"))
+    INSPECT_SAMPLE_ROWS: int = int(os.getenv("MERGER_INSPECT_SAMPLE_ROWS", "1000"))
+    # /inspect parses files in a pool of INSPECT_WORKERS threads and answers
+    # after INSPECT_TIME_BUDGET_SECONDS (0: wait for all); files still being
+    # parsed are listed as pending and appear on GET /upload/<upload_id>
+    INSPECT_WORKERS: int = int(os.getenv("MERGER_INSPECT_WORKERS", "4"))
+    INSPECT_TIME_BUDGET_SECONDS: float = float(os.getenv("MERGER_INSPECT_BUDGET_SECONDS", "20"))
+    # JSON responses: "auto" uses orjson when installed, "std" the stdlib
+    # encoder; bodies of at least JSON_GZIP_MIN_BYTES are gzip-compressed
+    # for clients that accept it (0 disables)
+    JSON_ENCODER: str = os.getenv("MERGER_JSON_ENCODER", "auto").lower()
+    JSON_GZIP_MIN_BYTES: int = int(float(os.getenv("MERGER_JSON_GZIP_KB", "32")) * 1024)
+    JANITOR_ENABLED: bool = (
+        os.getenv("MERGER_JANITOR_ENABLED", "true").lower()
+        in {"1", "true", "yes", "on"}
+    )
+    JANITOR_RECONCILE_SECONDS: float = float(
+        os.getenv("MERGER_JANITOR_RECONCILE_SECONDS", "300")
+    )
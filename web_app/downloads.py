@@ -0,0 +1,68 @@
+"""Result download helpers for excel_webdatamerger."""
+import gzip
+import os
+import shutil
+import tempfile
+import unicodedata
+from pathlib import Path
+from urllib.parse import quote
+
+from werkzeug.datastructures import Headers
+
+from .uploads import COPY_BUFFER_BYTES
+
+GZIP_SUFFIX = ".gz"
+
+
+def set_attachment(headers: Headers, filename: str) -> None:
+    """Content-Disposition for ``filename``, RFC 5987-encoded when not ASCII."""
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename)
+        simple = simple.encode("ascii", "ignore").decode("ascii")
+        quoted = quote(filename, safe="!#$&+-.^_`|~")
+        headers.set(
+            "Content-Disposition", "attachment", filename=simple, **{"filename*": f"UTF-8''{quoted}"}
+        )
+    else:
+        headers.set("Content-Disposition", "attachment", filename=filename)
+
+
+def fresh_gzip_variant(path: Path) -> Path | None:
+    """The gzip copy of ``path`` if one exists and is not older than it."""
+    path = Path(path)
+    target = path.with_name(path.name + GZIP_SUFFIX)
+    try:
+        if target.stat().st_mtime >= path.stat().st_mtime:
+            return target
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def gzip_variant(path: Path, compresslevel: int = 6) -> Path:
+    """Return a gzip copy of ``path`` next to it, compressing if needed.
+
+    The copy is a stable file rather than a compressed stream, so Range and
+    ETag requests keep working on the gzip representation. Merge workers
+    build it when a CSV result is written; it is written under a temporary
+    name and renamed, so concurrent downloads never see a partial file, and
+    it lives in the job dir and expires with it.
+    """
+    path = Path(path)
+    existing = fresh_gzip_variant(path)
+    if existing is not None:
+        return existing
+    target = path.with_name(path.name + GZIP_SUFFIX)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(
+            filename=path.name, mode="wb", fileobj=raw, compresslevel=compresslevel
+        ) as out, open(path, "rb") as src:
+            shutil.copyfileobj(src, out, COPY_BUFFER_BYTES)
+        os.replace(tmp_name, target)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return target
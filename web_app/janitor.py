@@ -0,0 +1,106 @@
+"""Background expiry of task directories for excel_webdatamerger."""
+import heapq
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+
+class TaskJanitor:
+    """Expire tasks from an in-memory heap instead of scanning disk per request.
+
+    ``schedule`` is called when a task is created. The worker thread sleeps
+    until the earliest expiry and calls ``expire(task_id)``. That callback
+    returns a new expiry datetime to reschedule the task, or None when the
+    task is gone. Every ``reconcile_seconds`` the heap is rebuilt from
+    ``scan()`` to pick up tasks created by other workers or left over from
+    earlier runs.
+    """
+
+    def __init__(
+        self,
+        expire: Callable[[str], datetime | None],
+        scan: Callable[[], Iterable[tuple[str, datetime]]],
+        *,
+        reconcile_seconds: float,
+        logger,
+    ):
+        self._expire = expire
+        self._scan = scan
+        self._reconcile_seconds = reconcile_seconds
+        self._logger = logger
+        self._heap: list[tuple[float, str]] = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="task-janitor", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def schedule(self, task_id: str, expires_at: datetime) -> None:
+        """Register (or re-register) a task to expire at ``expires_at``."""
+        with self._cond:
+            heapq.heappush(self._heap, (expires_at.timestamp(), task_id))
+            self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def reconcile(self) -> None:
+        """Rebuild the heap from disk."""
+        try:
+            entries = [
+                (expires_at.timestamp(), task_id)
+                for task_id, expires_at in self._scan()
+            ]
+        except Exception as exc:  # noqa: BLE001
+            self._logger.warning("Janitor reconcile failed: %s", exc)
+            return
+        heapq.heapify(entries)
+        with self._cond:
+            self._heap = entries
+            self._cond.notify_all()
+
+    def _pop_due(self, now: float) -> list[str]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def _run(self) -> None:
+        next_reconcile = 0.0
+        while True:
+            now = time.time()
+            if now >= next_reconcile:
+                self.reconcile()
+                next_reconcile = now + self._reconcile_seconds
+
+            with self._cond:
+                if self._stopped:
+                    return
+                due = self._pop_due(time.time())
+                if not due:
+                    wake_at = next_reconcile
+                    if self._heap:
+                        wake_at = min(wake_at, self._heap[0][0])
+                    self._cond.wait(timeout=max(0.0, wake_at - time.time()))
+                    continue
+
+            for task_id in dict.fromkeys(due):
+                try:
+                    new_expiry = self._expire(task_id)
+                except Exception as exc:  # noqa: BLE001
+                    self._logger.warning("Janitor failed to expire %s: %s", task_id, exc)
+                    continue
+                if new_expiry is not None and new_expiry > datetime.now(timezone.utc):
+                    self.schedule(task_id, new_expiry)
@@ -0,0 +1,117 @@
+"""JSON encoding helpers for excel_webdatamerger responses.
+
+Preview rows are converted to JSON-safe records at the DataFrame level
+(NaN, NaT and ±inf become null in one vectorized pass, dates become ISO
+strings). Responses are encoded with orjson when it is installed, and
+large JSON bodies are gzip-compressed for clients that accept it.
+"""
+import datetime
+import gzip
+import math
+
+import numpy as np
+import pandas as pd
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+_INFINITIES = [math.inf, -math.inf]
+
+
+def _json_scalar(value):
+    """Plain JSON value for a cell: dates and times as ISO strings, other
+    non-JSON types (Decimal, bytes, ...) as their ``str``."""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def frame_records(df: pd.DataFrame) -> list[dict]:
+    """``df.to_dict(orient="records")`` with JSON-safe values only.
+
+    NaN, NaT and ±inf become None, dates and times ISO strings and column
+    labels strings, so the records can be stored with ``json.dumps`` (e.g.
+    in the task registry) as well as sent as a response.
+    """
+    frame = df.astype(object)
+    missing = frame.isna() | frame.isin(_INFINITIES)
+    frame = frame.mask(missing, None)
+    frame.columns = [str(col) for col in frame.columns]
+    return [
+        {col: _json_scalar(value) for col, value in record.items()}
+        for record in frame.to_dict(orient="records")
+    ]
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes responses with orjson.
+
+    Types orjson does not handle natively (dates, Decimal, ``__html__``)
+    go through Flask's default conversion, so payloads look the same as
+    with the standard provider; NaN and inf are written as null. Anything
+    orjson rejects (e.g. integers beyond 64 bits) falls back to the
+    standard encoder.
+    """
+
+    OPTIONS = (
+        (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME)
+        if orjson is not None
+        else 0
+    )
+
+    def _encode(self, obj) -> bytes:
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._encode(obj).decode("utf-8")
+        except TypeError:
+            return super().dumps(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = self._encode(obj)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def json_provider_class(encoder: str) -> type[DefaultJSONProvider]:
+    """Provider for ``MERGER_JSON_ENCODER`` (``auto``, ``orjson`` or ``std``)."""
+    if encoder == "std":
+        return DefaultJSONProvider
+    if orjson is None:
+        if encoder == "orjson":
+            raise RuntimeError("MERGER_JSON_ENCODER=orjson requires the orjson package")
+        return DefaultJSONProvider
+    return OrjsonProvider
+
+
+def gzip_json_response(response, accept_encodings, min_bytes: int, compresslevel: int = 5):
+    """Gzip a buffered JSON response of at least ``min_bytes`` in place."""
+    if (
+        min_bytes <= 0
+        or response.mimetype != "application/json"
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not accept_encodings["gzip"]
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=compresslevel))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
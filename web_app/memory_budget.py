@@ -0,0 +1,267 @@
+"""Memory budget governor for merge tasks."""
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Rough in-memory size of a parsed file relative to its size on disk.
+# xlsx is zipped XML and openpyxl keeps a cell object per value, so it
+# expands far more than plain-text formats.
+FORMAT_MEMORY_FACTORS = {
+    ".xlsx": 20.0,
+    ".xls": 6.0,
+    ".csv": 5.0,
+    ".txt": 5.0,
+}
+DEFAULT_MEMORY_FACTOR = 8.0
+# Fixed overhead per task (interpreter state, mapping config, output buffers)
+BASE_TASK_BYTES = 32 * 1024 * 1024
+# Reservation for tasks running on the chunked path
+STREAMING_TASK_BYTES = 256 * 1024 * 1024
+
+
+def estimate_task_memory(paths: list[Path]) -> int:
+    """Estimate the peak memory of an in-memory merge from upload sizes and formats."""
+    parsed = 0
+    for path in paths:
+        try:
+            size = Path(path).stat().st_size
+        except OSError:
+            continue
+        factor = FORMAT_MEMORY_FACTORS.get(
+            Path(path).suffix.lower(), DEFAULT_MEMORY_FACTOR
+        )
+        parsed += int(size * factor)
+    # Per-sheet frames and the concatenated result coexist during concat.
+    return BASE_TASK_BYTES + parsed * 2
+
+
+def detect_total_memory() -> int | None:
+    """Return physical memory in bytes when the platform exposes it."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def resolve_memory_budget(budget_mb: float) -> int:
+    """Turn the configured budget into bytes; 0 means 60% of physical memory."""
+    if budget_mb > 0:
+        return int(budget_mb * 1024 * 1024)
+    total = detect_total_memory()
+    if total:
+        return int(total * 0.6)
+    return 2 * 1024 * 1024 * 1024
+
+
+def current_rss_bytes() -> int | None:
+    """Current resident set size of this process, or None if unavailable."""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is a high-water mark: KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+RESERVATIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_reservations (
+    reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class MemoryGovernor:
+    """Admission control: hold tasks until their estimated footprint fits the budget.
+
+    With ``db_path`` (the task registry's SQLite file) reservations are rows
+    in a shared table, so every gunicorn worker and worker daemon on the
+    host admits merges against one budget instead of each against its own.
+    Rows of processes that died without releasing them are dropped on the
+    next admission. Waiters poll every ``poll_seconds`` for releases made by
+    other processes; releases in this process wake them at once. Without
+    ``db_path`` the budget is per process.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int,
+        db_path: Path | None = None,
+        poll_seconds: float = 0.5,
+        timeout: float = 30.0,
+    ):
+        self.budget_bytes = budget_bytes
+        self.db_path = Path(db_path) if db_path is not None else None
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self._host = socket.gethostname()
+        self._local = threading.local()
+        self._in_use = 0
+        self._cond = threading.Condition()
+        if self.db_path is not None:
+            self._connection().executescript(RESERVATIONS_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @property
+    def in_use(self) -> int:
+        """Bytes reserved now (by every process sharing ``db_path``)."""
+        if self.db_path is None:
+            with self._cond:
+                return self._in_use
+        (used,) = self._connection().execute(
+            "SELECT COALESCE(SUM(bytes), 0) FROM memory_reservations"
+        ).fetchone()
+        return used
+
+    def exceeds_budget(self, estimate: int) -> bool:
+        """True when a task cannot run in memory even on an idle host."""
+        return estimate > self.budget_bytes
+
+    def _try_acquire(self, amount: int):
+        """Reserve ``amount`` bytes if they fit; returns a release token or None."""
+        if self.db_path is None:
+            if self._in_use + amount > self.budget_bytes:
+                return None
+            self._in_use += amount
+            return amount
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            dead = [
+                reservation_id
+                for reservation_id, pid in conn.execute(
+                    "SELECT reservation_id, pid FROM memory_reservations WHERE host = ?",
+                    (self._host,),
+                )
+                if not _pid_alive(pid)
+            ]
+            conn.executemany(
+                "DELETE FROM memory_reservations WHERE reservation_id = ?",
+                [(reservation_id,) for reservation_id in dead],
+            )
+            (used,) = conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM memory_reservations"
+            ).fetchone()
+            token = None
+            if used + amount <= self.budget_bytes:
+                token = conn.execute(
+                    "INSERT INTO memory_reservations (host, pid, bytes, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (self._host, os.getpid(), amount, time.time()),
+                ).lastrowid
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return token
+
+    def _release(self, token) -> None:
+        if self.db_path is None:
+            self._in_use -= token
+            return
+        self._connection().execute(
+            "DELETE FROM memory_reservations WHERE reservation_id = ?", (token,)
+        )
+
+    @contextmanager
+    def reserve(self, estimate: int):
+        """Block until ``estimate`` bytes are available, hold them for the block."""
+        amount = min(estimate, self.budget_bytes)
+        with self._cond:
+            while True:
+                token = self._try_acquire(amount)
+                if token is not None:
+                    break
+                self._cond.wait(self.poll_seconds if self.db_path is not None else None)
+        try:
+            yield amount
+        finally:
+            with self._cond:
+                self._release(token)
+                self._cond.notify_all()
+
+    def try_reserve(self, estimate: int, wait_seconds: float = 0.0):
+        """Like ``reserve`` but gives up after ``wait_seconds``.
+
+        Returns a release callable, or None when the budget stayed full.
+        """
+        amount = min(estimate, self.budget_bytes)
+        deadline = time.monotonic() + wait_seconds
+        with self._cond:
+            while True:
+                token = self._try_acquire(amount)
+                if token is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(min(self.poll_seconds, remaining))
+
+        def release() -> None:
+            with self._cond:
+                self._release(token)
+                self._cond.notify_all()
+
+        return release
+
+
+class PeakRssSampler:
+    """Sample process RSS in a background thread to capture the peak of a task."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.baseline = current_rss_bytes()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> None:
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
@@ -0,0 +1,486 @@
+"""Merge task execution, in-process or in a pool of warm worker processes."""
+import multiprocessing
+import shutil
+import sys
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+from excelmerger.config_manager import ConfigManager
+from excelmerger.io_utils import (
+    ArrowSidecarWriter,
+    apply_dtype_backend,
+    read_file,
+    resolve_dtype_backend,
+    save_file,
+)
+from excelmerger.logger import setup_logger
+from excelmerger.merger import ExcelMergerCore, concat_aligned
+from excelmerger.progress import MergeCancelled, MergeProgress
+from excelmerger.streaming import stream_merge
+from .downloads import gzip_variant
+from .memory_budget import PeakRssSampler
+from .metrics import MetricsStore
+from .profiling import build_task_profile, capture_profile
+from .result_rows import RESULT_SIDECAR_NAME
+from .task_registry import TaskRegistry
+from .uploads import load_parsed
+
+MERGE_EXECUTORS = {"thread", "process", "queue"}
+
+# Imported once by the fork server so every worker starts with them loaded.
+PRELOAD_MODULES = (
+    "pandas",
+    "openpyxl",
+    "excelmerger.merger",
+    "excelmerger.streaming",
+    "web_app.merge_worker",
+)
+
+logger = setup_logger("ExcelMergerWeb")
+
+_registries: dict[str, TaskRegistry] = {}
+_metrics_stores: dict[str, MetricsStore] = {}
+_registries_lock = threading.Lock()
+
+
+def _registry(db_path: str) -> TaskRegistry:
+    """One registry per database per process (connections are per thread)."""
+    with _registries_lock:
+        registry = _registries.get(db_path)
+        if registry is None:
+            registry = _registries[db_path] = TaskRegistry(Path(db_path))
+        return registry
+
+
+def _metrics(db_path: str) -> MetricsStore:
+    with _registries_lock:
+        store = _metrics_stores.get(db_path)
+        if store is None:
+            store = _metrics_stores[db_path] = MetricsStore(Path(db_path))
+        return store
+
+
+def record_merge_metrics(
+    metrics: MetricsStore,
+    *,
+    status: str,
+    streaming: bool,
+    progress: MergeProgress,
+    bytes_read: int,
+    seconds: float,
+) -> None:
+    """Add one finished merge's timings and volumes to the shared metrics."""
+    engine = "chunked" if streaming else "in_memory"
+    metrics.inc("excelmerger_merges_total", status=status, engine=engine)
+    metrics.observe("excelmerger_merge_seconds", seconds, engine=engine)
+    for phase, phase_seconds in progress.phase_seconds.items():
+        metrics.observe("excelmerger_merge_phase_seconds", phase_seconds, phase=phase)
+    for record in progress.file_records:
+        # Chunked merges read while they merge, so the whole file time counts.
+        parse_seconds = record.get("parse_seconds", record.get("seconds") if streaming else None)
+        if parse_seconds is not None:
+            file_format = Path(record["name"]).suffix.lstrip(".").lower() or "unknown"
+            metrics.observe("excelmerger_parse_seconds", parse_seconds, format=file_format)
+    metrics.inc("excelmerger_rows_read_total", progress.rows_read)
+    metrics.inc("excelmerger_bytes_read_total", bytes_read)
+    metrics.inc("excelmerger_bytes_written_total", progress.bytes_written)
+    metrics.flush()
+
+
+def run_merge_task(
+    task_id: str,
+    saved_paths: list[Path],
+    *,
+    task_db_path: str,
+    job_dir: str,
+    dtype_backend: str,
+    stream_chunk_rows: int,
+    normalize_columns: bool,
+    enable_fuzzy: bool,
+    remove_duplicates: bool,
+    smart_dedup: bool,
+    dedup_keys: list[str],
+    exclude_columns: set[str],
+    output_format: str,
+    streaming: bool = False,
+    profiler: str = "",
+    preview: bool = True,
+    gzip_result: bool = False,
+    notify: Callable[[str], None] | None = None,
+) -> None:
+    """Merge one task's uploads and record progress and outcome in the registry.
+
+    Runs in the web process (thread mode) or in a pool worker (process mode),
+    so everything it needs arrives as picklable arguments. ``notify`` is only
+    available in-process; pool workers rely on SSE listeners re-reading the
+    registry. ``profiler`` ("cprofile" or "pyinstrument") additionally saves
+    a code-level capture of the merge into the job dir. With ``preview`` the
+    merged rows are also saved as an Arrow sidecar for /task/<id>/rows, and
+    with ``gzip_result`` a CSV result also gets the gzip copy that downloads
+    are served from.
+    """
+    registry = _registry(task_db_path)
+    job_dir = Path(job_dir)
+
+    def update(**updates) -> None:
+        registry.update(task_id, **updates)
+        if notify is not None:
+            notify(task_id)
+
+    def cancel_requested() -> bool:
+        metadata = registry.load(task_id) or {}
+        return bool(metadata.get("cancel_requested"))
+
+    sampler = PeakRssSampler()
+    started = time.monotonic()
+    status = "failed"
+    input_sizes = {path.name: path.stat().st_size for path in saved_paths if path.exists()}
+    bytes_read = sum(input_sizes.values())
+    progress = MergeProgress(
+        len(saved_paths),
+        callback=lambda snapshot: update(progress=snapshot),
+        cancel_check=cancel_requested,
+    )
+    capture = None
+
+    def profile() -> dict:
+        return build_task_profile(
+            progress,
+            streaming=streaming,
+            input_sizes=input_sizes,
+            peak_rss_bytes=sampler.peak,
+        )
+
+    try:
+        with sampler, capture_profile(profiler, job_dir, logger) as capture:
+            config_manager = ConfigManager()
+            merger = ExcelMergerCore(config_manager)
+            backend = resolve_dtype_backend(dtype_backend)
+            output_path = job_dir / f"merged.{output_format}"
+            sidecar_path = job_dir / RESULT_SIDECAR_NAME if preview else None
+
+            if streaming:
+                stats = stream_merge(
+                    saved_paths,
+                    output_path,
+                    merger=merger,
+                    spill_dir=job_dir / "_spill",
+                    output_format=output_format,
+                    normalize_columns=normalize_columns,
+                    enable_fuzzy=enable_fuzzy,
+                    exclude_columns=exclude_columns,
+                    dedup_keys=dedup_keys if smart_dedup else None,
+                    remove_duplicates=remove_duplicates,
+                    chunksize=stream_chunk_rows,
+                    dtype_backend=backend,
+                    progress=progress,
+                    sidecar_path=sidecar_path,
+                )
+                has_preview = stats["sidecar"]
+                if sidecar_path and not has_preview:
+                    logger.warning(
+                        "No result preview for task %s: %s", task_id, stats["sidecar_error"]
+                    )
+                logger.info(
+                    "Chunked merge of %s files wrote %s rows x %s cols (%s duplicates removed)",
+                    len(saved_paths),
+                    stats["rows_written"],
+                    stats["columns"],
+                    stats["removed_duplicates"],
+                )
+                if stats["mapping_report"]:
+                    logger.info(
+                        "Column mapping for %s sheets",
+                        len(stats["mapping_report"]),
+                        extra={"fields": {"column_mapping": stats["mapping_report"]}},
+                    )
+            else:
+                has_preview = merge_in_memory(
+                    saved_paths,
+                    output_path,
+                    merger=merger,
+                    dtype_backend=backend,
+                    normalize_columns=normalize_columns,
+                    enable_fuzzy=enable_fuzzy,
+                    remove_duplicates=remove_duplicates,
+                    smart_dedup=smart_dedup,
+                    dedup_keys=dedup_keys,
+                    exclude_columns=exclude_columns,
+                    output_format=output_format,
+                    progress=progress,
+                    sidecar_path=sidecar_path,
+                )
+            progress.finish()
+
+        if gzip_result and output_format == "csv":
+            try:
+                gzip_variant(output_path)
+            except OSError as exc:
+                logger.warning("Failed to gzip result of task %s: %s", task_id, exc)
+
+        status = "completed"
+        update(
+            status="completed",
+            path=output_path.name,
+            completed_at=datetime.now(timezone.utc).isoformat(),
+            error="",
+            peak_rss_bytes=sampler.peak,
+            profile=profile(),
+            profile_capture=capture,
+            preview_path=RESULT_SIDECAR_NAME if has_preview else "",
+        )
+    except MergeCancelled:
+        logger.info("Merge task %s cancelled", task_id)
+        status = "cancelled"
+        clear_job_dir(job_dir)
+        update(
+            status="cancelled",
+            completed_at=datetime.now(timezone.utc).isoformat(),
+            peak_rss_bytes=sampler.peak,
+            profile=profile(),
+        )
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Merge failed: %s\n%s", exc, traceback.format_exc())
+        update(
+            status="failed",
+            error=str(exc),
+            completed_at=datetime.now(timezone.utc).isoformat(),
+            peak_rss_bytes=sampler.peak,
+            profile=profile(),
+            profile_capture=capture,
+        )
+    try:
+        record_merge_metrics(
+            _metrics(task_db_path),
+            status=status,
+            streaming=streaming,
+            progress=progress,
+            bytes_read=bytes_read,
+            seconds=time.monotonic() - started,
+        )
+    except sqlite3.Error as exc:
+        logger.warning("Failed to record merge metrics: %s", exc)
+
+
+def clear_job_dir(job_dir: Path) -> None:
+    """Remove uploads and partial output but keep the dir for the janitor."""
+    for item in Path(job_dir).iterdir():
+        try:
+            if item.is_dir():
+                shutil.rmtree(item)
+            else:
+                item.unlink()
+        except OSError as exc:
+            logger.warning("Failed to remove %s: %s", item, exc)
+
+
+def merge_in_memory(
+    saved_paths: list[Path],
+    output_path: Path,
+    *,
+    merger: ExcelMergerCore,
+    dtype_backend: str | None,
+    normalize_columns: bool,
+    enable_fuzzy: bool,
+    remove_duplicates: bool,
+    smart_dedup: bool,
+    dedup_keys: list[str],
+    exclude_columns: set[str],
+    output_format: str,
+    progress: MergeProgress,
+    sidecar_path: Path | None = None,
+) -> bool:
+    """Merge the files in one frame; returns whether the Arrow sidecar was written."""
+    all_dfs = []
+    mapping_report = {}
+
+    for file_path in saved_paths:
+        progress.start_file(file_path.name)
+        sheets = load_parsed(file_path, dtype_backend)
+        if sheets is None:
+            reader_info = {}
+            parse_started = time.perf_counter()
+            sheets = read_file(
+                str(file_path), dtype_backend=dtype_backend, reader_info=reader_info
+            )
+            progress.annotate_file(
+                parse_seconds=time.perf_counter() - parse_started, reader=reader_info
+            )
+        else:
+            progress.annotate_file(reader={"engine": "parsed-cache"})
+        progress.set_phase("normalize")
+        file_rows = 0
+        for sheet_name, df in sheets.items():
+            progress.checkpoint()
+            progress.record_sheet(sheet_name, len(df), len(df.columns))
+            if df.empty:
+                logger.info(
+                    "Skip empty sheet %s - %s", file_path.name, sheet_name
+                )
+                continue
+
+            if normalize_columns:
+                df = merger.normalize_columns(
+                    df, enable_fuzzy=enable_fuzzy
+                )
+                current_mapping = merger.get_mapping_report()
+                if current_mapping:
+                    mapping_report[
+                        f"{file_path.name}-{sheet_name}"
+                    ] = current_mapping
+
+            filename_without_ext = file_path.stem
+            df.insert(0, "来源文件", filename_without_ext)
+            df.insert(1, "工作表", sheet_name)
+            df = apply_dtype_backend(df, dtype_backend)
+
+            if exclude_columns:
+                cols_to_keep = [
+                    c
+                    for c in df.columns
+                    if str(c) not in exclude_columns
+                    or str(c) in {"来源文件", "工作表"}
+                ]
+                if len(cols_to_keep) < len(df.columns):
+                    df = df[cols_to_keep]
+
+            all_dfs.append(df)
+            file_rows += len(df)
+        progress.file_done(file_rows)
+
+    if not all_dfs:
+        raise ValueError("没有可合并的数据")
+
+    progress.set_phase("concat")
+    merged = concat_aligned(all_dfs)
+    del all_dfs
+    logger.info(
+        "Merged %s files into %s rows x %s cols",
+        len(saved_paths),
+        len(merged),
+        len(merged.columns),
+    )
+
+    original_count = len(merged)
+    if smart_dedup and dedup_keys:
+        progress.set_phase("dedup")
+        merged = merger.deduplicate_smart(
+            merged, key_columns=dedup_keys
+        )
+        removed = original_count - len(merged)
+        if removed > 0:
+            logger.info("Smart dedup removed %s rows", removed)
+    elif remove_duplicates:
+        progress.set_phase("dedup")
+        merged = merger.deduplicate_smart(merged)
+        removed = original_count - len(merged)
+        if removed > 0:
+            logger.info("Full-row dedup removed %s rows", removed)
+
+    progress.set_phase("validate")
+    quality_report = merger.validate_data(merged)
+    logger.info(
+        "Quality report: %s rows x %s cols, %s duplicate rows",
+        quality_report["总行数"],
+        quality_report["总列数"],
+        quality_report["重复行数"],
+        extra={"fields": {"quality_report": quality_report}},
+    )
+    if mapping_report:
+        logger.info(
+            "Column mapping for %s sheets",
+            len(mapping_report),
+            extra={"fields": {"column_mapping": mapping_report}},
+        )
+
+    progress.set_phase("write")
+    save_file(merged, output_path, file_format=output_format)
+    progress.set_bytes_written(output_path.stat().st_size)
+    if sidecar_path is None:
+        return False
+    with ArrowSidecarWriter(sidecar_path) as sidecar:
+        sidecar.write(merged)
+    if not sidecar.complete:
+        logger.warning("No result preview for %s: %s", output_path.parent.name, sidecar.error)
+    return sidecar.complete
+
+
+def resolve_merge_workers(workers: int) -> int:
+    """Number of concurrent merges; 0 means one per CPU."""
+    if workers > 0:
+        return workers
+    return multiprocessing.cpu_count() or 1
+
+
+def _warm_worker() -> None:
+    """Pool initializer: load the heavy modules before the first task arrives."""
+    for name in PRELOAD_MODULES:
+        __import__(name)
+
+
+class MergeProcessPool:
+    """Run merges in worker processes that are recycled after a few tasks.
+
+    Workers fork from a fork server that has pandas and openpyxl loaded, so
+    a fresh worker is cheap to start. Memory fragmented by a large merge goes
+    back to the OS when its worker exits after ``max_tasks_per_child`` tasks.
+    Platforms without fork server fall back to spawn and warm each worker in
+    its initializer.
+    """
+
+    def __init__(self, workers: int, max_tasks_per_child: int = 1):
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(list(PRELOAD_MODULES))
+        else:
+            context = multiprocessing.get_context("spawn")
+        options = {}
+        # Worker recycling needs Python 3.11+; older versions keep workers alive.
+        if self.max_tasks_per_child > 0 and sys.version_info >= (3, 11):
+            options["max_tasks_per_child"] = self.max_tasks_per_child
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_warm_worker,
+            **options,
+        )
+
+    def run(self, func, *args, **kwargs):
+        """Run ``func`` in a worker and wait for its result.
+
+        A worker killed mid-task (for example by the OOM killer) breaks the
+        whole pool; it is replaced for the next task and BrokenProcessPool is
+        raised to the caller.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            executor = self._executor
+        future = executor.submit(func, *args, **kwargs)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
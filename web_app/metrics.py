@@ -0,0 +1,203 @@
+"""Prometheus-style metrics shared by the web and merge worker processes.
+
+Counters and histograms are buffered in memory and added to tables in the
+task registry's SQLite database on ``flush``, so every gunicorn worker, pool
+process and worker daemon on the host contributes to one set of totals.
+Per-process gauges (merge slots) are stored with their pid and only counted
+while their process keeps refreshing them.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+# Gauges of processes that stopped refreshing them for this long are dropped.
+GAUGE_TTL_SECONDS = 300
+
+METRICS = {
+    "excelmerger_http_requests_total": ("counter", "HTTP requests by route, method and status."),
+    "excelmerger_http_request_seconds": ("histogram", "HTTP request latency by route."),
+    "excelmerger_merges_total": ("counter", "Finished merges by outcome and engine."),
+    "excelmerger_merge_seconds": ("histogram", "Wall time of whole merges."),
+    "excelmerger_merge_phase_seconds": ("histogram", "Wall time per merge phase."),
+    "excelmerger_parse_seconds": ("histogram", "Time to read one input file, by format."),
+    "excelmerger_rows_read_total": ("counter", "Rows read from input files."),
+    "excelmerger_bytes_read_total": ("counter", "Bytes of input files merged."),
+    "excelmerger_bytes_written_total": ("counter", "Bytes of merge results written."),
+    "excelmerger_tasks": ("gauge", "Registry entries by status."),
+    "excelmerger_queue_depth": ("gauge", "Merges waiting to start."),
+    "excelmerger_merge_slots": ("gauge", "Merge slots of live processes."),
+    "excelmerger_merge_slots_busy": ("gauge", "Merges running now."),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+CREATE TABLE IF NOT EXISTS metric_gauges (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    value REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (name, labels, pid)
+);
+"""
+
+
+def _labels_key(labels: dict) -> str:
+    return json.dumps(sorted((str(k), str(v)) for k, v in labels.items()), ensure_ascii=False)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _load_labels(raw: str) -> list[tuple[str, str]]:
+    return [tuple(pair) for pair in json.loads(raw)]
+
+
+class MetricsStore:
+    """Buffered counters, histograms and gauges in a shared SQLite file."""
+
+    def __init__(self, db_path: Path, flush_seconds: float = 5.0, timeout: float = 30.0):
+        self.db_path = Path(db_path)
+        self.flush_seconds = flush_seconds
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, str], float] = {}
+        self._gauges: dict[tuple[str, str], float] = {}
+        self._last_flush = time.monotonic()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels) -> None:
+        """Add one histogram observation (stored as cumulative bucket counters)."""
+        with self._lock:
+            for bound in (*buckets, math.inf):
+                # Every bucket gets a row, even at 0, so the series is complete.
+                key = (f"{name}_bucket", _labels_key({**labels, "le": _format_value(bound)}))
+                self._counters[key] = self._counters.get(key, 0.0) + (value <= bound)
+            for suffix, amount in (("_sum", value), ("_count", 1.0)):
+                key = (f"{name}{suffix}", _labels_key(labels))
+                self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Set this process's value of a gauge; it is re-published on every flush."""
+        with self._lock:
+            self._gauges[(name, _labels_key(labels))] = value
+
+    def maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges = dict(self._gauges)
+            self._last_flush = time.monotonic()
+        if not counters and not gauges:
+            return
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO metric_samples (name, labels, value) VALUES (?, ?, ?)"
+                " ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                [(name, labels, value) for (name, labels), value in counters.items()],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO metric_gauges (name, labels, pid, value, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [
+                    (name, labels, os.getpid(), value, now)
+                    for (name, labels), value in gauges.items()
+                ],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # Keep the samples for the next flush instead of losing them.
+            with self._lock:
+                for key, value in counters.items():
+                    self._counters[key] = self._counters.get(key, 0.0) + value
+            raise
+
+    def render(self, gauges: dict[str, list[tuple[dict, float]]] | None = None) -> str:
+        """Prometheus text exposition of stored metrics plus computed ``gauges``."""
+        self.flush()
+        conn = self._connection()
+        samples: dict[str, list[tuple[str, list, float]]] = {}
+        for name, labels, value in conn.execute(
+            "SELECT name, labels, value FROM metric_samples"
+        ):
+            base = name
+            for suffix in ("_bucket", "_sum", "_count"):
+                if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+                    base = name[: -len(suffix)]
+            samples.setdefault(base, []).append((name, _load_labels(labels), value))
+        cutoff = time.time() - GAUGE_TTL_SECONDS
+        for name, labels, value in conn.execute(
+            "SELECT name, labels, SUM(value) FROM metric_gauges"
+            " WHERE updated_at >= ? GROUP BY name, labels",
+            (cutoff,),
+        ):
+            samples.setdefault(name, []).append((name, _load_labels(labels), value))
+        for name, series in (gauges or {}).items():
+            for labels, value in series:
+                samples.setdefault(name, []).append(
+                    (name, sorted((str(k), str(v)) for k, v in labels.items()), value)
+                )
+
+        def order(sample):
+            sample_name, labels, _ = sample
+            le = dict(labels).get("le")
+            rest = [pair for pair in labels if pair[0] != "le"]
+            return (rest, sample_name, float(le) if le is not None else 0.0)
+
+        lines = []
+        for base in sorted(samples):
+            kind, help_text = METRICS.get(base, ("untyped", ""))
+            lines.append(f"# HELP {base} {help_text}")
+            lines.append(f"# TYPE {base} {kind}")
+            for sample_name, labels, value in sorted(samples[base], key=order):
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,97 @@
+"""Per-task performance profiles for excel_webdatamerger merges."""
+import cProfile
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+
+from excelmerger.progress import MergeProgress
+
+# Optional code-level capture (MERGER_MERGE_PROFILER) and the file it writes
+# into the job dir, served by /task/<task_id>/profile/capture.
+PROFILER_CAPTURE_FILES = {"cprofile": "profile.pstats", "pyinstrument": "profile.html"}
+
+_PENDING_KEYS = {"started", "cpu_started", "rows_before"}
+
+
+def _rounded(value):
+    return round(value, 4) if isinstance(value, float) else value
+
+
+def build_task_profile(
+    progress: MergeProgress,
+    *,
+    streaming: bool,
+    input_sizes: dict[str, int],
+    peak_rss_bytes: int,
+) -> dict:
+    """Structured timings and volumes of one merge, stored in its metadata.
+
+    CPU times are those of the merging thread, so work pandas or pyarrow
+    hands to helper threads is not included.
+    """
+    wall, cpu = progress.elapsed()
+    files = []
+    for record in progress.file_records:
+        entry = {k: _rounded(v) for k, v in record.items() if k not in _PENDING_KEYS}
+        entry["size_bytes"] = input_sizes.get(record["name"])
+        files.append(entry)
+    return {
+        "engine": "chunked" if streaming else "in_memory",
+        "wall_seconds": _rounded(wall),
+        "cpu_seconds": _rounded(cpu),
+        "peak_rss_bytes": peak_rss_bytes,
+        "bytes_read": sum(input_sizes.values()),
+        "bytes_written": progress.bytes_written,
+        "rows_read": progress.rows_read,
+        "phases": {
+            phase: {
+                "wall_seconds": _rounded(seconds),
+                "cpu_seconds": _rounded(progress.phase_cpu_seconds.get(phase, 0.0)),
+            }
+            for phase, seconds in progress.phase_seconds.items()
+        },
+        "files": files,
+    }
+
+
+@contextmanager
+def capture_profile(kind: str, job_dir: Path, logger: logging.Logger):
+    """Run the block under cProfile or pyinstrument and save the capture.
+
+    Yields the capture file name, or None when capture is off or the
+    profiler is unavailable (pyinstrument not installed, or another
+    profiler already active in this process).
+    """
+    filename = PROFILER_CAPTURE_FILES.get(kind or "")
+    if filename is None:
+        yield None
+        return
+    target = Path(job_dir) / filename
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrument is not installed; merge profiling skipped")
+            yield None
+            return
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield filename
+        finally:
+            profiler.stop()
+            target.write_text(profiler.output_html(), encoding="utf-8")
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as exc:
+        logger.warning("cProfile unavailable for this merge: %s", exc)
+        yield None
+        return
+    try:
+        yield filename
+    finally:
+        profiler.disable()
+        profiler.dump_stats(str(target))
@@ -0,0 +1,40 @@
+"""Merge result memoization for excel_webdatamerger.
+
+Identical merges (same input names and bytes, same options, same column
+mapping rules) produce the same output, so a completed task's file can be
+hard-linked into a new task instead of merging again. Cached results live in
+ordinary task directories and expire with them under the cleanup policy.
+"""
+import hashlib
+import json
+
+# Bump when merge output changes for the same inputs and options.
+RESULT_CACHE_VERSION = 1
+
+
+def merge_result_key(
+    inputs: list[dict],
+    merge_options: dict,
+    *,
+    mapping_version: str,
+    dtype_backend: str,
+    streaming: bool,
+) -> str:
+    """Hash everything that determines a merge's output.
+
+    Input names are part of the key because the output records each row's
+    source file, and their order decides the row order.
+    """
+    options = dict(merge_options)
+    options["exclude_columns"] = sorted(options.get("exclude_columns", ()))
+    payload = {
+        "version": RESULT_CACHE_VERSION,
+        "inputs": [[item["name"], item["sha256"]] for item in inputs],
+        "options": options,
+        # Mapping rules only matter when column names are normalised.
+        "mapping_version": mapping_version if options.get("normalize_columns") else None,
+        "dtype_backend": dtype_backend,
+        "streaming": streaming,
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
@@ -0,0 +1,79 @@
+"""Paged reads of merged results from their Arrow sidecar file.
+
+Merges save the merged frame as an uncompressed Arrow IPC (Feather v2) file
+next to ``merged.<fmt>``. Pages are sliced from a memory map, so a request
+only touches the record batches it returns, however large the result is.
+"""
+import base64
+import datetime as dt
+import decimal
+import math
+from pathlib import Path
+
+RESULT_SIDECAR_NAME = "merged.arrow"
+MAX_PAGE_ROWS = 1000
+
+
+def _json_value(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (list, dict)):
+        return str(value)
+    return value
+
+
+def read_result_rows(
+    path: Path,
+    offset: int = 0,
+    limit: int = 100,
+    columns: list[str] | None = None,
+) -> dict:
+    """One page of rows as ``{"columns", "rows", "total_rows"}``.
+
+    Raises KeyError for unknown column names.
+    """
+    import pyarrow as pa
+
+    limit = max(0, min(limit, MAX_PAGE_ROWS))
+    offset = max(0, offset)
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        names = reader.schema.names
+        if columns:
+            unknown = [name for name in columns if name not in names]
+            if unknown:
+                raise KeyError(", ".join(unknown))
+        else:
+            columns = names
+        total_rows = 0
+        batches = []
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            start, total_rows = total_rows, total_rows + batch.num_rows
+            # Only batches overlapping the page are sliced and converted.
+            if total_rows <= offset or start >= offset + limit:
+                continue
+            local_start = max(offset - start, 0)
+            local_end = min(offset + limit - start, batch.num_rows)
+            batches.append(batch.slice(local_start, local_end - local_start).select(columns))
+        if batches:
+            page = pa.Table.from_batches(batches)
+            values = [column.to_pylist() for column in page.columns]
+            rows = [[_json_value(value) for value in row] for row in zip(*values)]
+        else:
+            rows = []
+    return {
+        "columns": list(columns),
+        "rows": rows,
+        "total_rows": total_rows,
+        "offset": offset,
+        "limit": limit,
+    }
@@ -0,0 +1,178 @@
+"""Fair merge scheduling across users for excel_webdatamerger."""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable
+
+
+def estimate_retry_after(queued: int, workers: int, avg_seconds: float = 30.0) -> int:
+    """Seconds until a slot is likely free: one average task per wave of workers."""
+    waves = math.ceil((queued + 1) / max(workers, 1))
+    return min(max(int(avg_seconds * waves), 5), 600)
+
+
+class QueueFull(Exception):
+    """Raised when a task cannot be queued; ``retry_after`` is in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """Round-robin merge queue with per-user quotas and bounded depth.
+
+    Each user (a login session or API client) has its own FIFO. Worker
+    threads take one task from each user in turn, skipping users already
+    running ``per_user_limit`` tasks, so one user's batch cannot starve
+    others. ``submit`` raises QueueFull when the whole queue holds
+    ``max_queue`` tasks or the user already has ``max_user_queue`` waiting.
+    Quotas apply per web worker process.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int,
+        per_user_limit: int,
+        max_queue: int,
+        max_user_queue: int,
+        logger,
+    ):
+        self.workers = workers
+        self.per_user_limit = max(per_user_limit, 1)
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+        self._logger = logger
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self._running: dict[str, int] = {}
+        self._queued = 0
+        self._avg_seconds = 30.0
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"merge-slot-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def _retry_after(self) -> int:
+        return estimate_retry_after(self._queued, self.workers, self._avg_seconds)
+
+    def _check_locked(self, user: str) -> None:
+        if self._queued >= self.max_queue:
+            raise QueueFull("服务器繁忙，合并队列已满", self._retry_after())
+        pending = self._queues.get(user)
+        if pending is not None and len(pending) >= self.max_user_queue:
+            raise QueueFull("您排队中的任务过多，请等待完成后再提交", self._retry_after())
+
+    def check(self, user: str) -> None:
+        """Raise QueueFull if ``submit`` for ``user`` would be rejected now."""
+        with self._cond:
+            self._check_locked(user)
+
+    def submit(self, user: str, task_id: str, func: Callable, *args, **kwargs) -> int:
+        """Queue ``func(*args, **kwargs)`` for ``user``; return its queue position."""
+        with self._cond:
+            self._check_locked(user)
+            pending = self._queues.get(user)
+            if pending is None:
+                pending = self._queues[user] = deque()
+            pending.append((task_id, func, args, kwargs))
+            self._queued += 1
+            self._cond.notify()
+            return self._position_locked(task_id)
+
+    def discard(self, task_id: str) -> bool:
+        """Drop a task that has not started yet."""
+        with self._cond:
+            for user, pending in self._queues.items():
+                for entry in pending:
+                    if entry[0] == task_id:
+                        pending.remove(entry)
+                        self._queued -= 1
+                        if not pending:
+                            del self._queues[user]
+                        return True
+        return False
+
+    def position(self, task_id: str) -> int | None:
+        """1-based estimate of when the task will start, None if not queued here."""
+        with self._cond:
+            return self._position_locked(task_id)
+
+    def _position_locked(self, task_id: str) -> int | None:
+        users = list(self._queues)
+        for order, user in enumerate(users):
+            index = next(
+                (i for i, entry in enumerate(self._queues[user]) if entry[0] == task_id),
+                None,
+            )
+            if index is None:
+                continue
+            # Tasks ahead: earlier tasks of this user plus, per round, one task
+            # of every other user (users earlier in the rotation go first).
+            ahead = index
+            for other_order, other in enumerate(users):
+                if other == user:
+                    continue
+                rounds = index + 1 if other_order < order else index
+                ahead += min(len(self._queues[other]), rounds)
+            return ahead + 1
+        return None
+
+    def queued(self) -> int:
+        with self._cond:
+            return self._queued
+
+    def _next_locked(self):
+        for user in list(self._queues):
+            if self._running.get(user, 0) >= self.per_user_limit:
+                continue
+            pending = self._queues.pop(user)
+            entry = pending.popleft()
+            if pending:
+                # Rotate: the user goes to the back of the line.
+                self._queues[user] = pending
+            self._queued -= 1
+            self._running[user] = self._running.get(user, 0) + 1
+            return user, entry
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                picked = None
+                while not self._stopped:
+                    picked = self._next_locked()
+                    if picked is not None:
+                        break
+                    self._cond.wait()
+                if picked is None:
+                    return
+            user, (task_id, func, args, kwargs) = picked
+            started = time.monotonic()
+            try:
+                func(*args, **kwargs)
+            except Exception as exc:  # noqa: BLE001
+                self._logger.error("Scheduled task %s failed: %s", task_id, exc)
+            finally:
+                with self._cond:
+                    self._running[user] -= 1
+                    if not self._running[user]:
+                        del self._running[user]
+                    elapsed = time.monotonic() - started
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+                    self._cond.notify_all()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
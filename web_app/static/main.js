@@ -33,7 +33,12 @@
       fileDeleteBtn: document.getElementById('files-delete-selected'),
       fileClearBtn: document.getElementById('files-clear'),
       statusBox: document.getElementById('status'),
+      mergeProgress: document.getElementById('merge-progress'),
+      mergeCancelBtn: document.getElementById('merge-cancel'),
       downloadBox: document.getElementById('download'),
+      resultPreview: document.getElementById('result-preview'),
+      resultPreviewMeta: document.getElementById('result-preview-meta'),
+      resultViewport: document.getElementById('result-viewport'),
       mergeBtn: document.getElementById('merge-btn'),
       resetBtn: document.getElementById('reset-btn'),
       inspectBtn: document.getElementById('inspect-btn'),
@@ -71,6 +76,20 @@
     let pendingDownload = null;
     let confirmedDownloadFilename = '';
     let mergePollTimer = null;
+    let mergeEventSource = null;
+    let lastLoggedStatus = '';
+    let mergeCancelUrl = '';
+    // /inspect 保留的上传会话；文件列表未变时合并直接引用，无需重新上传
+    let uploadSession = null;
+    const filesSignature = (files) => files.map(f => f.id).join(',');
+    // 大文件走分块上传：分块并行发送，断线后从服务器已收到的分块继续
+    const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+    const CHUNK_PARALLEL = 3;
+    const CHUNK_RETRIES = 4;
+    // 未完成的分块上传会话（按文件列表签名），再次提交时续传
+    const chunkedUploads = new Map();
+    const needsChunkedUpload = (files) =>
+      files.reduce((sum, f) => sum + f.file.size, 0) >= CHUNKED_UPLOAD_THRESHOLD;
 
     const log = (msg) => {
       console.log(msg);
@@ -98,11 +117,111 @@
       return document.querySelector('input[name="output_format"]:checked')?.value || 'xlsx';
     };
 
+    const sleep = (ms) => new Promise(resolve => window.setTimeout(resolve, ms));
+
+    const fetchJson = async (url, options = {}) => {
+      const res = await fetch(url, { credentials: 'same-origin', ...options });
+      const data = await res.json().catch(() => ({}));
+      return { res, data };
+    };
+
+    const postJson = (url, body) => fetchJson(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body),
+    });
+
+    const chunkDigest = async (blob) => {
+      // crypto.subtle 仅在 HTTPS / localhost 下可用；否则只靠服务器校验整文件
+      if (!window.crypto?.subtle) return null;
+      const hash = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+      return [...new Uint8Array(hash)].map(b => b.toString(16).padStart(2, '0')).join('');
+    };
+
+    const putChunk = async (uploadId, index, file, offset, chunkSize) => {
+      const blob = file.slice(offset, offset + chunkSize);
+      const digest = await chunkDigest(blob);
+      const headers = digest ? { 'X-Chunk-SHA256': digest } : {};
+      let lastError = null;
+      for (let attempt = 0; attempt < CHUNK_RETRIES; attempt += 1) {
+        if (attempt) await sleep(1000 * 2 ** (attempt - 1));
+        try {
+          const res = await fetch(`/upload/${uploadId}/files/${index}?offset=${offset}`, {
+            method: 'PUT',
+            body: blob,
+            headers,
+            credentials: 'same-origin',
+          });
+          if (res.ok) return;
+          lastError = new Error(`分块上传失败（HTTP ${res.status}）`);
+          if (res.status === 410) break;
+        } catch (err) {
+          lastError = err;
+        }
+      }
+      throw lastError;
+    };
+
+    const uploadInChunks = async (files) => {
+      const signature = filesSignature(files);
+      let state = null;
+      const knownId = chunkedUploads.get(signature);
+      if (knownId) {
+        const { res, data } = await fetchJson(`/upload/${knownId}`);
+        if (res.ok && data.ok) {
+          state = data;
+          log('继续未完成的分块上传');
+        } else {
+          chunkedUploads.delete(signature);
+        }
+      }
+      if (!state) {
+        const { res, data } = await postJson('/upload', {
+          files: files.map(f => ({ name: f.name, size: f.file.size })),
+        });
+        if (!res.ok || !data.ok) throw new Error(data.error || `HTTP ${res.status}`);
+        state = data;
+        chunkedUploads.set(signature, state.upload_id);
+      }
+      const uploadId = state.upload_id;
+      if (state.status !== 'uploaded') {
+        const pending = [];
+        state.files.forEach((info, index) => {
+          const received = new Set(info.received);
+          for (let chunk = 0; chunk < info.chunks; chunk += 1) {
+            if (!received.has(chunk)) pending.push({ index, offset: chunk * state.chunk_size });
+          }
+        });
+        const total = pending.length;
+        let done = 0;
+        const sendPending = async () => {
+          while (pending.length) {
+            const { index, offset } = pending.shift();
+            await putChunk(uploadId, index, files[index].file, offset, state.chunk_size);
+            done += 1;
+            setStatus(`正在分块上传文件... ${done}/${total}`);
+          }
+        };
+        await Promise.all(
+          Array.from({ length: Math.min(CHUNK_PARALLEL, total) }, sendPending),
+        );
+        const { res, data } = await postJson(`/upload/${uploadId}/finalize`, {});
+        if (!res.ok || !data.ok) throw new Error(data.error || `HTTP ${res.status}`);
+      }
+      chunkedUploads.delete(signature);
+      log(`分块上传完成：${uploadId}`);
+      return uploadId;
+    };
+
     const stopMergePolling = () => {
       if (mergePollTimer) {
         window.clearTimeout(mergePollTimer);
         mergePollTimer = null;
       }
+      if (mergeEventSource) {
+        mergeEventSource.close();
+        mergeEventSource = null;
+      }
     };
 
     const closeDownloadModal = () => {
@@ -190,41 +309,221 @@
       refs.downloadBox.style.display = 'block';
     };
 
+    // 合并结果分页预览：表格只渲染可视区域的行，按页从 /task/<id>/rows 取数
+    const RESULT_ROW_HEIGHT = 28;
+    const RESULT_PAGE_ROWS = 200;
+    const RESULT_CACHED_PAGES = 20;
+    let resultPreview = null;
+    let resultRenderQueued = false;
+
+    const hideResultPreview = () => {
+      resultPreview = null;
+      refs.resultPreview?.classList.add('hidden');
+    };
+
+    const loadResultPage = (state, pageIndex) => {
+      if (state.pages.has(pageIndex)) return;
+      state.pages.set(pageIndex, null);
+      if (state.pages.size > RESULT_CACHED_PAGES) {
+        state.pages.delete(state.pages.keys().next().value);
+      }
+      const offset = pageIndex * RESULT_PAGE_ROWS;
+      fetchJson(`${state.url}?offset=${offset}&limit=${RESULT_PAGE_ROWS}`)
+        .then(({ res, data }) => {
+          if (!res.ok || !data.ok) throw new Error(data.error || `HTTP ${res.status}`);
+          state.pages.set(pageIndex, data.rows || []);
+          if (resultPreview === state) scheduleResultRender();
+        })
+        .catch((err) => {
+          state.pages.delete(pageIndex);
+          log(`结果预览加载失败：${err.message}`);
+        });
+    };
+
+    const resultRow = (state, index) => {
+      const page = state.pages.get(Math.floor(index / RESULT_PAGE_ROWS));
+      return page ? page[index % RESULT_PAGE_ROWS] : undefined;
+    };
+
+    const spacerRow = (height, colspan) => {
+      const tr = document.createElement('tr');
+      const td = document.createElement('td');
+      td.colSpan = colspan;
+      td.style.height = `${height}px`;
+      td.style.padding = '0';
+      td.style.border = '0';
+      tr.appendChild(td);
+      return tr;
+    };
+
+    const renderResultRows = () => {
+      resultRenderQueued = false;
+      const state = resultPreview;
+      const viewport = refs.resultViewport;
+      if (!state || !viewport) return;
+      const overscan = 10;
+      const first = Math.max(0, Math.floor(viewport.scrollTop / RESULT_ROW_HEIGHT) - overscan);
+      const visible = Math.ceil(viewport.clientHeight / RESULT_ROW_HEIGHT) + overscan * 2;
+      const last = Math.min(state.total, first + visible);
+      for (let page = Math.floor(first / RESULT_PAGE_ROWS); page * RESULT_PAGE_ROWS < last; page += 1) {
+        loadResultPage(state, page);
+      }
+
+      const colspan = state.columns.length + 1;
+      const tbody = document.createElement('tbody');
+      tbody.appendChild(spacerRow(first * RESULT_ROW_HEIGHT, colspan));
+      for (let i = first; i < last; i += 1) {
+        const tr = document.createElement('tr');
+        tr.style.height = `${RESULT_ROW_HEIGHT}px`;
+        const row = resultRow(state, i);
+        const cells = [i + 1, ...(row || state.columns.map(() => '…'))];
+        cells.forEach((value) => {
+          const td = document.createElement('td');
+          td.textContent = value === null || value === undefined ? '' : String(value);
+          tr.appendChild(td);
+        });
+        tbody.appendChild(tr);
+      }
+      tbody.appendChild(spacerRow((state.total - last) * RESULT_ROW_HEIGHT, colspan));
+      state.table.replaceChild(tbody, state.table.tBodies[0]);
+    };
+
+    const scheduleResultRender = () => {
+      if (resultRenderQueued) return;
+      resultRenderQueued = true;
+      window.requestAnimationFrame(renderResultRows);
+    };
+
+    const showResultPreview = async (rowsUrl) => {
+      hideResultPreview();
+      if (!rowsUrl || !refs.resultPreview || !refs.resultViewport) return;
+      const { res, data } = await fetchJson(`${rowsUrl}?offset=0&limit=${RESULT_PAGE_ROWS}`);
+      if (!res.ok || !data.ok) return;
+      const table = document.createElement('table');
+      table.className = 'result-table';
+      const head = document.createElement('thead');
+      const headRow = document.createElement('tr');
+      ['#', ...data.columns].forEach((name) => {
+        const th = document.createElement('th');
+        th.textContent = name;
+        headRow.appendChild(th);
+      });
+      head.appendChild(headRow);
+      table.appendChild(head);
+      table.appendChild(document.createElement('tbody'));
+      resultPreview = {
+        url: rowsUrl,
+        total: data.total_rows,
+        columns: data.columns,
+        pages: new Map([[0, data.rows]]),
+        table,
+      };
+      clearNode(refs.resultViewport);
+      refs.resultViewport.appendChild(table);
+      refs.resultViewport.scrollTop = 0;
+      refs.resultPreviewMeta.textContent =
+        `结果预览：共 ${Number(data.total_rows).toLocaleString()} 行，${data.columns.length} 列（滚动加载）`;
+      refs.resultPreview.classList.remove('hidden');
+      renderResultRows();
+    };
+
+    refs.resultViewport?.addEventListener('scroll', scheduleResultRender);
+
+    const formatProgress = (p) => {
+      const parts = [`${p.phase_label || p.phase} ${Math.round(p.percent || 0)}%`];
+      if (p.files_total) parts.push(`文件 ${p.files_done}/${p.files_total}`);
+      if (p.rows_read) parts.push(`已读 ${Number(p.rows_read).toLocaleString()} 行`);
+      if (p.bytes_written) parts.push(`已写 ${(p.bytes_written / 1024 / 1024).toFixed(1)} MB`);
+      if (p.eta_seconds !== null && p.eta_seconds !== undefined) {
+        parts.push(`预计剩余 ${Math.ceil(p.eta_seconds)} 秒`);
+      }
+      return parts.join('，');
+    };
+
+    const setCancelUrl = (url, pending) => {
+      mergeCancelUrl = url || '';
+      if (!refs.mergeCancelBtn) return;
+      refs.mergeCancelBtn.classList.toggle('hidden', !mergeCancelUrl);
+      refs.mergeCancelBtn.disabled = Boolean(pending);
+      refs.mergeCancelBtn.textContent = pending ? '正在取消...' : '取消合并';
+    };
+
+    const setMergeProgress = (percent) => {
+      if (!refs.mergeProgress) return;
+      if (percent === null) {
+        refs.mergeProgress.classList.add('hidden');
+        return;
+      }
+      refs.mergeProgress.classList.remove('hidden');
+      refs.mergeProgress.value = percent;
+    };
+
+    // 返回 true 表示任务仍在进行，需要继续等待
+    const handleMergeStatus = (data, fallbackFormat) => {
+      const statusChanged = data.status !== lastLoggedStatus;
+      lastLoggedStatus = data.status || '';
+      if (!data.ok) {
+        setMergeProgress(null);
+        setCancelUrl('');
+        refs.mergeBtn.disabled = false;
+        setStatus(data.error || '任务查询失败', true);
+        log(`合并失败：${data.error || '状态查询失败'}`);
+        return false;
+      }
+
+      if (data.status === 'queued' || data.status === 'running') {
+        if (data.progress) {
+          setStatus(`后台正在合并：${formatProgress(data.progress)}`);
+          setMergeProgress(data.progress.percent || 0);
+        } else {
+          const queued = data.queue_position ? `任务排队中，前面约 ${data.queue_position - 1} 个任务...` : '任务排队中，请稍候...';
+          setStatus(data.status === 'queued' ? queued : '后台正在合并，请稍候...');
+          setMergeProgress(0);
+        }
+        setCancelUrl(data.cancel_url, data.cancel_requested);
+        if (statusChanged) log(`任务处理中：${data.status}`);
+        return true;
+      }
+
+      setMergeProgress(null);
+      setCancelUrl('');
+      refs.mergeBtn.disabled = false;
+      if (data.status === 'cancelled') {
+        setStatus('合并已取消。');
+        log('合并任务已取消');
+        return false;
+      }
+      if (data.status === 'completed') {
+        setStatus('合并成功，点击下载结果。');
+        renderDownloadButton(
+          data.download_url,
+          data.suggested_filename,
+          data.format || fallbackFormat,
+        );
+        showResultPreview(data.rows_url).catch(() => log('结果预览加载失败'));
+        log('合并完成，可下载结果');
+        return false;
+      }
+
+      setStatus(data.error || '合并失败', true);
+      log(`合并失败：${data.error || data.status || '未知错误'}`);
+      return false;
+    };
+
     const pollMergeStatus = async (taskId, statusUrl, fallbackFormat) => {
       stopMergePolling();
       try {
         const res = await fetch(statusUrl, { credentials: 'same-origin' });
         const data = await res.json();
-        if (!res.ok || !data.ok) {
-          refs.mergeBtn.disabled = false;
-          setStatus(data.error || `任务查询失败（${res.status}）`, true);
-          log(`合并失败：${data.error || `状态查询 HTTP ${res.status}`}`);
-          return;
+        if (!res.ok && data.ok !== false) {
+          data.ok = false;
+          data.error = `状态查询 HTTP ${res.status}`;
         }
-
-        if (data.status === 'queued' || data.status === 'running') {
-          setStatus('后台正在合并，请稍候...');
-          log(`任务处理中：${data.status}`);
+        if (handleMergeStatus(data, fallbackFormat)) {
           mergePollTimer = window.setTimeout(() => {
             pollMergeStatus(taskId, statusUrl, fallbackFormat);
           }, 2000);
-          return;
-        }
-
-        refs.mergeBtn.disabled = false;
-        if (data.status === 'completed') {
-          setStatus('合并成功，点击下载结果。');
-          renderDownloadButton(
-            data.download_url,
-            data.suggested_filename,
-            data.format || fallbackFormat,
-          );
-          log('合并完成，可下载结果');
-          return;
         }
-
-        setStatus(data.error || '合并失败', true);
-        log(`合并失败：${data.error || data.status || '未知错误'}`);
       } catch (err) {
         refs.mergeBtn.disabled = false;
         setStatus('合并状态查询失败，请稍后重试。', true);
@@ -232,6 +531,35 @@
       }
     };
 
+    // 优先使用 SSE 推送任务状态，不支持或连接断开时退回轮询
+    const watchMergeStatus = (taskId, statusUrl, eventsUrl, fallbackFormat) => {
+      stopMergePolling();
+      if (!eventsUrl || typeof window.EventSource !== 'function') {
+        pollMergeStatus(taskId, statusUrl, fallbackFormat);
+        return;
+      }
+      const source = new EventSource(eventsUrl, { withCredentials: true });
+      mergeEventSource = source;
+      source.addEventListener('status', (event) => {
+        let data;
+        try {
+          data = JSON.parse(event.data);
+        } catch (err) {
+          return;
+        }
+        if (!handleMergeStatus(data, fallbackFormat)) {
+          stopMergePolling();
+        }
+      });
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && mergeEventSource === source) {
+          stopMergePolling();
+          log('状态推送连接断开，改为轮询');
+          pollMergeStatus(taskId, statusUrl, fallbackFormat);
+        }
+      };
+    };
+
     const renderFiles = () => {
       if (!filesState.length) {
         refs.fileList.textContent = '尚未选择文件。';
@@ -311,7 +639,11 @@
         wrapper.style.marginBottom = '12px';
 
         const title = document.createElement('strong');
-        title.textContent = `${p.file} / ${p.sheet}`;
+        const count = typeof p.row_count === 'number'
+          ? `（${p.sampled ? '约 ' : ''}${p.row_count} 行${p.sampled ? '，抽样分析' : ''}`
+            + `${p.sample_truncated ? `，样本仅来自前 ${p.sample_rows_scanned} 行` : ''}）`
+          : '';
+        title.textContent = `${p.file} / ${p.sheet}${count}`;
 
         const pre = document.createElement('pre');
         pre.style.margin = '6px 0';
@@ -370,12 +702,35 @@
       log('已清空文件列表');
     });
 
+    refs.mergeCancelBtn?.addEventListener('click', async () => {
+      if (!mergeCancelUrl) return;
+      setCancelUrl(mergeCancelUrl, true);
+      log('请求取消合并');
+      try {
+        const res = await fetch(mergeCancelUrl, { method: 'POST', credentials: 'same-origin' });
+        const data = await res.json();
+        if (res.status === 409 || res.status === 404) {
+          setCancelUrl('');
+          log(data.error || '任务已结束，无法取消');
+          return;
+        }
+        if (data.status === 'cancelled') {
+          stopMergePolling();
+          handleMergeStatus(data, getOutputFormat());
+        }
+      } catch (err) {
+        setCancelUrl(mergeCancelUrl);
+        log('取消请求失败，请重试');
+      }
+    });
+
     refs.resetBtn?.addEventListener('click', () => {
       refs.fileInput.value = '';
       filesState = [];
       renderFiles();
       refs.statusBox.style.display = 'none';
       refs.downloadBox.style.display = 'none';
+      hideResultPreview();
       closeDownloadModal();
       stopMergePolling();
       document.getElementById('dedup_keys').value = '';
@@ -383,9 +738,44 @@
       refs.columnsBox.innerHTML = '请先点击“分析文件”加载列信息。';
       refs.previewArea.innerHTML = '预览区：点击“分析文件”后展示前 5 行。';
       lastPreviews = [];
+      uploadSession = null;
       log('已重置表单');
     });
 
+    const showInspection = (data) => {
+      renderColumns(data.columns || []);
+      renderPreview(data.previews || []);
+      showPreviewForSelection();
+      (data.errors || []).forEach(e => log(`分析失败：${e.file}：${e.error}`));
+      const pending = data.pending || [];
+      if (pending.length) {
+        setStatus(`部分文件仍在分析中（${pending.length} 个），结果稍后自动显示。`);
+        return;
+      }
+      setStatus('分析完成，可选择要删除的列后开始合并。');
+      log('分析完成');
+    };
+
+    // 超出分析时限的文件在后台继续解析，轮询上传会话直到全部完成
+    const pollPendingInspection = async (uploadId) => {
+      while (uploadSession && uploadSession.id === uploadId) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        try {
+          const res = await fetch(`/upload/${encodeURIComponent(uploadId)}`, { credentials: 'same-origin' });
+          if (!res.ok) return;
+          const data = await res.json();
+          if (!uploadSession || uploadSession.id !== uploadId) return;
+          if (!(data.pending || []).length) {
+            showInspection(data);
+            return;
+          }
+        } catch (err) {
+          console.error(err);
+          return;
+        }
+      }
+    };
+
     refs.inspectBtn.addEventListener('click', async () => {
       const files = [...filesState];
       if (!files.length) {
@@ -397,13 +787,18 @@
       log(`开始分析，文件数：${files.length}`);
 
       const formData = new FormData();
-      files.forEach(f => formData.append('files', f.file, f.name));
       if (document.getElementById('normalize').checked) formData.append('normalize_columns', 'on');
       if (document.getElementById('fuzzy').checked) formData.append('enable_fuzzy', 'on');
 
       setStatus('正在分析文件...');
 
       try {
+        if (needsChunkedUpload(files)) {
+          formData.append('upload_id', await uploadInChunks(files));
+          setStatus('正在分析文件...');
+        } else {
+          files.forEach(f => formData.append('files', f.file, f.name));
+        }
         const res = await fetch('/inspect', { method: 'POST', body: formData, credentials: 'same-origin' });
         if (!res.ok) {
           setStatus(`分析失败（${res.status}）`, true);
@@ -418,14 +813,21 @@
           log(`分析失败：${data.error || '未知错误'}`);
           return;
         }
-        renderColumns(data.columns || []);
-        renderPreview(data.previews || []);
-        showPreviewForSelection();
-        setStatus('分析完成，可选择要删除的列后开始合并。');
+        uploadSession = data.upload_id
+          ? { id: data.upload_id, signature: filesSignature(files) }
+          : null;
         refs.downloadBox.style.display = 'none';
-        log('分析完成');
+        showInspection(data);
+        if ((data.pending || []).length && data.upload_id) {
+          pollPendingInspection(data.upload_id);
+        }
       } catch (err) {
-        setStatus('分析请求失败，请稍后重试。', true);
+        setStatus(
+          needsChunkedUpload(files)
+            ? '上传中断，再次点击将从断点继续。'
+            : '分析请求失败，请稍后重试。',
+          true,
+        );
         refs.previewArea.textContent = '预览失败';
         console.error(err);
         log('分析请求失败');
@@ -546,32 +948,67 @@
         return;
       }
 
-      const formData = new FormData();
-      files.forEach(f => formData.append('files', f.file, f.name));
-      if (document.getElementById('normalize').checked) formData.append('normalize_columns', 'on');
-      if (document.getElementById('fuzzy').checked) formData.append('enable_fuzzy', 'on');
-      if (document.getElementById('dedup').checked) formData.append('remove_duplicates', 'on');
-      if (document.getElementById('smart').checked) formData.append('smart_dedup', 'on');
-      const dedupKeys = document.getElementById('dedup_keys').value.trim();
-      formData.append('dedup_keys', dedupKeys);
-      const excluded = collectExcludedColumns();
-      formData.append('exclude_columns', excluded.join(','));
       const fmt = getOutputFormat();
-      formData.append('output_format', fmt);
+      const buildMergeForm = (useSession) => {
+        const formData = new FormData();
+        if (useSession) {
+          formData.append('upload_id', uploadSession.id);
+        } else {
+          files.forEach(f => formData.append('files', f.file, f.name));
+        }
+        if (document.getElementById('normalize').checked) formData.append('normalize_columns', 'on');
+        if (document.getElementById('fuzzy').checked) formData.append('enable_fuzzy', 'on');
+        if (document.getElementById('dedup').checked) formData.append('remove_duplicates', 'on');
+        if (document.getElementById('smart').checked) formData.append('smart_dedup', 'on');
+        const dedupKeys = document.getElementById('dedup_keys').value.trim();
+        formData.append('dedup_keys', dedupKeys);
+        const excluded = collectExcludedColumns();
+        formData.append('exclude_columns', excluded.join(','));
+        formData.append('output_format', fmt);
+        return formData;
+      };
+      let useSession = Boolean(uploadSession && uploadSession.signature === filesSignature(files));
+      const uploadChunkedSession = async () => {
+        uploadSession = { id: await uploadInChunks(files), signature: filesSignature(files) };
+        return true;
+      };
 
       setStatus('正在合并，请稍候...');
       refs.downloadBox.style.display = 'none';
+      hideResultPreview();
       stopMergePolling();
+      lastLoggedStatus = '';
       refs.mergeBtn.disabled = true;
       log('开始合并');
 
       try {
-        const res = await fetch('/merge', {
+        if (!useSession && needsChunkedUpload(files)) {
+          useSession = await uploadChunkedSession();
+        }
+        let res = await fetch('/merge', {
           method: 'POST',
-          body: formData,
+          body: buildMergeForm(useSession),
           credentials: 'same-origin'
         });
+        if (useSession && res.status === 410) {
+          // 上传会话已过期，改为重新上传文件
+          uploadSession = null;
+          log('上传会话已过期，重新上传文件');
+          const chunked = needsChunkedUpload(files) && await uploadChunkedSession();
+          res = await fetch('/merge', {
+            method: 'POST',
+            body: buildMergeForm(chunked),
+            credentials: 'same-origin'
+          });
+        }
         const data = await res.json();
+        if (res.status === 429) {
+          refs.mergeBtn.disabled = false;
+          const wait = data.retry_after || res.headers.get('Retry-After');
+          setStatus(`${data.error || '合并队列已满'}${wait ? `，请约 ${wait} 秒后重试` : ''}`, true);
+          log('合并队列已满，任务未提交');
+          return;
+        }
         if (!data.ok) {
           refs.mergeBtn.disabled = false;
           setStatus(data.error || '合并失败', true);
@@ -580,11 +1017,16 @@
         }
         setStatus('文件已上传，后台正在合并...');
         log(`合并任务已创建：${data.task_id}`);
-        pollMergeStatus(data.task_id, data.status_url, fmt);
+        watchMergeStatus(data.task_id, data.status_url, data.events_url, fmt);
       } catch (err) {
         refs.mergeBtn.disabled = false;
-        setStatus('请求失败，请稍后重试。', true);
-        log('合并请求失败');
+        setStatus(
+          needsChunkedUpload(files)
+            ? '上传中断，再次点击将从断点继续。'
+            : '请求失败，请稍后重试。',
+          true,
+        );
+        log(`合并请求失败：${err.message || err}`);
       }
     });
 
@@ -0,0 +1,157 @@
+"""Disk usage limits for UPLOAD_ROOT in excel_webdatamerger.
+
+Job directories normally expire by age (CLEANUP_MINUTES). When they use
+more than the quota, or the filesystem's free space drops below the
+watermark, finished results are evicted least recently downloaded first.
+Requests that would write more than can be reclaimed are refused before
+any of their bytes reach the disk.
+"""
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable
+
+
+def directory_bytes(path: Path, seen: set | None = None) -> int:
+    """Bytes used by the files under ``path``.
+
+    Hard-linked files (cached results shared between tasks) are counted once
+    per ``seen`` set.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += directory_bytes(Path(entry.path), seen)
+                continue
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        key = (stat.st_dev, stat.st_ino)
+        if key in seen:
+            continue
+        seen.add(key)
+        total += stat.st_size
+    return total
+
+
+class StorageManager:
+    """Keep UPLOAD_ROOT under ``quota_bytes`` and above ``min_free_bytes`` free.
+
+    ``candidates()`` yields ``(task_id, last_used)`` for job dirs that may be
+    evicted (finished tasks, not uploads in progress); ``evict(task_id)``
+    removes one. Per-directory sizes are rescanned at most every
+    ``scan_seconds``; evictions and reservations adjust the cached total in
+    between. A limit of 0 disables that check.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        quota_bytes: int,
+        min_free_bytes: int,
+        candidates: Callable[[], Iterable[tuple[str, float]]],
+        evict: Callable[[str], None],
+        logger,
+        scan_seconds: float = 10.0,
+    ):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self._candidates = candidates
+        self._evict = evict
+        self._logger = logger
+        self.scan_seconds = scan_seconds
+        self._lock = threading.Lock()
+        self._sizes: dict[str, int] = {}
+        # Bytes admitted since the last scan, counted until a rescan sees them.
+        self._reserved = 0
+        self._scanned_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.quota_bytes > 0 or self.min_free_bytes > 0
+
+    def _scan(self) -> dict[str, int]:
+        if time.monotonic() - self._scanned_at >= self.scan_seconds:
+            seen: set = set()
+            self._sizes = {
+                job_dir.name: directory_bytes(job_dir, seen)
+                for job_dir in self.root.iterdir()
+                if job_dir.is_dir()
+            }
+            self._reserved = 0
+            self._scanned_at = time.monotonic()
+        return self._sizes
+
+    def usage(self) -> dict:
+        """Bytes per job dir, their total and the filesystem's free bytes."""
+        with self._lock:
+            sizes = dict(self._scan())
+        return {
+            "jobs": sizes,
+            "used_bytes": sum(sizes.values()),
+            "free_bytes": shutil.disk_usage(self.root).free,
+        }
+
+    def _shortfall(self, used: int, free: int, incoming: int) -> int:
+        shortfall = 0
+        if self.quota_bytes > 0:
+            shortfall = used + incoming - self.quota_bytes
+        if self.min_free_bytes > 0:
+            shortfall = max(shortfall, self.min_free_bytes - (free - incoming))
+        return shortfall
+
+    def ensure_space(self, incoming: int = 0) -> bool:
+        """Evict finished results until ``incoming`` more bytes fit.
+
+        Returns False when the limits cannot be met even after evicting
+        every candidate; nothing is evicted in that case.
+        """
+        if not self.enabled:
+            return True
+        with self._lock:
+            sizes = self._scan()
+            used = sum(sizes.values()) + self._reserved
+            free = shutil.disk_usage(self.root).free
+            shortfall = self._shortfall(used, free, incoming)
+            if shortfall <= 0:
+                self._reserved += incoming
+                return True
+
+            victims = []
+            reclaimed = 0
+            for task_id, _ in sorted(self._candidates(), key=lambda item: item[1]):
+                if reclaimed >= shortfall:
+                    break
+                size = sizes.get(task_id, 0)
+                if size:
+                    victims.append(task_id)
+                    reclaimed += size
+            if reclaimed < shortfall:
+                self._logger.warning(
+                    "Storage: %d bytes needed, only %d reclaimable", shortfall, reclaimed
+                )
+                return False
+
+            for task_id in victims:
+                try:
+                    self._evict(task_id)
+                except Exception as exc:  # noqa: BLE001
+                    self._logger.warning("Storage: failed to evict %s: %s", task_id, exc)
+                    continue
+                sizes.pop(task_id, None)
+            self._logger.info(
+                "Storage: evicted %d results (%d bytes) for %d incoming bytes",
+                len(victims), reclaimed, incoming,
+            )
+            self._reserved += incoming
+            return True
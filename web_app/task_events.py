@@ -0,0 +1,38 @@
+"""In-process notification of task state changes for streaming endpoints."""
+import threading
+
+
+class TaskEventBus:
+    """Wake SSE listeners as soon as a task's metadata changes.
+
+    Every ``publish`` bumps a per-task version counter. Listeners block in
+    ``wait`` until the version moves past the one they last saw. Only updates
+    made in this process are signalled. Listeners also re-read the registry
+    when ``wait`` times out, which picks up changes made by other workers.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._versions: dict[str, int] = {}
+
+    def publish(self, task_id: str) -> None:
+        with self._cond:
+            self._versions[task_id] = self._versions.get(task_id, 0) + 1
+            self._cond.notify_all()
+
+    def version(self, task_id: str) -> int:
+        with self._cond:
+            return self._versions.get(task_id, 0)
+
+    def wait(self, task_id: str, seen_version: int, timeout: float) -> int:
+        """Block until the task version differs from ``seen_version`` or timeout."""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._versions.get(task_id, 0) != seen_version,
+                timeout=timeout,
+            )
+            return self._versions.get(task_id, 0)
+
+    def forget(self, task_id: str) -> None:
+        with self._cond:
+            self._versions.pop(task_id, None)
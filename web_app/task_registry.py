@@ -0,0 +1,420 @@
+"""SQLite-backed task registry for excel_webdatamerger."""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT '',
+    created_at REAL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks (created_at);
+"""
+
+# Columns added after the first release, created on open if missing.
+MIGRATIONS = {
+    "lease_expires": "ALTER TABLE tasks ADD COLUMN lease_expires REAL",
+    "result_key": "ALTER TABLE tasks ADD COLUMN result_key TEXT",
+}
+MIGRATION_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_tasks_result_key ON tasks (result_key)",
+)
+
+
+def _timestamp(value) -> float | None:
+    """Convert an ISO-8601 string to epoch seconds (naive values are UTC)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class TaskRegistry:
+    """Task metadata stored in one local SQLite database in WAL mode.
+
+    Every gunicorn worker, thread and merge process opens its own connection,
+    so reads and read-modify-write updates stay consistent across processes
+    without a process-local lock.
+    """
+
+    def __init__(self, db_path: Path, timeout: float = 30.0):
+        self.db_path = Path(db_path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(statement)
+        for statement in MIGRATION_INDEXES:
+            conn.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Connections must not cross a fork into merge worker processes.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.db_path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row_values(task_id: str, payload: dict) -> tuple:
+        return (
+            task_id,
+            payload.get("status", ""),
+            _timestamp(payload.get("created_at")),
+            datetime.now(timezone.utc).timestamp(),
+            json.dumps(payload, ensure_ascii=False),
+            payload.get("lease_expires") if payload.get("status") == "running" else None,
+            # Only completed results can be served from the cache.
+            payload.get("result_key") if payload.get("status") == "completed" else None,
+        )
+
+    def load(self, task_id: str) -> dict | None:
+        row = self._connection().execute(
+            "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        loaded = json.loads(row[0])
+        return loaded if isinstance(loaded, dict) else None
+
+    def save(self, task_id: str, payload: dict) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO tasks"
+            " (task_id, status, created_at, updated_at, data, lease_expires, result_key)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            self._row_values(task_id, payload),
+        )
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, task_id: str, metadata: dict) -> None:
+        values = TaskRegistry._row_values(task_id, metadata)
+        conn.execute(
+            "UPDATE tasks SET status = ?, created_at = ?, updated_at = ?, data = ?,"
+            " lease_expires = ?, result_key = ? WHERE task_id = ?",
+            values[1:] + (task_id,),
+        )
+
+    def _apply(self, task_id: str, updates: dict, check=None) -> dict | None:
+        def mutate(metadata: dict) -> bool:
+            if check is not None and not check(metadata):
+                return False
+            metadata.update(updates)
+            return True
+
+        return self.modify(task_id, mutate)
+
+    def update(self, task_id: str, **updates) -> dict | None:
+        """Merge ``updates`` into a task atomically; None if the task is unknown."""
+        return self._apply(task_id, updates)
+
+    def transition(self, task_id: str, from_statuses: set[str], **updates) -> dict | None:
+        """Apply ``updates`` only while the task's status is in ``from_statuses``.
+
+        Returns the updated metadata, or None if the task is unknown or in
+        another state, so racing writers cannot undo each other's moves.
+        """
+        return self._apply(
+            task_id, updates, lambda metadata: metadata.get("status") in from_statuses
+        )
+
+    def modify(self, task_id: str, mutate) -> dict | None:
+        """Run ``mutate(metadata)`` on a task inside one write transaction.
+
+        ``mutate`` edits the dict in place and may return False to abort
+        without writing. Returns the metadata, or None if the task is
+        unknown or the change was aborted.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            metadata = json.loads(row[0])
+            if mutate(metadata) is False:
+                return None
+            self._write(conn, task_id, metadata)
+        return metadata
+
+    def renew_lease(self, task_id: str, owner: str, lease_seconds: float) -> bool:
+        """Extend a running task's lease; False if ``owner`` no longer holds it."""
+        renewed = self._apply(
+            task_id,
+            {"lease_expires": time.time() + lease_seconds},
+            lambda metadata: metadata.get("status") == "running"
+            and metadata.get("lease_owner") == owner,
+        )
+        return renewed is not None
+
+    def release_claim(self, task_id: str, owner: str) -> dict | None:
+        """Hand a claimed job back to the queue before ``owner`` started it.
+
+        The attempt is not counted. A cancel requested in the meantime
+        finishes the task as cancelled instead. Returns None if ``owner``
+        no longer holds the lease.
+        """
+
+        def mutate(metadata: dict) -> bool:
+            if metadata.get("status") != "running" or metadata.get("lease_owner") != owner:
+                return False
+            metadata.pop("lease_owner", None)
+            metadata.pop("lease_expires", None)
+            metadata.pop("started_at", None)
+            metadata["attempts"] = max(metadata.get("attempts", 1) - 1, 0)
+            if metadata.pop("cancel_requested", False):
+                metadata.update(
+                    status="cancelled",
+                    completed_at=datetime.now(timezone.utc).isoformat(),
+                )
+            else:
+                metadata["status"] = "queued"
+            return True
+
+        return self.modify(task_id, mutate)
+
+    def claim(self, owner: str, lease_seconds: float) -> tuple[str, dict] | None:
+        """Lease the next queued job to ``owner`` and mark it running.
+
+        Only tasks carrying a ``job`` spec (queued for worker daemons) are
+        claimed. Among those, the oldest task of the client with the fewest
+        running tasks goes first, so one client's batch does not starve others.
+        """
+        with self._transaction() as conn:
+            running: dict[str, int] = {}
+            for (data,) in conn.execute(
+                "SELECT data FROM tasks WHERE status = 'running'"
+            ):
+                client = json.loads(data).get("client", "")
+                running[client] = running.get(client, 0) + 1
+            best = None
+            for task_id, data in conn.execute(
+                "SELECT task_id, data FROM tasks WHERE status = 'queued'"
+                " ORDER BY created_at"
+            ):
+                metadata = json.loads(data)
+                if not metadata.get("job"):
+                    continue
+                load = running.get(metadata.get("client", ""), 0)
+                if best is None or load < best[0]:
+                    best = (load, task_id, metadata)
+                    if load == 0:
+                        break
+            if best is None:
+                return None
+            _, task_id, metadata = best
+            metadata.update(
+                status="running",
+                started_at=datetime.now(timezone.utc).isoformat(),
+                lease_owner=owner,
+                lease_expires=time.time() + lease_seconds,
+                attempts=metadata.get("attempts", 0) + 1,
+            )
+            self._write(conn, task_id, metadata)
+        return task_id, metadata
+
+    def recover_expired(self, max_attempts: int) -> tuple[list[str], list[str]]:
+        """Handle running tasks whose lease ran out because their runner died.
+
+        Worker jobs are re-queued until they have been tried ``max_attempts``
+        times; other tasks cannot be resumed and are marked failed. Tasks the
+        user asked to cancel are marked cancelled instead of being re-run.
+        Returns (requeued, finished) task ids; finished covers failed and
+        cancelled tasks.
+        """
+        requeued, finished = [], []
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT task_id, data FROM tasks"
+                " WHERE status = 'running' AND lease_expires < ?",
+                (now,),
+            ).fetchall()
+            for task_id, data in rows:
+                metadata = json.loads(data)
+                metadata.pop("lease_owner", None)
+                metadata.pop("lease_expires", None)
+                if metadata.pop("cancel_requested", None):
+                    metadata.update(
+                        status="cancelled",
+                        completed_at=datetime.now(timezone.utc).isoformat(),
+                    )
+                    finished.append(task_id)
+                elif metadata.get("job") and metadata.get("attempts", 0) < max_attempts:
+                    metadata.update(status="queued", progress=None)
+                    requeued.append(task_id)
+                else:
+                    metadata.update(
+                        status="failed",
+                        error="任务执行中断（服务重启或进程退出），请重新提交",
+                        completed_at=datetime.now(timezone.utc).isoformat(),
+                    )
+                    finished.append(task_id)
+                self._write(conn, task_id, metadata)
+        return requeued, finished
+
+    def completed_with_result(self, result_key: str) -> list[tuple[str, dict]]:
+        """Completed tasks whose output matches ``result_key``, newest first."""
+        rows = self._connection().execute(
+            "SELECT task_id, data FROM tasks WHERE result_key = ?"
+            " ORDER BY created_at DESC",
+            (result_key,),
+        ).fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    def queue_position(self, task_id: str) -> int | None:
+        """1-based estimate of when a queued job will be claimed.
+
+        Replays the order ``claim`` picks jobs in: each step takes the oldest
+        job of the client with the fewest running tasks, and that client then
+        has one more running. Like ``FairScheduler.position``, running tasks
+        are assumed not to finish in the meantime.
+        """
+        conn = self._connection()
+        running: dict[str, int] = {}
+        for (data,) in conn.execute("SELECT data FROM tasks WHERE status = 'running'"):
+            client = json.loads(data).get("client", "")
+            running[client] = running.get(client, 0) + 1
+        pending: dict[str, list[tuple[int, str]]] = {}
+        order = conn.execute(
+            "SELECT task_id, data FROM tasks WHERE status = 'queued' ORDER BY created_at"
+        )
+        for index, (queued_id, data) in enumerate(order):
+            metadata = json.loads(data)
+            if metadata.get("job"):
+                client = metadata.get("client", "")
+                pending.setdefault(client, []).append((index, queued_id))
+        # Per client, jobs are taken oldest first; across clients, the lowest
+        # running count wins and ties go to the oldest waiting job.
+        heads = [(running.get(client, 0), jobs[0][0], client) for client, jobs in pending.items()]
+        heapq.heapify(heads)
+        taken = {client: 0 for client in pending}
+        position = 0
+        while heads:
+            load, _, client = heapq.heappop(heads)
+            jobs = pending[client]
+            _, queued_id = jobs[taken[client]]
+            position += 1
+            if queued_id == task_id:
+                return position
+            taken[client] += 1
+            if taken[client] < len(jobs):
+                heapq.heappush(heads, (load + 1, jobs[taken[client]][0], client))
+        return None
+
+    def count_queued(self, client: str | None = None) -> int:
+        if client is None:
+            (count,) = self._connection().execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = 'queued'"
+            ).fetchone()
+            return count
+        rows = self._connection().execute(
+            "SELECT data FROM tasks WHERE status = 'queued'"
+        ).fetchall()
+        return sum(1 for (data,) in rows if json.loads(data).get("client") == client)
+
+    def delete(self, task_id: str) -> None:
+        self._connection().execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+    def created_times(self) -> dict[str, datetime]:
+        """Map task_id -> created_at for every task with a creation time."""
+        rows = self._connection().execute(
+            "SELECT task_id, created_at FROM tasks WHERE created_at IS NOT NULL"
+        ).fetchall()
+        return {
+            task_id: datetime.fromtimestamp(created, tz=timezone.utc)
+            for task_id, created in rows
+        }
+
+    def created_before(self, cutoff: datetime) -> list[str]:
+        rows = self._connection().execute(
+            "SELECT task_id FROM tasks WHERE created_at < ?", (cutoff.timestamp(),)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def ids_with_status(self, *statuses: str) -> list[str]:
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self._connection().execute(
+            f"SELECT task_id FROM tasks WHERE status IN ({placeholders})"
+            " ORDER BY created_at",
+            statuses,
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_by_status(self) -> dict[str, int]:
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+        ).fetchall()
+        return dict(rows)
+
+
+class LeaseHeartbeat:
+    """Renew a running task's lease from a background thread.
+
+    A runner that dies stops renewing, so its lease expires and
+    ``TaskRegistry.recover_expired`` can re-queue or fail the task.
+    """
+
+    def __init__(self, registry: TaskRegistry, task_id: str, owner: str, lease_seconds: float):
+        self.registry = registry
+        self.task_id = task_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                renewed = self.registry.renew_lease(
+                    self.task_id, self.owner, self.lease_seconds
+                )
+            except sqlite3.Error:
+                continue
+            if not renewed:
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
@@ -0,0 +1,168 @@
+"""Streaming upload storage for excel_webdatamerger."""
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+
+import pandas as pd
+
+# Large buffers keep syscall overhead low when copying multi-MB workbooks.
+COPY_BUFFER_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """An upload exceeded the per-file or per-request size limit."""
+
+
+class SavedUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+class UploadWriter:
+    """Copy uploads to disk while enforcing size limits and hashing in one pass.
+
+    Limits are checked as bytes arrive, so an oversized file stops being
+    written at the limit instead of being stored in full and rejected after
+    a ``stat()``. The SHA-256 digest comes from the same pass and needs no
+    second read of the file.
+    """
+
+    def __init__(self, max_file_bytes: int, max_total_bytes: int):
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.total_bytes = 0
+
+    def save(self, stream: BinaryIO, dest: Path) -> SavedUpload:
+        dest = Path(dest)
+        partial = partial_path(dest)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(partial, "wb") as out:
+                while True:
+                    chunk = stream.read(COPY_BUFFER_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_file_bytes:
+                        raise UploadTooLarge(f"文件 {dest.name} 超出单个文件大小限制")
+                    if self.total_bytes + size > self.max_total_bytes:
+                        raise UploadTooLarge("上传文件总大小超出限制")
+                    digest.update(chunk)
+                    out.write(chunk)
+            partial.replace(dest)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        self.total_bytes += size
+        return SavedUpload(dest, size, digest.hexdigest())
+
+
+class ChunkRejected(Exception):
+    """A chunk did not match its declared length or checksum."""
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return max(-(-size // chunk_size), 1)
+
+
+def partial_path(dest: Path) -> Path:
+    dest = Path(dest)
+    return dest.with_name(dest.name + ".part")
+
+
+def allocate_partial(dest: Path, size: int) -> Path:
+    """Create the ``.part`` file chunks are written into (sparse where supported)."""
+    partial = partial_path(dest)
+    with open(partial, "wb") as out:
+        out.truncate(size)
+    return partial
+
+
+def write_chunk(
+    stream: BinaryIO,
+    partial: Path,
+    offset: int,
+    length: int,
+    expected_sha256: str | None = None,
+) -> None:
+    """Copy exactly ``length`` bytes from ``stream`` to ``partial`` at ``offset``.
+
+    Each call opens its own handle, so chunks of one file can be written by
+    parallel requests. A short, long or corrupted chunk raises ChunkRejected;
+    its bytes may be on disk but the chunk is not recorded as received.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    with open(partial, "r+b") as out:
+        out.seek(offset)
+        while True:
+            data = stream.read(min(COPY_BUFFER_BYTES, length - written + 1))
+            if not data:
+                break
+            written += len(data)
+            if written > length:
+                raise ChunkRejected("分块数据超出声明长度")
+            digest.update(data)
+            out.write(data)
+    if written != length:
+        raise ChunkRejected(f"分块数据不完整：收到 {written} / {length} 字节")
+    if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+        raise ChunkRejected("分块校验和不匹配")
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for data in iter(lambda: fh.read(COPY_BUFFER_BYTES), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def link_or_copy(src: Path, dest: Path) -> None:
+    """Hard-link ``src`` to ``dest`` (same filesystem), copying as a fallback."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+# Parsed sheets from /inspect, reused by merges of the same upload session.
+PARSED_CACHE_DIR = ".parsed"
+
+
+def parsed_cache_path(file_path: Path, dtype_backend: str | None) -> Path:
+    file_path = Path(file_path)
+    return file_path.parent / PARSED_CACHE_DIR / f"{file_path.name}.{dtype_backend or 'numpy'}.pkl"
+
+
+def store_parsed(file_path: Path, dtype_backend: str | None, sheets: dict) -> None:
+    """Cache parsed sheets next to the upload.
+
+    The pickle is written under a temporary name and renamed, so a merge
+    reading the cache concurrently never loads a partial file.
+    """
+    path = parsed_cache_path(file_path, dtype_backend)
+    path.parent.mkdir(exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(sheets, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def load_parsed(file_path: Path, dtype_backend: str | None) -> dict | None:
+    """Sheets parsed earlier for this exact file, or None."""
+    path = parsed_cache_path(file_path, dtype_backend)
+    try:
+        return pd.read_pickle(path)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
@@ -0,0 +1,162 @@
+"""Standalone merge worker for excel_webdatamerger.
+
+Run ``python -m web_app.worker`` next to the web app with
+``MERGER_MERGE_EXECUTOR=queue``. The web app then only records queued jobs in
+the SQLite task registry, and any number of worker processes on the same
+host claim them under a lease they renew while merging. Tasks whose worker
+died are re-queued once their lease expires, so restarting gunicorn or a
+worker never strands a task in ``queued`` or ``running``.
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+from pathlib import Path
+
+from excelmerger.logger import setup_logger
+from .config import WebConfig
+from .memory_budget import (
+    STREAMING_TASK_BYTES,
+    MemoryGovernor,
+    resolve_memory_budget,
+)
+from .merge_worker import resolve_merge_workers, run_merge_task
+from .metrics import MetricsStore
+from .task_registry import LeaseHeartbeat, TaskRegistry
+
+
+def task_db_path(config=WebConfig) -> Path:
+    return config.TASK_DB_PATH or config.UPLOAD_ROOT / "tasks.sqlite3"
+
+
+class MergeWorker:
+    """Claim queued jobs from the registry and run them on ``concurrency`` slots."""
+
+    def __init__(self, registry: TaskRegistry, *, concurrency: int, config=WebConfig, logger=None):
+        self.registry = registry
+        self.concurrency = max(concurrency, 1)
+        self.config = config
+        self.logger = logger or setup_logger("ExcelMergerWeb")
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.governor = MemoryGovernor(
+            resolve_memory_budget(config.MEMORY_BUDGET_MB), db_path=registry.db_path
+        )
+        self.metrics = MetricsStore(registry.db_path)
+        self.metrics.set_gauge("excelmerger_merge_slots", self.concurrency, executor="queue")
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Stop claiming new jobs; running jobs finish first."""
+        self._stop.set()
+
+    def recover(self) -> None:
+        requeued, finished = self.registry.recover_expired(self.config.TASK_MAX_ATTEMPTS)
+        if requeued or finished:
+            self.logger.warning(
+                "Recovered stale tasks: requeued %s, failed or cancelled %s", requeued, finished
+            )
+
+    def run_one(self) -> bool:
+        """Claim and run a single job.
+
+        False when the queue is empty or the claimed job was handed back
+        because the memory budget could not admit it.
+        """
+        lease_seconds = self.config.TASK_LEASE_SECONDS
+        claimed = self.registry.claim(f"{self.owner}:{threading.get_ident()}", lease_seconds)
+        if claimed is None:
+            return False
+        task_id, metadata = claimed
+        job = dict(metadata["job"])
+        saved_paths = [Path(path) for path in job.pop("saved_paths")]
+        job["exclude_columns"] = set(job.get("exclude_columns", []))
+        reservation = (
+            STREAMING_TASK_BYTES
+            if job.get("streaming")
+            else metadata.get("memory_estimate_bytes", 0)
+        )
+        # The task is leased and shown as running, so it may only wait
+        # briefly for memory; otherwise it goes back to the queue for a slot
+        # (here or in another worker) that can admit it.
+        release = self.governor.try_reserve(reservation, self.config.WORKER_POLL_SECONDS)
+        if release is None:
+            self.registry.release_claim(task_id, metadata["lease_owner"])
+            self.logger.info(
+                "Worker %s returned task %s: memory budget full", self.owner, task_id
+            )
+            return False
+        self.logger.info("Worker %s claimed task %s", self.owner, task_id)
+        with LeaseHeartbeat(self.registry, task_id, metadata["lease_owner"], lease_seconds):
+            try:
+                run_merge_task(
+                    task_id,
+                    saved_paths,
+                    task_db_path=str(self.registry.db_path),
+                    job_dir=str(self.config.UPLOAD_ROOT / task_id),
+                    dtype_backend=self.config.DTYPE_BACKEND,
+                    stream_chunk_rows=self.config.STREAM_CHUNK_ROWS,
+                    profiler=self.config.MERGE_PROFILER,
+                    preview=self.config.RESULT_PREVIEW_ENABLED,
+                    gzip_result=(
+                        self.config.DOWNLOAD_GZIP and not self.config.DOWNLOAD_ACCEL_PREFIX
+                    ),
+                    **job,
+                )
+            finally:
+                release()
+        return True
+
+    def _slot(self) -> None:
+        while not self._stop.is_set():
+            try:
+                busy = self.run_one()
+            except Exception as exc:  # noqa: BLE001
+                self.logger.error("Worker slot error: %s", exc)
+                busy = False
+            if not busy:
+                self._stop.wait(self.config.WORKER_POLL_SECONDS)
+
+    def serve(self) -> None:
+        self.recover()
+        slots = [
+            threading.Thread(target=self._slot, name=f"merge-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for slot in slots:
+            slot.start()
+        # Leases of crashed workers expire; check for them periodically. The
+        # same tick keeps this worker's slot gauge fresh.
+        self.metrics.flush()
+        while not self._stop.wait(self.config.TASK_LEASE_SECONDS):
+            self.recover()
+            self.metrics.flush()
+        for slot in slots:
+            slot.join()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="excel_webdatamerger merge worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=resolve_merge_workers(WebConfig.MERGE_WORKERS),
+        help="merges to run at once (default: MERGER_MERGE_WORKERS)",
+    )
+    args = parser.parse_args(argv)
+
+    registry = TaskRegistry(task_db_path())
+    worker = MergeWorker(registry, concurrency=args.concurrency)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: worker.stop())
+    worker.logger.info(
+        "Merge worker %s started with %s slots on %s",
+        worker.owner,
+        worker.concurrency,
+        registry.db_path,
+    )
+    worker.serve()
+
+
+if __name__ == "__main__":
+    main()